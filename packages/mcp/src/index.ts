@@ -40,6 +40,25 @@ async function supabaseRequest<T>(
   return response.json() as Promise<T>;
 }
 
+// Supabase RPC helper (POST /rest/v1/rpc/<fn>)
+async function supabaseRpc<T>(fn: string, params: Record<string, unknown>): Promise<T> {
+  const response = await fetch(`${SUPABASE_URL}/rest/v1/rpc/${fn}`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "apikey": SUPABASE_ANON_KEY || API_KEY || "",
+    },
+    body: JSON.stringify(params)
+  });
+
+  if (!response.ok) {
+    const errorData = await response.text();
+    throw new Error(`Supabase RPC failed: ${response.status} - ${errorData}`);
+  }
+
+  return response.json() as Promise<T>;
+}
+
 // API client helper
 async function apiRequest<T>(endpoint: string, params?: Record<string, string | number | undefined>): Promise<T> {
   // Ensure base URL ends with / and endpoint doesn't start with /
@@ -442,6 +461,17 @@ server.tool(
 // MANUAL CONTENT TOOLS
 // =============================================================================
 
+// A search_manual result (manuals edge function / search_manual_hybrid)
+interface ManualSearchResult {
+  path: string;
+  title: string;
+  tokens: number;
+  score: number;
+  matched?: string[];
+  snippet: string;
+  content: string;
+}
+
 // Helper to find manual by vehicle
 async function findManualId(year: number, make: string, model: string): Promise<string | null> {
   try {
@@ -542,15 +572,35 @@ server.tool(
       }
 
       const limit = max_sections || 5;
-      // Use full-text search with PostgREST
-      const searchQuery = `manual_id=eq.${manualId}&or=(section_title.ilike.%25${encodeURIComponent(query)}%25,content_plain.ilike.%25${encodeURIComponent(query)}%25,keywords.cs.{${encodeURIComponent(query.toLowerCase())}})&select=section_path,section_title,content_markdown,token_count&limit=${limit}`;
 
-      const sections = await supabaseRequest<Array<{
-        section_path: string;
-        section_title: string;
-        content_markdown: string;
-        token_count: number;
-      }>>("manual_sections", searchQuery);
+      // Hybrid search (manuals edge function): full-text and semantic matches
+      // fused by search_manual_hybrid, so "pull a trailer" finds towing. If
+      // the edge function is unavailable, call the RPC directly without a
+      // query embedding (full-text only, still GIN-indexed).
+      let sections: ManualSearchResult[];
+      try {
+        const response = await apiRequest<{ data: { results: ManualSearchResult[] } }>(
+          `/manuals/${manualId}/search`, { q: query, limit }
+        );
+        sections = response.data.results;
+      } catch {
+        const rows = await supabaseRpc<Array<{
+          section_path: string;
+          section_title: string;
+          content_markdown: string;
+          token_count: number;
+          snippet: string;
+          score: number;
+        }>>("search_manual_hybrid", { p_manual_id: manualId, p_query: query, p_limit: limit });
+        sections = rows.map(s => ({
+          path: s.section_path,
+          title: s.section_title,
+          tokens: s.token_count,
+          score: s.score,
+          snippet: s.snippet,
+          content: s.content_markdown
+        }));
+      }
 
       if (sections.length === 0) {
         return {
@@ -573,12 +623,7 @@ server.tool(
             vehicle: `${year} ${make} ${model}`,
             query,
             sections_found: sections.length,
-            results: sections.map(s => ({
-              path: s.section_path,
-              title: s.section_title,
-              tokens: s.token_count,
-              content: s.content_markdown
-            }))
+            results: sections
           }, null, 2)
         }]
       };
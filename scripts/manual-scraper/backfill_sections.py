@@ -5,10 +5,12 @@ This parses the existing markdown content and creates section entries.
 """
 
 import os
-import re
 from dotenv import load_dotenv
 from supabase import create_client
 
+from bulk_writer import format_batch_stats, upsert_rows
+from sections import parse_sections, section_row
+
 load_dotenv()
 
 supabase = create_client(
@@ -17,36 +19,6 @@ supabase = create_client(
 )
 
 
-def parse_sections(markdown: str) -> list:
-    """Parse markdown into sections based on headers"""
-    sections = []
-    current_title = "Introduction"
-    current_content = []
-
-    for line in markdown.split("\n"):
-        header_match = re.match(r"^(#{1,3})\s+(.+)$", line)
-        if header_match:
-            # Save previous section
-            if current_content:
-                sections.append({
-                    "title": current_title,
-                    "content": "\n".join(current_content).strip(),
-                })
-            current_title = header_match.group(2).strip()
-            current_content = []
-        else:
-            current_content.append(line)
-
-    # Save last section
-    if current_content:
-        sections.append({
-            "title": current_title,
-            "content": "\n".join(current_content).strip(),
-        })
-
-    return sections
-
-
 def backfill_manual_sections(manual_id: str, content_markdown: str) -> int:
     """Parse content and insert sections for a manual"""
     # Delete any existing sections first
@@ -55,28 +27,16 @@ def backfill_manual_sections(manual_id: str, content_markdown: str) -> int:
     # Parse sections
     sections = parse_sections(content_markdown)
 
-    # Insert new sections
-    inserted = 0
-    for i, section in enumerate(sections):
-        if not section["content"].strip():
-            continue
-        try:
-            supabase.table("manual_sections").insert({
-                "manual_id": manual_id,
-                "section_path": str(i + 1),
-                "section_title": section["title"],
-                "sort_order": i,
-                "depth": 1,
-                "content_markdown": section["content"],
-                "content_plain": section["content"],
-                "char_count": len(section["content"]),
-                "word_count": len(section["content"].split()),
-            }).execute()
-            inserted += 1
-        except Exception as e:
-            print(f"  Error inserting section {i}: {str(e)[:100]}")
-
-    return inserted
+    # Insert new sections in payload-sized batches
+    rows = [section_row(manual_id, section) for section in sections]
+    try:
+        stats = upsert_rows(supabase, "manual_sections", rows, on_conflict="manual_id,section_path")
+    except Exception as e:
+        print(f"  Error inserting sections: {str(e)[:100]}")
+        return 0
+    print(f"  Wrote {format_batch_stats(stats)}")
+
+    return len(rows)
 
 
 def main():
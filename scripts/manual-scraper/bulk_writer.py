@@ -0,0 +1,170 @@
+"""
+Bulk writer for extracted manual content.
+
+Sections are upserted in batches sized by JSON payload bytes rather than a
+fixed row count, so a manual with a few huge sections and one with
+thousands of tiny ones both stay under PostgREST's request limits while
+using as few round-trips as possible. Upserts are keyed on
+(manual_id, section_path), so a retried batch overwrites rather than
+duplicates rows.
+
+save_extraction() writes the sections to manual_sections_staging under a
+fresh stage id, then calls the finalize_manual_extraction RPC, which checks
+the lease and, in a single transaction, moves the staged sections into
+manual_sections, saves manual_content, prunes stale sections and marks the
+manual 'extracted'. A worker that lost its lease never touches the live
+sections.
+save_duplicates() fans a finished extraction out to the other manuals that
+share the same PDF.
+"""
+
+import json
+import time
+import uuid
+from typing import Iterable, Iterator, Optional
+
+from sections import build_toc, section_row
+from tracing import span
+from work_queue import claim_duplicates
+
+DEFAULT_MAX_BATCH_BYTES = 512 * 1024
+DEFAULT_MAX_BATCH_ROWS = 1000
+DEFAULT_RETRIES = 3
+
+
+def iter_batches(rows: Iterable[dict], max_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+                 max_rows: int = DEFAULT_MAX_BATCH_ROWS) -> Iterator[tuple]:
+    """
+    Group rows into batches of at most max_bytes of JSON (and max_rows rows).
+
+    Yields (batch, payload_bytes). A single row larger than max_bytes is
+    sent on its own.
+    """
+    batch = []
+    batch_bytes = 0
+    for row in rows:
+        row_bytes = len(json.dumps(row, ensure_ascii=False).encode('utf-8')) + 1
+        if batch and (batch_bytes + row_bytes > max_bytes or len(batch) >= max_rows):
+            yield batch, batch_bytes
+            batch = []
+            batch_bytes = 0
+        batch.append(row)
+        batch_bytes += row_bytes
+    if batch:
+        yield batch, batch_bytes
+
+
+def upsert_rows(supabase, table: str, rows: Iterable[dict], on_conflict: str,
+                max_bytes: int = DEFAULT_MAX_BATCH_BYTES, max_rows: int = DEFAULT_MAX_BATCH_ROWS,
+                retries: int = DEFAULT_RETRIES) -> list:
+    """
+    Upsert rows in payload-sized batches, retrying failed batches with backoff.
+
+    Returns per-batch stats: [{'rows', 'bytes', 'seconds', 'attempts'}].
+    Raises the last error if a batch still fails after `retries` attempts.
+    """
+    stats = []
+    for batch, batch_bytes in iter_batches(rows, max_bytes, max_rows):
+        with span('db.upsert', table=table, rows=len(batch), bytes=batch_bytes) as batch_span:
+            for attempt in range(1, retries + 1):
+                start = time.time()
+                try:
+                    supabase.table(table).upsert(batch, on_conflict=on_conflict).execute()
+                    break
+                except Exception:
+                    if attempt == retries:
+                        raise
+                    time.sleep(2 ** attempt)
+            batch_span.set(attempts=attempt)
+        stats.append({
+            'rows': len(batch),
+            'bytes': batch_bytes,
+            'seconds': time.time() - start,
+            'attempts': attempt,
+        })
+    return stats
+
+
+def format_batch_stats(stats: list) -> str:
+    """One-line summary of upsert_rows stats for worker logs"""
+    if not stats:
+        return "0 rows"
+    rows = sum(s['rows'] for s in stats)
+    size_kb = sum(s['bytes'] for s in stats) / 1024
+    latencies = sorted(s['seconds'] for s in stats)
+    retried = sum(1 for s in stats if s['attempts'] > 1)
+    summary = (f"{rows} rows in {len(stats)} batches ({size_kb:,.0f} KB), "
+               f"batch latency p50 {latencies[len(latencies) // 2]:.2f}s / max {latencies[-1]:.2f}s")
+    if retried:
+        summary += f", {retried} retried"
+    return summary
+
+
+def save_extraction(supabase, manual_id: str, markdown: str, sections: list,
+                    extraction_method: str, lease_token: Optional[str] = None,
+                    extraction_quality: Optional[float] = None,
+                    total_pages: Optional[int] = None) -> dict:
+    """
+    Stage a manual's sections, then apply them with its content and mark it
+    extracted atomically.
+
+    Returns {'sections': count, 'batches': per-batch stats}. If any batch or
+    the finalize call fails (including a lost lease), the error propagates,
+    the manual is not marked 'extracted' and its live sections are untouched.
+    """
+    stage_id = str(uuid.uuid4())
+    # section_row() extracts each section's keywords
+    with span('keywords', sections=len(sections)):
+        rows = [{**section_row(manual_id, section), 'stage_id': stage_id} for section in sections]
+    stats = upsert_rows(supabase, 'manual_sections_staging', rows, on_conflict='stage_id,section_path')
+
+    with span('db.finalize_manual_extraction', manual_id=manual_id):
+        supabase.rpc('finalize_manual_extraction', {
+            'p_manual_id': manual_id,
+            'p_content': {
+                'content_markdown': markdown,
+                'table_of_contents': build_toc(sections),
+                'total_word_count': len(markdown.split()),
+                'total_char_count': len(markdown),
+                'total_token_count': len(markdown) // 4,
+                'total_pages': total_pages,
+                'extraction_method': extraction_method,
+                'extraction_quality': extraction_quality,
+            },
+            'p_stage_id': stage_id,
+            'p_section_count': len(rows),
+            'p_lease_token': lease_token,
+        }).execute()
+
+    return {'sections': len(rows), 'batches': stats}
+
+
+def save_duplicates(supabase, manual_id: str, pdf_sha256: str, markdown: str, sections: list,
+                    extraction_method: str, extraction_quality: Optional[float] = None,
+                    total_pages: Optional[int] = None) -> list:
+    """
+    Record the PDF hash for manual_id and save its extraction to every
+    unextracted manual sharing the same PDF.
+
+    Returns the names of the manuals saved. A sibling that fails to save is
+    put back to 'pending' so a normal worker picks it up.
+    """
+    saved = []
+    for sibling in claim_duplicates(supabase, manual_id, pdf_sha256):
+        name = f"{sibling['year']} {sibling['make']} {sibling['model']}"
+        try:
+            with span('save_duplicate', manual_id=sibling['id']):
+                save_extraction(
+                    supabase, sibling['id'], markdown, sections,
+                    extraction_method=extraction_method,
+                    lease_token=sibling['lease_token'],
+                    extraction_quality=extraction_quality,
+                    total_pages=total_pages,
+                )
+            saved.append(name)
+        except Exception as e:
+            supabase.table('vehicle_manuals').update({
+                'content_status': 'pending',
+                'error_message': f"Duplicate save failed: {str(e)[:200]}",
+            }).eq('id', sibling['id']).execute()
+    return saved
@@ -3,7 +3,8 @@
 Compare search methods for manual sections:
 1. ILIKE - Simple pattern matching
 2. Full-Text Search (FTS) - PostgreSQL tsvector with stemming
-3. Semantic/Vector Search - Requires embeddings (not yet implemented)
+3. Semantic/Vector Search - gte-small embeddings (embed_sections.py)
+4. Hybrid - FTS + vector fused with reciprocal rank fusion (search_manual_hybrid)
 
 This demonstrates the trade-offs between each approach.
 """
@@ -13,6 +14,8 @@ from dotenv import load_dotenv
 from supabase import create_client
 import time
 
+from embed_sections import embed_texts
+
 load_dotenv()
 
 supabase = create_client(
@@ -46,6 +49,31 @@ def search_fts(manual_id: str, query: str) -> tuple[list, float]:
     return result.data, (time.time() - start) * 1000
 
 
+def search_vector(manual_id: str, query: str, limit: int = 10) -> tuple[list, float]:
+    """Semantic search: nearest section embeddings to the query's"""
+    start = time.time()
+    embedding = embed_texts([query])[0]
+    result = supabase.rpc("search_manual_semantic", {
+        "p_manual_id": manual_id,
+        "p_query_embedding": embedding,
+        "p_limit": limit,
+    }).execute()
+    return result.data, (time.time() - start) * 1000
+
+
+def search_hybrid(manual_id: str, query: str, limit: int = 10) -> tuple[list, float]:
+    """FTS + vector candidates fused in the database (RRF), with snippets"""
+    start = time.time()
+    embedding = embed_texts([query])[0]
+    result = supabase.rpc("search_manual_hybrid", {
+        "p_manual_id": manual_id,
+        "p_query": query,
+        "p_query_embedding": embedding,
+        "p_limit": limit,
+    }).execute()
+    return result.data, (time.time() - start) * 1000
+
+
 def main():
     # Get a Ford F-150 manual
     manual = supabase.table('vehicle_manuals').select(
@@ -108,9 +136,25 @@ Manual: {name}
         fts_results, fts_time = search_fts(manual_id, scenario['query'])
         print(f"  FTS:    {len(fts_results):3d} results ({fts_time:5.0f}ms)")
 
+        # Vector (always returns the nearest sections; similarity says how near)
+        vector_results, vector_time = search_vector(manual_id, scenario['query'])
+        print(f"  Vector: {len(vector_results):3d} results ({vector_time:5.0f}ms)")
+
+        # Hybrid
+        hybrid_results, hybrid_time = search_hybrid(manual_id, scenario['query'])
+        print(f"  Hybrid: {len(hybrid_results):3d} results ({hybrid_time:5.0f}ms)")
+
         # Show sample results if any
         if fts_results:
-            print(f"  Sample: {fts_results[0]['section_title'][:50]}")
+            print(f"  FTS sample:    {fts_results[0]['section_title'][:50]}")
+        if vector_results:
+            print(f"  Vector sample: {vector_results[0]['section_title'][:50]} "
+                  f"(similarity {vector_results[0]['similarity']:.2f})")
+        if hybrid_results:
+            top = hybrid_results[0]
+            print(f"  Hybrid sample: {top['section_title'][:50]} "
+                  f"(fts #{top['fts_rank'] or '-'}, vector #{top['vector_rank'] or '-'})")
+            print(f"    {top['snippet'][:100]}")
 
     print(f"""
 
@@ -120,17 +164,20 @@ Method      | Best For                    | Limitations
 ------------|-----------------------------|--------------------------
 ILIKE       | Exact substring matching    | No stemming, no ranking
 FTS         | Word matching with stemming | No semantic understanding
-Vector      | Semantic similarity         | Requires embeddings, API costs
+Vector      | Semantic similarity         | Sections must be embedded first
+Hybrid      | Both, ranked by agreement   | FTS only without a query embedding
 
 Current Status:
-- ILIKE: Works (used in MCP search_manual tool)
+- ILIKE: Works (unindexed; no longer used by the MCP)
 - FTS: Works (available via Supabase .text_search())
-- Vector: Schema ready (embedding column exists), needs OpenAI API key
-
-To enable semantic search:
-1. Add OPENAI_API_KEY to .env
-2. Run embedding generation script
-3. Use cosine similarity for search
+- Vector: Works for embedded sections (search_manual_semantic RPC)
+- Hybrid: Used by the MCP search_manual tool via the manuals edge function
+  (search_manual_hybrid RPC)
+
+Semantic search uses gte-small (384 dims) locally, no API key:
+1. pip install sentence-transformers
+2. python embed_sections.py (or --watch to embed new manuals as they land)
+3. Query embeddings come from the same model (Supabase.ai in the edge function)
 """)
 
 
@@ -0,0 +1,235 @@
+"""
+Streaming, resumable HTTP downloader for manual PDFs.
+
+Manual PDFs are 35-80 MB and come from flaky CDNs (gimmemanuals, VHR).
+Instead of holding response.content in memory, download_file() streams to
+<dest>.part in large chunks. When the connection drops it resumes from the
+bytes already on disk with a Range request, and it only renames the file
+into place once its size matches Content-Length.
+
+Resumes are validated: the ETag (or Last-Modified) and total size of the
+first response are kept in <dest>.part.json and sent back as If-Range, so
+a file that changed on the server is downloaded again instead of being
+appended to stale bytes. Processes downloading the same dest take turns
+on <dest>.part.lock (see dest_lock) rather than writing into one .part
+file together; the lock file is removed when the download ends.
+
+Connections are pooled: one requests.Session per host, shared by all
+threads in the process.
+
+    stats = download_file(url, Path('manual.pdf'))
+    print(format_download_stats(stats))   # "52.1 MB in 8.3s (6.3 MB/s)"
+"""
+
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_RETRIES = 5
+DEFAULT_TIMEOUT = (10, 300)  # (connect, read between bytes)
+POOL_SIZE = 16
+
+# "bytes 0-99/5000" on a 206, "bytes */5000" on a 416
+CONTENT_RANGE_RE = re.compile(r'bytes (?:\d+-\d+|\*)/(\d+|\*)')
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class IncompleteDownload(Exception):
+    """Body ended before Content-Length bytes arrived"""
+
+
+def session_for(url: str) -> requests.Session:
+    """Pooled session for url's host (created on first use)"""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            # Content-Length must describe the bytes we write
+            session.headers['Accept-Encoding'] = 'identity'
+            _sessions[host] = session
+        return session
+
+
+def _range_total(response: requests.Response) -> Optional[int]:
+    """Full file size from the Content-Range header, if it states one"""
+    content_range = CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+    if content_range and content_range.group(1) != '*':
+        return int(content_range.group(1))
+    return None
+
+
+def _expected_size(response: requests.Response, offset: int) -> Optional[int]:
+    """Total file size implied by a (possibly partial) response, if known"""
+    total = _range_total(response)
+    if total is not None:
+        return total
+    length = response.headers.get('Content-Length')
+    return offset + int(length) if length is not None else None
+
+
+def _validator(response: requests.Response) -> Optional[str]:
+    """If-Range value for a response: a strong ETag, else Last-Modified"""
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def _read_meta(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _discard(*paths: Path):
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def dest_lock(dest: Path):
+    """
+    Hold the exclusive lock on <dest>.part.lock; the lock file is removed on exit.
+
+    A waiter may have opened a lock file that its holder has since removed,
+    so the lock only counts once the locked file is still the one at the path.
+    """
+    dest = Path(dest)
+    path = dest.with_name(dest.name + '.part.lock')
+    while True:
+        lock = open(path, 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.fstat(lock.fileno()).st_ino == os.stat(path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        lock.close()
+    try:
+        yield
+    finally:
+        _discard(path)
+        lock.close()
+
+
+def download_file(url: str, dest: Path, timeout=DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                  chunk_size: int = CHUNK_SIZE, lock: bool = True) -> dict:
+    """
+    Download url to dest, resuming interrupted transfers with Range requests.
+
+    A leftover <dest>.part from an earlier interrupted run is resumed too,
+    if the server still has the same file. Returns {'url', 'bytes',
+    'downloaded', 'seconds', 'bytes_per_sec', 'resumes'} where 'downloaded'
+    counts only bytes fetched by this call. Pass lock=False if the caller
+    already holds dest_lock(dest) (e.g. to also move dest under it).
+    """
+    dest = Path(dest)
+    if not lock:
+        return _download(url, dest, timeout, retries, chunk_size)
+    # Another process downloading the same dest finishes (or gives up) first
+    with dest_lock(dest):
+        return _download(url, dest, timeout, retries, chunk_size)
+
+
+def _download(url: str, dest: Path, timeout, retries: int, chunk_size: int) -> dict:
+    """download_file() body, run under the dest lock"""
+    part = dest.with_name(dest.name + '.part')
+    meta_path = dest.with_name(dest.name + '.part.json')
+    session = session_for(url)
+
+    start = time.time()
+    downloaded = 0
+    resumes = 0
+
+    for attempt in range(1, retries + 1):
+        meta = _read_meta(meta_path)
+        offset = part.stat().st_size if part.exists() else 0
+        if offset and not meta.get('validator'):
+            offset = 0  # Can't tell whether the server still has the same file
+        headers = {'Range': f'bytes={offset}-', 'If-Range': meta['validator']} if offset else {}
+
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if offset and response.status_code == 416:
+                    # Nothing left to fetch; the .part is complete only if it is
+                    # as long as the file ("bytes */N") and as the size first seen
+                    expected = _range_total(response)
+                    if expected != offset or meta.get('size') != offset:
+                        _discard(part, meta_path)
+                        raise IncompleteDownload(f"stale partial file ({offset} of {expected} bytes, "
+                                                 f"{meta.get('size')} expected)")
+                else:
+                    response.raise_for_status()
+                    if offset and response.status_code != 206:
+                        offset = 0  # Server ignored Range, or the file changed (If-Range); start over
+                    expected = _expected_size(response, offset)
+                    if offset and expected != meta.get('size'):
+                        _discard(part, meta_path)
+                        raise IncompleteDownload(f"remote size changed ({meta.get('size')} -> {expected})")
+                    if not offset:
+                        meta_path.write_text(json.dumps({'validator': _validator(response), 'size': expected}))
+
+                    with open(part, 'ab' if offset else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            f.write(chunk)
+                            downloaded += len(chunk)
+
+            size = part.stat().st_size
+            if expected is not None and size != expected:
+                raise IncompleteDownload(f"got {size:,} of {expected:,} bytes")
+
+            os.replace(part, dest)
+            _discard(meta_path)
+            seconds = time.time() - start
+            return {
+                'url': url,
+                'bytes': size,
+                'downloaded': downloaded,
+                'seconds': seconds,
+                'bytes_per_sec': downloaded / seconds if seconds > 0 else 0.0,
+                'resumes': resumes,
+            }
+
+        except requests.HTTPError as e:
+            # Client errors won't fix themselves
+            if e.response is not None and e.response.status_code < 500:
+                raise
+            if attempt == retries:
+                raise
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError, IncompleteDownload):
+            if attempt == retries:
+                raise
+
+        resumes += 1
+        time.sleep(min(2 ** attempt, 30))
+
+
+def format_download_stats(stats: dict) -> str:
+    """One-line summary of download_file stats for worker logs"""
+    summary = (f"{stats['bytes'] / 1024 / 1024:.1f} MB in {stats['seconds']:.1f}s "
+               f"({stats['bytes_per_sec'] / 1024 / 1024:.1f} MB/s)")
+    if stats['resumes']:
+        summary += f", resumed {stats['resumes']}x"
+    return summary
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Embed manual sections for semantic search.
+
+Fills manual_sections.embedding with gte-small (384 dims), a small model
+that runs on CPU, for every section that doesn't have one yet. Sections
+are read keyset-paginated on id over the unembedded-sections index and
+written back with the set_section_embeddings RPC, so a run only does the
+work that is missing: newly extracted manuals, and sections whose text
+changed on re-extraction (the manual_sections_embedding_reset trigger
+clears their embedding).
+
+Query embeddings must come from the same model: the manuals edge function
+uses the Edge Runtime's built-in gte-small, and compare_search_methods.py
+imports embed_texts() from here.
+
+Requires: pip install sentence-transformers
+
+Usage:
+  python embed_sections.py                  # Embed every section without an embedding
+  python embed_sections.py --manual <id>    # Only one manual
+  python embed_sections.py --limit 1000     # Stop after 1000 sections
+  python embed_sections.py --watch 300      # Keep running, checking for new sections every 5 minutes
+"""
+
+import os
+import sys
+import time
+import argparse
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from supabase import create_client, Client
+
+EMBEDDING_MODEL = 'thenlper/gte-small'
+EMBEDDING_DIMENSIONS = 384
+# gte-small reads 512 tokens; longer text is truncated by the tokenizer
+# anyway, so don't send (or tokenize) more than that
+MAX_EMBED_CHARS = 2048
+DEFAULT_PAGE_SIZE = 256
+DEFAULT_BATCH_SIZE = 64
+# Rows per set_section_embeddings call (~4 KB of JSON each)
+WRITE_BATCH_ROWS = 100
+
+_model = None
+
+
+def load_model(device: str = 'cpu'):
+    """Load the embedding model once per process"""
+    global _model
+    if _model is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError("sentence-transformers not installed: pip install sentence-transformers")
+        _model = SentenceTransformer(EMBEDDING_MODEL, device=device)
+    return _model
+
+
+def section_text(section: dict) -> str:
+    """Text that represents a section: its title, then the start of its content"""
+    title = section.get('section_title') or ''
+    content = section.get('content_plain') or ''
+    return f"{title}\n\n{content}"[:MAX_EMBED_CHARS]
+
+
+def embed_texts(texts: list, batch_size: int = DEFAULT_BATCH_SIZE, device: str = 'cpu') -> list:
+    """Normalized embeddings (cosine similarity = dot product), one list of floats per text"""
+    model = load_model(device)
+    vectors = model.encode(texts, batch_size=batch_size, normalize_embeddings=True,
+                           convert_to_numpy=True, show_progress_bar=False)
+    return vectors.tolist()
+
+
+def vector_literal(vector: list) -> str:
+    """pgvector text format"""
+    return '[' + ','.join(f'{x:.6f}' for x in vector) + ']'
+
+
+def iter_unembedded(supabase: Client, manual_id: Optional[str] = None,
+                    page_size: int = DEFAULT_PAGE_SIZE, limit: Optional[int] = None):
+    """Yield pages of sections with no embedding, following the id cursor"""
+    after = None
+    seen = 0
+    while limit is None or seen < limit:
+        size = page_size if limit is None else min(page_size, limit - seen)
+        query = supabase.table('manual_sections').select(
+            'id, section_title, content_plain'
+        ).is_('embedding', 'null')
+        if manual_id:
+            query = query.eq('manual_id', manual_id)
+        if after:
+            query = query.gt('id', after)
+        rows = query.order('id').limit(size).execute().data or []
+        if not rows:
+            return
+        yield rows
+        seen += len(rows)
+        after = rows[-1]['id']
+        if len(rows) < size:
+            return
+
+
+def save_embeddings(supabase: Client, ids: list, vectors: list) -> int:
+    """Write embeddings with set_section_embeddings; returns rows updated"""
+    updated = 0
+    for start in range(0, len(ids), WRITE_BATCH_ROWS):
+        batch = [
+            {'id': section_id, 'embedding': vector_literal(vector)}
+            for section_id, vector in zip(ids[start:start + WRITE_BATCH_ROWS],
+                                          vectors[start:start + WRITE_BATCH_ROWS])
+        ]
+        updated += supabase.rpc('set_section_embeddings', {'p_embeddings': batch}).execute().data or 0
+    return updated
+
+
+def embed_pending(supabase: Client, manual_id: Optional[str] = None, limit: Optional[int] = None,
+                  page_size: int = DEFAULT_PAGE_SIZE, batch_size: int = DEFAULT_BATCH_SIZE,
+                  device: str = 'cpu') -> dict:
+    """Embed every section that has no embedding; returns counts and timings"""
+    stats = {'sections': 0, 'embed_seconds': 0.0, 'write_seconds': 0.0}
+    for page in iter_unembedded(supabase, manual_id=manual_id, page_size=page_size, limit=limit):
+        start = time.time()
+        vectors = embed_texts([section_text(s) for s in page], batch_size=batch_size, device=device)
+        stats['embed_seconds'] += time.time() - start
+
+        start = time.time()
+        stats['sections'] += save_embeddings(supabase, [s['id'] for s in page], vectors)
+        stats['write_seconds'] += time.time() - start
+
+        rate = stats['sections'] / max(stats['embed_seconds'], 0.001)
+        print(f"  Embedded {stats['sections']:,} sections ({rate:.0f}/s)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Embed manual sections for semantic search')
+    parser.add_argument('--manual', type=str, help='Only embed sections of this manual id')
+    parser.add_argument('--limit', type=int, help='Maximum sections to embed')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='Sections fetched per request')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Sections per model batch')
+    parser.add_argument('--device', type=str, default='cpu', help='Torch device (cpu, cuda, mps)')
+    parser.add_argument('--watch', type=int, metavar='SECONDS',
+                        help='Keep running, checking for unembedded sections every SECONDS')
+    args = parser.parse_args()
+
+    supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
+    if not supabase_key:
+        print("❌ SUPABASE_SERVICE_KEY required")
+        sys.exit(1)
+    supabase = create_client(os.getenv('SUPABASE_URL', 'https://jxpbnnmefwtazfvoxvge.supabase.co'), supabase_key)
+
+    print(f"🧮 Embedding manual sections with {EMBEDDING_MODEL} ({args.device})")
+    print("=" * 50)
+    load_model(args.device)
+
+    while True:
+        stats = embed_pending(supabase, manual_id=args.manual, limit=args.limit, page_size=args.page_size,
+                              batch_size=args.batch_size, device=args.device)
+        if stats['sections']:
+            print(f"✅ {stats['sections']:,} sections embedded "
+                  f"(model {stats['embed_seconds']:.1f}s, writes {stats['write_seconds']:.1f}s)")
+        else:
+            print("✅ All sections embedded")
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,12 @@ Usage:
   python extract-marker.py --workers 2        # Use 2 parallel workers
   python extract-marker.py --limit 10         # Process only 10 files
   python extract-marker.py --reprocess        # Re-extract already processed
+  python extract-marker.py --shard-pages 50   # Split each PDF into 50-page shards across workers
+  python extract-marker.py --marker-server    # Convert through a running marker_server.py
+  python extract-marker.py --tiered           # pymupdf first, marker only on pages that need OCR
+  python extract-marker.py --reprocess --no-cache  # Force marker to run again on unchanged PDFs
+  python extract-marker.py --prefetch 4       # Fetch the next 4 PDFs while extracting, upload in background
+  python extract-marker.py --trace traces.jsonl  # Record per-stage timing spans (see tracing.py)
   python extract-marker.py --status           # Show progress stats only
 """
 
@@ -18,8 +24,8 @@ import re
 import json
 import argparse
 import subprocess
+import time
 from pathlib import Path
-from datetime import datetime
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Optional
 import hashlib
@@ -30,10 +36,34 @@ load_dotenv()
 
 from supabase import create_client, Client
 
+from bulk_writer import save_duplicates, save_extraction
+from extraction_cache import ExtractionCache, package_version
+from extraction_status import get_extraction_status
+from marker_server import DEFAULT_SOCKET, cache_options, convert_pdf, server_available
+from pdf_cache import PdfCache, hash_file
+from pdf_shards import page_count, plan_shards, run_marker_shard, stitch_markdown
+from pipeline import Pipeline, Stage, format_metrics
+from resource_monitor import marker_env
+from sections import parse_sections
+from telemetry import EventLog
+from tiered_extract import OCR_MARKER_OPTIONS, format_tier_stats, tiered_extract
+from tracing import enable as enable_tracing, span, start_span
+from work_queue import LeaseHeartbeat, claim_manuals
+
 SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://jxpbnnmefwtazfvoxvge.supabase.co')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 MANUALS_DIR = Path('./manuals')
 OUTPUT_DIR = Path('./marker_output')
+# Full path since subprocess won't find venv bin
+MARKER_BIN = Path(__file__).parent / '.venv' / 'bin' / 'marker_single'
+
+extraction_cache = ExtractionCache()
+# marker_single flags that change output (images are extracted), see cache_options
+MARKER_OPTIONS = {'disable_image_extraction': False, 'paginate_output': True}
+# Page separators, for per-page quality scores
+MARKER_ARGS = ('--paginate_output',)
+MARKER_VERSION = package_version('marker-pdf')
+TIERED_VERSION = package_version('pymupdf4llm', 'marker-pdf')
 
 if not SUPABASE_KEY:
     print("❌ SUPABASE_SERVICE_KEY required")
@@ -41,22 +71,13 @@ if not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Stage events for status.py (emitted from the parent; pool workers return timings)
+events = EventLog(supabase)
+
 
 def get_stats():
     """Get current processing statistics"""
-    total = supabase.table('vehicle_manuals').select('id', count='exact').execute()
-    pending = supabase.table('vehicle_manuals').select('id', count='exact').eq('content_status', 'pending').execute()
-    extracting = supabase.table('vehicle_manuals').select('id', count='exact').eq('content_status', 'extracting').execute()
-    extracted = supabase.table('vehicle_manuals').select('id', count='exact').eq('content_status', 'extracted').execute()
-    failed = supabase.table('vehicle_manuals').select('id', count='exact').eq('content_status', 'failed').execute()
-
-    return {
-        'total': total.count,
-        'pending': pending.count,
-        'extracting': extracting.count,
-        'extracted': extracted.count,
-        'failed': failed.count
-    }
+    return get_extraction_status(supabase)
 
 
 def print_stats():
@@ -76,26 +97,23 @@ def print_stats():
     print()
 
 
-def get_pending_manuals(limit: Optional[int] = None, reprocess: bool = False):
-    """Get list of manuals to process"""
-    query = supabase.table('vehicle_manuals').select(
-        'id, year, make, model, variant, pdf_storage_path, pdf_url, content_status'
+def get_pending_manuals(limit: Optional[int] = None, reprocess: bool = False, attempted: Optional[set] = None,
+                        tiered: bool = False):
+    """Claim manuals to process (claimed rows are marked extracting, under a lease)"""
+    # Atomic claim - concurrent runs never receive the same manual.
+    # Skip manuals already attempted this run so failures aren't retried forever.
+    # Reprocess claims extracted manuals too; they keep their lease like any
+    # other claim, so reclaim_expired never hands them to another worker mid-run.
+    manuals = claim_manuals(
+        supabase,
+        limit=limit or 1,
+        statuses=('pending', 'failed', 'extracted') if reprocess else ('pending', 'failed'),
+        exclude_ids=sorted(attempted or ()),
+        extractors=('tiered',) if tiered else ('marker',),
     )
-
-    if reprocess:
-        # Get all with PDF
-        query = query.or_('pdf_storage_path.not.is.null,pdf_url.not.is.null')
-    else:
-        # Only pending or failed
-        query = query.in_('content_status', ['pending', 'failed'])
-
-    query = query.order('year', desc=True)
-
-    if limit:
-        query = query.limit(limit)
-
-    result = query.execute()
-    return result.data
+    for manual in manuals:
+        events.emit('claim', manual['id'])
+    return manuals
 
 
 def to_slug(text: str) -> str:
@@ -128,99 +146,26 @@ def find_local_pdf(manual: dict) -> Optional[Path]:
     return None
 
 
-def parse_markdown_sections(markdown_content: str) -> list:
-    """Parse markdown into sections based on headers"""
-    sections = []
-    lines = markdown_content.split('\n')
-
-    current_section = None
-    section_counter = 0
-    chapter_counter = 0
+def process_single_pdf(manual: dict, marker_socket: Optional[str] = None, tiered: bool = False,
+                       use_cache: bool = True) -> dict:
+    """
+    Process a single PDF with marker-pdf (or a marker server if marker_socket; pymupdf first if tiered).
 
-    for line in lines:
-        # Check for headers
-        header_match = re.match(r'^(#{1,6})\s+(.+)$', line)
-
-        if header_match:
-            # Save previous section
-            if current_section and current_section['content'].strip():
-                sections.append(current_section)
-
-            level = len(header_match.group(1))
-            title = header_match.group(2).strip()
-
-            # Clean title (remove markdown formatting)
-            title = re.sub(r'\*+', '', title)
-            title = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', title)
-            title = title.strip()
-
-            if level == 1:
-                chapter_counter += 1
-                section_counter = 0
-                path = str(chapter_counter)
-            else:
-                section_counter += 1
-                path = f"{chapter_counter}.{section_counter}"
-
-            current_section = {
-                'path': path,
-                'title': title[:200],
-                'content': line + '\n',
-                'depth': level - 1
-            }
-        elif current_section:
-            current_section['content'] += line + '\n'
+    A cached extraction of the same PDF bytes with the same extractor version
+    and options is reused unless use_cache is False. Runs in a pool worker;
+    its spans are parented to manual['trace'] from the main process.
+    """
+    with span('extract', parent=manual.get('trace'), manual_id=manual['id']) as extract_span:
+        result = extract_pdf(manual, marker_socket, tiered, use_cache)
+        if result['success']:
+            extract_span.set(pages=result['pages'], chars=result['char_count'], cached=result['cached'])
         else:
-            # Content before first header
-            if not current_section:
-                current_section = {
-                    'path': '0',
-                    'title': 'Introduction',
-                    'content': line + '\n',
-                    'depth': 0
-                }
-
-    # Don't forget the last section
-    if current_section and current_section['content'].strip():
-        sections.append(current_section)
-
-    # Filter out very short sections
-    sections = [s for s in sections if len(s['content'].strip()) > 50]
-
-    return sections
-
-
-def extract_keywords(content: str, title: str) -> list:
-    """Extract automotive keywords from content"""
-    keywords = set()
-
-    auto_terms = [
-        'tire', 'oil', 'brake', 'engine', 'battery', 'fuel', 'light', 'warning',
-        'maintenance', 'safety', 'airbag', 'seat', 'belt', 'door', 'window',
-        'mirror', 'wiper', 'filter', 'fluid', 'pressure', 'temperature', 'gauge',
-        'dashboard', 'instrument', 'control', 'switch', 'button', 'key', 'fob',
-        'start', 'stop', 'drive', 'park', 'reverse', 'neutral', 'transmission',
-        'cruise', 'lane', 'assist', 'camera', 'sensor', 'navigation', 'audio',
-        'bluetooth', 'phone', 'climate', 'ac', 'heat', 'defrost', 'vent'
-    ]
+            extract_span.fail(result['error'])
+    return result
 
-    text = (title + ' ' + content).lower()
 
-    for term in auto_terms:
-        if term in text:
-            keywords.add(term)
-
-    # Add title words
-    for word in title.lower().split():
-        word = re.sub(r'[^a-z]', '', word)
-        if len(word) > 3:
-            keywords.add(word)
-
-    return list(keywords)[:20]
-
-
-def process_single_pdf(manual: dict) -> dict:
-    """Process a single PDF with marker-pdf"""
+def extract_pdf(manual: dict, marker_socket: Optional[str], tiered: bool, use_cache: bool) -> dict:
+    """process_single_pdf() body; failures are returned as {'success': False, 'error'}"""
     manual_id = manual['id']
     year = manual['year']
     make = manual['make']
@@ -230,44 +175,84 @@ def process_single_pdf(manual: dict) -> dict:
     name = f"{year} {make} {model}{' ' + variant if variant else ''}"
 
     try:
-        # Find local PDF
-        pdf_path = find_local_pdf(manual)
+        # Find local PDF (already fetched by the pipeline's download stage if pipelined)
+        pdf_path = manual.get('pdf_path') or find_local_pdf(manual)
         if not pdf_path:
             return {'id': manual_id, 'success': False, 'error': 'PDF not found locally'}
 
         # Create output directory
-        output_subdir = OUTPUT_DIR / f"{year}-{to_slug(make)}-{to_slug(model)}"
+        output_subdir = output_dir_for(manual)
         output_subdir.mkdir(parents=True, exist_ok=True)
 
-        # Run marker-pdf (use full path since subprocess won't find venv bin)
-        marker_bin = Path(__file__).parent / '.venv' / 'bin' / 'marker_single'
-        result = subprocess.run(
-            [
-                str(marker_bin),
-                str(pdf_path),
-                '--output_dir', str(output_subdir),
-                '--output_format', 'markdown'
-            ],
-            capture_output=True,
-            text=True,
-            timeout=3600  # 60 minute timeout (large PDFs need more time)
-        )
-
-        # Check for actual failure (not just warnings in stderr)
-        # marker-pdf outputs warnings to stderr but still succeeds
-        if result.returncode != 0:
-            return {'id': manual_id, 'success': False, 'error': f'marker-pdf failed (exit {result.returncode}): {result.stderr[:500]}'}
-
-        # Find the output markdown file
-        md_files = list(output_subdir.glob('**/*.md'))
-        if not md_files:
-            return {'id': manual_id, 'success': False, 'error': 'No markdown output generated'}
-
-        md_file = md_files[0]
-        markdown_content = md_file.read_text(encoding='utf-8')
+        extract_start = time.time()
+        with span('hash'):
+            pdf_sha256 = hash_file(pdf_path)
+        # Backend and the flags it actually runs with (a marker server reports its own)
+        if tiered:
+            extractor, version = 'tiered', TIERED_VERSION
+            options = cache_options(marker_socket, OCR_MARKER_OPTIONS)
+        else:
+            extractor, version = 'marker', MARKER_VERSION
+            options = cache_options(marker_socket, MARKER_OPTIONS)
+        cached = extraction_cache.get(pdf_sha256, extractor, version, options) if use_cache else None
+
+        tier_stats = None
+        if cached is not None:
+            engine = 'extraction_cache'
+        else:
+            engine = 'tiered' if tiered else 'marker_server' if marker_socket else 'marker'
+        with span(engine):
+            if cached is not None:
+                markdown_content = cached
+            elif tiered:
+                markdown_content, tier_stats = tiered_extract(
+                    pdf_path, output_subdir, marker_bin=MARKER_BIN, marker_socket=marker_socket,
+                    env=marker_env(manual_id), timeout=3600,
+                )
+            elif marker_socket:
+                markdown_content = convert_pdf(pdf_path, marker_socket, timeout=3600)
+            else:
+                # Run marker-pdf
+                result = subprocess.run(
+                    [
+                        str(MARKER_BIN),
+                        str(pdf_path),
+                        '--output_dir', str(output_subdir),
+                        '--output_format', 'markdown',
+                        *MARKER_ARGS,
+                    ],
+                    capture_output=True,
+                    text=True,
+                    timeout=3600,  # 60 minute timeout (large PDFs need more time)
+                    env=marker_env(manual_id),  # Lets resource_monitor.py attribute usage to this manual
+                )
+
+                # Check for actual failure (not just warnings in stderr)
+                # marker-pdf outputs warnings to stderr but still succeeds
+                if result.returncode != 0:
+                    return {'id': manual_id, 'success': False, 'error': f'marker-pdf failed (exit {result.returncode}): {result.stderr[:500]}'}
+
+                # Find the output markdown file
+                md_files = list(output_subdir.glob('**/*.md'))
+                if not md_files:
+                    return {'id': manual_id, 'success': False, 'error': 'No markdown output generated'}
+
+                md_file = md_files[0]
+                markdown_content = md_file.read_text(encoding='utf-8')
+
+        if cached is None:
+            extraction_cache.put(pdf_sha256, extractor, markdown_content, version, options)
+
+        extract_seconds = time.time() - extract_start
+        try:
+            pages = page_count(pdf_path)
+        except Exception:
+            pages = None
 
         # Parse sections
-        sections = parse_markdown_sections(markdown_content)
+        with span('parse_sections') as parse_span:
+            sections = parse_sections(markdown_content)
+            parse_span.set(sections=len(sections))
 
         return {
             'id': manual_id,
@@ -276,7 +261,13 @@ def process_single_pdf(manual: dict) -> dict:
             'markdown': markdown_content,
             'sections': sections,
             'num_sections': len(sections),
-            'char_count': len(markdown_content)
+            'char_count': len(markdown_content),
+            'method': 'tiered-marker-pdf' if tiered else 'marker-pdf',
+            'pdf_sha256': pdf_sha256,
+            'cached': cached is not None,
+            'tiers': format_tier_stats(tier_stats) if tier_stats else None,
+            'extract_seconds': extract_seconds,
+            'pages': pages,
         }
 
     except subprocess.TimeoutExpired:
@@ -285,11 +276,26 @@ def process_single_pdf(manual: dict) -> dict:
         return {'id': manual_id, 'success': False, 'error': str(e)}
 
 
-def save_to_database(result: dict) -> bool:
+def output_dir_for(manual: dict) -> Path:
+    """Per-manual marker output directory"""
+    return OUTPUT_DIR / f"{manual['year']}-{to_slug(manual['make'])}-{to_slug(manual['model'])}"
+
+
+def process_pdf_shard(pdf_path: Path, output_subdir: Path, start: int, end: int,
+                      marker_socket: Optional[str] = None, manual_id: Optional[str] = None) -> str:
+    """Run marker-pdf on one page range of a PDF (worker process)"""
+    if marker_socket:
+        return convert_pdf(pdf_path, marker_socket, page_range=(start, end), timeout=3600)
+    return run_marker_shard(pdf_path, start, end, output_subdir, marker_bin=MARKER_BIN,
+                            extra_args=MARKER_ARGS, env=marker_env(manual_id))
+
+
+def save_to_database(result: dict, lease_token: Optional[str] = None) -> bool:
     """Save extraction result to database"""
     manual_id = result['id']
 
     if not result['success']:
+        events.failed(manual_id, result.get('stage', 'extract'), result.get('error', 'Unknown error'))
         # Mark as failed
         supabase.table('vehicle_manuals').update({
             'content_status': 'failed',
@@ -297,69 +303,47 @@ def save_to_database(result: dict) -> bool:
         }).eq('id', manual_id).execute()
         return False
 
-    try:
-        markdown = result['markdown']
-        sections = result['sections']
-
-        # Calculate token estimate
-        total_tokens = len(markdown) // 4
-        word_count = len(markdown.split())
-
-        # Build TOC
-        toc = [{
-            'path': s['path'],
-            'title': s['title'],
-            'depth': s['depth'],
-            'token_count': len(s['content']) // 4
-        } for s in sections]
-
-        # Delete existing sections
-        supabase.table('manual_sections').delete().eq('manual_id', manual_id).execute()
-
-        # Insert sections
-        for section in sections:
-            keywords = extract_keywords(section['content'], section['title'])
-
-            supabase.table('manual_sections').insert({
-                'manual_id': manual_id,
-                'section_path': section['path'],
-                'section_title': section['title'],
-                'depth': section['depth'],
-                'sort_order': int(section['path'].split('.')[-1]) if '.' in section['path'] else int(section['path']),
-                'content_markdown': section['content'],
-                'keywords': keywords
-            }).execute()
-
-        # Upsert full content
-        supabase.table('manual_content').upsert({
-            'manual_id': manual_id,
-            'content_markdown': markdown,
-            'table_of_contents': toc,
-            'total_word_count': word_count,
-            'total_char_count': len(markdown),
-            'total_token_count': total_tokens,
-            'extraction_method': 'marker-pdf',
-            'extraction_quality': 0.95,
-            'extracted_at': datetime.utcnow().isoformat()
-        }, on_conflict='manual_id').execute()
-
-        # Update manual status
-        supabase.table('vehicle_manuals').update({
-            'content_status': 'extracted',
-            'content_extracted_at': datetime.utcnow().isoformat()
-        }).eq('id', manual_id).execute()
+    method = result.get('method', 'marker-pdf')
+    if result.get('extract_seconds') is not None:
+        events.emit('extract', manual_id, seconds=result['extract_seconds'], pages=result.get('pages'),
+                    extraction_method=method)
 
-        return True
+    try:
+        # Sections in payload-sized batches, then content + status in one transaction
+        with events.timed('upload', manual_id, extraction_method=method):
+            save_extraction(
+                supabase, manual_id, result['markdown'], result['sections'],
+                extraction_method=method,
+                lease_token=lease_token,
+                extraction_quality=0.95,
+            )
 
     except Exception as e:
+        events.failed(manual_id, 'upload', e)
         supabase.table('vehicle_manuals').update({
             'content_status': 'failed',
             'error_message': str(e)
         }).eq('id', manual_id).execute()
         return False
 
+    # Fan the result out to other manuals sharing the same PDF
+    if result.get('pdf_sha256'):
+        try:
+            duplicates = save_duplicates(
+                supabase, manual_id, result['pdf_sha256'], result['markdown'], result['sections'],
+                extraction_method=result.get('method', 'marker-pdf'),
+                extraction_quality=0.95,
+            )
+            if duplicates:
+                print(f"   ↳ also saved to {len(duplicates)} manuals sharing this PDF")
+        except Exception as e:
+            print(f"   ⚠️  Duplicate fan-out failed: {str(e)[:80]}")
+    return True
+
+
 
-def process_batch(manuals: list, workers: int = 2):
+def process_batch(manuals: list, workers: int = 2, marker_socket: Optional[str] = None, tiered: bool = False,
+                  use_cache: bool = True):
     """Process a batch of manuals in parallel"""
     total = len(manuals)
     succeeded = 0
@@ -367,38 +351,256 @@ def process_batch(manuals: list, workers: int = 2):
 
     print(f"\n🚀 Processing {total} manuals with {workers} workers...\n")
 
-    # Mark all as extracting
-    for manual in manuals:
-        supabase.table('vehicle_manuals').update({
-            'content_status': 'extracting'
-        }).eq('id', manual['id']).execute()
+    # One root span per manual; pool workers parent their spans to it
+    roots = {m['id']: start_span('manual', manual_id=m['id'], manual=f"{m['year']} {m['make']} {m['model']}")
+             for m in manuals}
 
-    with ProcessPoolExecutor(max_workers=workers) as executor:
-        futures = {executor.submit(process_single_pdf, m): m for m in manuals}
+    # Heartbeat leases from the parent while marker_single runs in the pool
+    with LeaseHeartbeat(supabase, manuals), ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_single_pdf, {**m, 'trace': roots[m['id']].context()},
+                            marker_socket, tiered, use_cache): m
+            for m in manuals
+        }
 
         for i, future in enumerate(as_completed(futures), 1):
             manual = futures[future]
             name = f"{manual['year']} {manual['make']} {manual['model']}"
+            root = roots[manual['id']]
 
             try:
                 result = future.result()
 
                 if result['success']:
-                    if save_to_database(result):
+                    with span('upload', parent=root):
+                        saved = save_to_database(result, lease_token=manual.get('lease_token'))
+                    if saved:
                         succeeded += 1
-                        print(f"✅ [{i}/{total}] {name} - {result['num_sections']} sections, {result['char_count']:,} chars")
+                        cached = " (cached extraction)" if result.get('cached') else ""
+                        print(f"✅ [{i}/{total}] {name} - {result['num_sections']} sections, {result['char_count']:,} chars{cached}")
+                        if result.get('tiers'):
+                            print(f"     {result['tiers']}")
                     else:
                         failed += 1
+                        root.fail('DB save failed')
                         print(f"❌ [{i}/{total}] {name} - DB save failed")
                 else:
                     failed += 1
+                    root.fail(result.get('error', 'Unknown error'))
                     print(f"❌ [{i}/{total}] {name} - {result.get('error', 'Unknown error')[:80]}")
                     save_to_database(result)
 
             except Exception as e:
                 failed += 1
+                root.fail(str(e))
                 print(f"❌ [{i}/{total}] {name} - Exception: {str(e)[:80]}")
+            root.end()
+
+    return succeeded, failed
+
+
+def process_sharded_batch(manuals: list, workers: int = 2, shard_pages: int = 50,
+                          marker_socket: Optional[str] = None, use_cache: bool = True):
+    """
+    Process a batch of manuals split into page-range shards.
 
+    Shards from every manual in the batch share one pool, so a 400-page
+    manual is spread across all workers instead of occupying a single slot.
+    Each manual is stitched and saved as soon as its last shard finishes.
+    """
+    total = len(manuals)
+    succeeded = 0
+    failed = 0
+    done = 0
+
+    print(f"\n🚀 Processing {total} manuals in {shard_pages}-page shards with {workers} workers...\n")
+
+    # Stitched output depends on where the shard boundaries fall
+    shard_options = {'shard_pages': shard_pages, **cache_options(marker_socket, MARKER_OPTIONS)}
+
+    def save_stitched(manual, markdown_content, pdf_sha256, done, total, shards=0, cached=False):
+        name = f"{manual['year']} {manual['make']} {manual['model']}"
+        sections = parse_sections(markdown_content)
+        result = {
+            'id': manual['id'],
+            'success': True,
+            'name': name,
+            'markdown': markdown_content,
+            'sections': sections,
+            'num_sections': len(sections),
+            'char_count': len(markdown_content),
+            'pdf_sha256': pdf_sha256,
+        }
+        if not save_to_database(result, lease_token=manual.get('lease_token')):
+            print(f"❌ [{done}/{total}] {name} - DB save failed")
+            return False
+        source = "cached extraction" if cached else f"{shards} shards"
+        print(f"✅ [{done}/{total}] {name} - {source}, "
+              f"{result['num_sections']} sections, {result['char_count']:,} chars")
+        return True
+
+    with LeaseHeartbeat(supabase, manuals), ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        parts = {}
+        hashes = {}
+        for manual in manuals:
+            name = f"{manual['year']} {manual['make']} {manual['model']}"
+            try:
+                pdf_path = find_local_pdf(manual)
+                if not pdf_path:
+                    raise Exception('PDF not found locally')
+                hashes[manual['id']] = hash_file(pdf_path)
+                if use_cache:
+                    cached = extraction_cache.get(hashes[manual['id']], 'marker', MARKER_VERSION, shard_options)
+                    if cached is not None:
+                        done += 1
+                        if save_stitched(manual, cached, hashes[manual['id']], done, total, cached=True):
+                            succeeded += 1
+                        else:
+                            failed += 1
+                        continue
+                shards = plan_shards(page_count(pdf_path), shard_pages)
+                if not shards:
+                    raise Exception('PDF has no pages')
+            except Exception as e:
+                done += 1
+                failed += 1
+                print(f"❌ [{done}/{total}] {name} - {str(e)[:80]}")
+                save_to_database({'id': manual['id'], 'success': False, 'error': str(e)})
+                continue
+
+            parts[manual['id']] = [None] * len(shards)
+            # Kept apart from whole-PDF output so process_single_pdf never picks up a shard
+            output_subdir = OUTPUT_DIR / 'shards' / output_dir_for(manual).name
+            for index, (start, end) in enumerate(shards):
+                future = executor.submit(process_pdf_shard, pdf_path, output_subdir, start, end, marker_socket,
+                                         manual['id'])
+                futures[future] = (manual, index)
+
+        for future in as_completed(futures):
+            manual, index = futures[future]
+            manual_parts = parts.get(manual['id'])
+            if manual_parts is None:
+                continue  # An earlier shard already failed this manual
+
+            name = f"{manual['year']} {manual['make']} {manual['model']}"
+            try:
+                manual_parts[index] = future.result()
+            except Exception as e:
+                del parts[manual['id']]
+                done += 1
+                failed += 1
+                error = 'Shard timed out' if isinstance(e, subprocess.TimeoutExpired) else str(e)
+                print(f"❌ [{done}/{total}] {name} - {error[:80]}")
+                save_to_database({'id': manual['id'], 'success': False, 'error': error})
+                continue
+
+            if any(part is None for part in manual_parts):
+                continue
+
+            del parts[manual['id']]
+            done += 1
+            markdown_content = stitch_markdown(manual_parts)
+            extraction_cache.put(hashes[manual['id']], 'marker', markdown_content, MARKER_VERSION, shard_options)
+            if save_stitched(manual, markdown_content, hashes[manual['id']], done, total, shards=len(manual_parts)):
+                succeeded += 1
+            else:
+                failed += 1
+
+    return succeeded, failed
+
+
+def fetch_pdf(manual: dict) -> dict:
+    """Pipeline download stage: use the local copy, else fetch pdf_url into the PDF cache"""
+    pdf_path = find_local_pdf(manual)
+    if not pdf_path:
+        if not manual.get('pdf_url'):
+            raise FileNotFoundError('PDF not found locally and no pdf_url')
+        cache = PdfCache()
+        with events.timed('download', manual['id']) as fields, span('download', parent=manual.get('trace')) as s:
+            _, pdf_path = cache.get(manual['pdf_url'])
+            fields['bytes'] = cache.last_download['downloaded'] if cache.last_download else 0
+            s.set(bytes=fields['bytes'], cache_hit=cache.last_download is None)
+    return {**manual, 'pdf_path': pdf_path}
+
+
+def process_pipelined(args) -> tuple:
+    """
+    Overlap PDF downloads, extraction and database writes.
+
+    Manuals are claimed one at a time whenever a prefetch slot frees up, so
+    at most --prefetch PDFs wait ahead of the marker workers. Extraction
+    runs in a process pool of --workers; results are saved by a separate
+    upload thread so marker never waits on Supabase.
+    """
+    heartbeat = LeaseHeartbeat(supabase, [])
+    use_cache = not args.no_cache
+    attempted = set()
+    roots = {}
+
+    def claimed():
+        while args.limit is None or len(attempted) < args.limit:
+            manuals = get_pending_manuals(limit=1, attempted=attempted, tiered=args.tiered)
+            if not manuals:
+                return
+            manual = manuals[0]
+            attempted.add(manual['id'])
+            heartbeat.track(manuals)
+            # Stages run in other threads/processes, so each parents to this span explicitly
+            roots[manual['id']] = start_span('manual', manual_id=manual['id'],
+                                             manual=f"{manual['year']} {manual['make']} {manual['model']}")
+            yield {**manual, 'trace': roots[manual['id']].context()}
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        def extract(manual):
+            result = executor.submit(process_single_pdf, manual, args.marker_server, args.tiered, use_cache).result()
+            return manual, result
+
+        def upload(item):
+            manual, result = item
+            with span('upload', parent=manual['trace']):
+                return result, save_to_database(result, lease_token=manual.get('lease_token'))
+
+        pipeline = Pipeline([
+            Stage('download', fetch_pdf, workers=2, queue_size=args.prefetch),
+            Stage('extract', extract, workers=args.workers, queue_size=args.prefetch),
+            Stage('upload', upload, workers=1, queue_size=args.prefetch),
+        ], metrics_interval=300)
+
+        print(f"\n🚀 Pipelined extraction: {args.workers} workers, prefetch {args.prefetch}\n")
+        succeeded = failed = 0
+        with heartbeat:
+            for outcome in pipeline.run(claimed()):
+                if outcome['item'] is None:
+                    print(f"❌ Claim failed: {str(outcome['error'])[:80]}")
+                    continue
+
+                item = outcome['item']
+                manual = item[0] if isinstance(item, tuple) else item
+                name = f"{manual['year']} {manual['make']} {manual['model']}"
+                heartbeat.release([manual['id']])
+                root = roots.pop(manual['id'])
+
+                if outcome['error'] is not None:
+                    failed += 1
+                    print(f"❌ {name} - {outcome['stage']}: {str(outcome['error'])[:80]}")
+                    save_to_database({'id': manual['id'], 'success': False, 'error': str(outcome['error']),
+                                      'stage': outcome['stage']})
+                    root.end(error=outcome['error'])
+                    continue
+
+                result, saved = outcome['result']
+                if result['success'] and saved:
+                    succeeded += 1
+                    cached = " (cached extraction)" if result.get('cached') else ""
+                    print(f"✅ {name} - {result['num_sections']} sections, {result['char_count']:,} chars{cached}")
+                else:
+                    failed += 1
+                    root.fail(result.get('error', 'DB save failed'))
+                    print(f"❌ {name} - {result.get('error', 'DB save failed')[:80]}")
+                root.end()
+
+        print(f"\n📈 Pipeline stages:\n{format_metrics(pipeline.metrics())}")
     return succeeded, failed
 
 
@@ -408,8 +610,35 @@ def main():
     parser.add_argument('--limit', type=int, help='Limit number of files to process')
     parser.add_argument('--reprocess', action='store_true', help='Re-extract already processed files')
     parser.add_argument('--status', action='store_true', help='Show status only')
+    parser.add_argument('--shard-pages', type=int, default=0,
+                        help='Split each PDF into page-range shards of this size (default: off)')
+    parser.add_argument('--marker-server', nargs='?', const=DEFAULT_SOCKET, metavar='SOCKET',
+                        help=f'Convert through a running marker_server.py (default socket: {DEFAULT_SOCKET})')
+    parser.add_argument('--tiered', action='store_true',
+                        help='Extract with pymupdf first; send only failing/image-only pages to marker')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-extract even if this PDF was already extracted with the same extractor/options')
+    parser.add_argument('--prefetch', type=int, default=0, metavar='K',
+                        help='Pipeline mode: fetch up to K PDFs ahead of the workers and save results in the background')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Append per-stage timing spans (OTLP/JSON lines) to FILE; summarize with tracing.py')
     args = parser.parse_args()
 
+    if args.trace:
+        enable_tracing(args.trace)
+
+    if args.tiered and args.shard_pages:
+        parser.error('--tiered and --shard-pages cannot be combined')
+    if args.prefetch and (args.shard_pages or args.reprocess):
+        parser.error('--prefetch cannot be combined with --shard-pages or --reprocess')
+
+    def run_batch(manuals):
+        if args.shard_pages > 0:
+            return process_sharded_batch(manuals, workers=args.workers, shard_pages=args.shard_pages,
+                                         marker_socket=args.marker_server, use_cache=not args.no_cache)
+        return process_batch(manuals, workers=args.workers, marker_socket=args.marker_server, tiered=args.tiered,
+                             use_cache=not args.no_cache)
+
     print("📚 Marker-PDF Content Extraction")
     print("=" * 40)
 
@@ -419,20 +648,40 @@ def main():
     if args.status:
         return
 
-    # Create output directory
-    OUTPUT_DIR.mkdir(exist_ok=True)
-
-    # Get manuals to process
-    manuals = get_pending_manuals(limit=args.limit, reprocess=args.reprocess)
-
-    if not manuals:
-        print("✨ No manuals to process!")
+    if args.marker_server and not server_available(args.marker_server):
+        print(f"❌ No marker server on {args.marker_server}. Start one with: python marker_server.py")
         return
 
-    print(f"📋 Found {len(manuals)} manuals to process")
+    # Create output directory
+    OUTPUT_DIR.mkdir(exist_ok=True)
 
-    # Process in batches
-    succeeded, failed = process_batch(manuals, workers=args.workers)
+    if args.prefetch:
+        succeeded, failed = process_pipelined(args)
+        if succeeded + failed == 0:
+            print("✨ No manuals to process!")
+            return
+    else:
+        # Claim small batches so idle rows stay available to other runs
+        succeeded = failed = 0
+        attempted = set()
+        remaining = args.limit
+        while remaining is None or remaining > 0:
+            batch_size = args.workers * 2 if remaining is None else min(remaining, args.workers * 2)
+            manuals = get_pending_manuals(limit=batch_size, reprocess=args.reprocess, attempted=attempted,
+                                          tiered=args.tiered)
+            if not manuals:
+                break
+            attempted.update(m['id'] for m in manuals)
+            print(f"📋 Claimed {len(manuals)} manuals to process")
+            batch_succeeded, batch_failed = run_batch(manuals)
+            succeeded += batch_succeeded
+            failed += batch_failed
+            if remaining is not None:
+                remaining -= len(manuals)
+
+        if succeeded + failed == 0:
+            print("✨ No manuals to process!")
+            return
 
     print("\n" + "=" * 40)
     print("📊 EXTRACTION COMPLETE")
@@ -446,4 +695,5 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    with events:
+        main()
@@ -0,0 +1,102 @@
+"""
+On-disk memo of extraction results.
+
+marker takes 15-60 minutes per manual, and --reprocess / quality-test --fix
+re-run it on PDFs whose bytes have not changed. Results are stored
+gzip-compressed under a key built from:
+
+  - the PDF's SHA-256 (see pdf_cache.py)
+  - the extractor name ('marker', 'tiered', ...)
+  - the extractor version (installed package version)
+  - the options that change output (e.g. disable_image_extraction)
+
+so a new marker release or different flags miss the cache, and everything
+else (re-sectioning, re-scoring, re-uploading) reuses the stored markdown.
+
+    cache = ExtractionCache()
+    markdown = cache.get(pdf_sha256, 'marker', version, options)
+    if markdown is None:
+        markdown = run_marker(...)
+        cache.put(pdf_sha256, 'marker', markdown, version, options)
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from importlib import metadata
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_DIR = Path(os.getenv('EXTRACTION_CACHE_DIR', Path.home() / '.cache' / 'carintel' / 'extractions'))
+
+
+def package_version(*packages: str) -> str:
+    """Installed versions of the given packages, e.g. 'marker-pdf==1.2.3'"""
+    versions = []
+    for package in packages:
+        try:
+            versions.append(f"{package}=={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{package}==unknown")
+    return ','.join(versions)
+
+
+class ExtractionCache:
+    """gzip-compressed markdown keyed by PDF hash, extractor, version and options"""
+
+    def __init__(self, root: Path = DEFAULT_CACHE_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(pdf_sha256: str, extractor: str, version: str, options: Optional[dict] = None) -> str:
+        payload = json.dumps({
+            'pdf': pdf_sha256,
+            'extractor': extractor,
+            'version': version,
+            'options': options or {},
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.md.gz"
+
+    def get(self, pdf_sha256: str, extractor: str, version: str,
+            options: Optional[dict] = None) -> Optional[str]:
+        """Return cached markdown, or None on a miss"""
+        path = self._path(self.key(pdf_sha256, extractor, version, options))
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError):
+            # Truncated/corrupt entry; drop it and re-extract
+            path.unlink(missing_ok=True)
+            return None
+
+    def put(self, pdf_sha256: str, extractor: str, markdown: str, version: str,
+            options: Optional[dict] = None) -> Path:
+        """Store markdown for this PDF/extractor/version/options"""
+        key = self.key(pdf_sha256, extractor, version, options)
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.part')
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+            f.write(markdown.encode('utf-8'))
+        os.replace(tmp_path, path)
+
+        # Sidecar describing the entry, for inspection and cleanup
+        path.with_suffix('').with_suffix('.json').write_text(json.dumps({
+            'pdf_sha256': pdf_sha256,
+            'extractor': extractor,
+            'version': version,
+            'options': options or {},
+            'chars': len(markdown),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }, indent=2))
+        return path
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Extraction progress counts in one round-trip.
+
+Reads the trigger-maintained counters behind the get_extraction_status RPC
+(migration 20251213000005_add_extraction_status_counts.sql) instead of one
+count='exact' query per status, so polling stays cheap as the table grows.
+
+    counts = get_extraction_status(supabase)
+    counts['pending'], counts['extracted'], counts['total']
+    counts['methods']['docling-modal-gpu']
+
+    python extraction_status.py           # All counts as JSON
+    python extraction_status.py pending   # Just one number (for shell scripts)
+"""
+
+import json
+import os
+import sys
+
+STATUSES = ('pending', 'extracting', 'extracted', 'failed')
+
+
+def get_extraction_status(supabase) -> dict:
+    """
+    Counts per content_status (every status key present, 0 if none), plus
+    'total' (all manuals) and 'methods' (manual_content rows per extraction_method).
+    """
+    data = supabase.rpc('get_extraction_status', {}).execute().data or {}
+    statuses = data.get('content_status') or {}
+
+    counts = {status: statuses.get(status, 0) for status in STATUSES}
+    counts['total'] = data.get('total', sum(statuses.values()))
+    counts['methods'] = data.get('extraction_method') or {}
+    return counts
+
+
+def refresh_extraction_status(supabase):
+    """Recount from scratch (repairs the counters if they are ever in doubt)"""
+    supabase.rpc('refresh_extraction_status_counts', {}).execute()
+
+
+def main():
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    supabase = create_client(
+        os.getenv('SUPABASE_URL', 'https://jxpbnnmefwtazfvoxvge.supabase.co'),
+        os.getenv('SUPABASE_SERVICE_KEY')
+    )
+
+    if '--refresh' in sys.argv:
+        refresh_extraction_status(supabase)
+
+    counts = get_extraction_status(supabase)
+    fields = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if fields:
+        print(counts[fields[0]])
+    else:
+        print(json.dumps(counts, indent=2))
+
+
+if __name__ == '__main__':
+    main()
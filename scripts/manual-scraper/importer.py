@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Shared async import engine for the VHR / Tesla manual importers.
+
+import_vhr_gm.py, import_vhr_kia.py, import_tesla.py and
+fix_mismatched_vhr.py are manifests: a list of jobs plus a title. This
+module does the work for all of them concurrently:
+
+  - one httpx.AsyncClient with pooled connections
+  - a per-host concurrency limit (semaphore) and a per-host token bucket,
+    instead of a fixed time.sleep(1) between manuals
+  - PDFs are streamed from the source straight into Supabase Storage as
+    resumable TUS uploads (storage_upload.py), so a manual never has to fit
+    in memory or on disk and an interrupted transfer continues where it
+    stopped
+  - each unique PDF is stored once, at pdf/ab/<sha256>.pdf; rows sharing a
+    source URL or identical bytes point at the same object
+  - database reads/writes (supabase-py is synchronous) run in threads
+
+A job is a dict:
+
+    {'year': 2021, 'make': 'Kia', 'model': 'K5',
+     'source_url': 'https://vhr.../2021_kia_K5_Owner%27s%20Manual.pdf',
+     'action': 'add'}
+
+Actions:
+    add      insert a new vehicle_manuals row
+    replace  point an existing row at the new PDF and queue re-extraction
+    fix      like replace, but only for rows flagged year_mismatch
+    upload   existing row; copy its PDF into our storage, keep content
+    sync     add if missing, upload if the row has no storage copy, else skip
+
+Usage from a manifest script:
+
+    from importer import run_cli
+    run_cli("VHR Kia Manual Importer", JOBS)
+
+    python import_vhr_kia.py                     # Dry run (HEAD only)
+    python import_vhr_kia.py --run               # Import
+    python import_vhr_kia.py --run --per-host 6 --rate 4
+
+Any importer (or importer.py itself) can run a manifest written by
+vhr_scanner.py instead of its built-in list:
+
+    python importer.py --manifest vhr_manifest.json --run
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+from supabase import create_client
+
+from storage_upload import StreamHasher, TusUploader, UploadError, staging_path
+
+SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://jxpbnnmefwtazfvoxvge.supabase.co')
+BUCKET = 'vehicle_manuals'
+
+DEFAULT_PER_HOST = 4       # concurrent requests per host
+DEFAULT_RATE = 2.0         # requests/second per source host (token bucket refill)
+DEFAULT_BURST = 4          # token bucket capacity
+TIMEOUT = httpx.Timeout(30.0, read=300.0)
+
+ACTIONS = ('add', 'replace', 'fix', 'upload', 'sync')
+
+
+def load_service_key() -> str:
+    """SUPABASE_SERVICE_KEY from the environment, else from the .env next to this script"""
+    key = os.getenv('SUPABASE_SERVICE_KEY')
+    if key:
+        return key
+    env_content = (Path(__file__).parent / '.env').read_text()
+    return env_content.split('SUPABASE_SERVICE_KEY=')[1].split('\n')[0].strip()
+
+
+def get_public_url(storage_path: str) -> str:
+    """Get public URL for storage path."""
+    return f"{SUPABASE_URL}/storage/v1/object/public/{BUCKET}/{storage_path}"
+
+
+def storage_fields(stored: dict) -> dict:
+    """vehicle_manuals columns pointing a row at a stored (hash-keyed) PDF"""
+    return {
+        'pdf_url': get_public_url(stored['path']),
+        'pdf_size_bytes': stored['size'],
+        'pdf_storage_path': stored['path'],
+        'pdf_sha256': stored['sha'],
+    }
+
+
+def job_name(job: dict) -> str:
+    return f"{job['year']} {job['make']} {job['model']}"
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Importer:
+    """Runs import jobs concurrently with per-host limits; see module docstring"""
+
+    def __init__(self, dry_run: bool = True, per_host: int = DEFAULT_PER_HOST,
+                 rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.dry_run = dry_run
+        self.per_host = per_host
+        self.rate = rate
+        self.burst = burst
+        self.service_key = load_service_key()
+        self.supabase = create_client(SUPABASE_URL, self.service_key)
+        self.storage_host = urlsplit(SUPABASE_URL).netloc
+        self._semaphores = {}
+        self._buckets = {}
+        self.client = None
+        self.uploader = None
+        self._stored = {}
+
+    def _limits(self, url: str) -> tuple:
+        """(semaphore, token bucket or None) for url's host. Our own storage isn't rate limited."""
+        host = urlsplit(url).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.per_host)
+            if host != self.storage_host:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._semaphores[host], self._buckets.get(host)
+
+    async def _polite(self, url: str):
+        _, bucket = self._limits(url)
+        if bucket:
+            await bucket.acquire()
+
+    async def head(self, url: str) -> dict:
+        """Get PDF size via HEAD request."""
+        semaphore, _ = self._limits(url)
+        async with semaphore:
+            await self._polite(url)
+            try:
+                resp = await self.client.head(url, follow_redirects=True)
+            except httpx.HTTPError as e:
+                return {'exists': False, 'error': str(e)}
+        if resp.status_code == 200:
+            return {'exists': True, 'size': int(resp.headers.get('content-length', 0))}
+        return {'exists': False, 'status': resp.status_code}
+
+    async def transfer(self, source_url: str, size: int = 0) -> dict:
+        """
+        Stream source_url into Storage once per unique PDF. Returns {'path', 'sha', 'size', 'reused'}.
+
+        The PDF is uploaded to a staging object (resumable TUS upload; see
+        storage_upload.py), hashed on the way through, then moved to its
+        hash-keyed path, or dropped if that PDF is already stored. Holds one
+        slot on both the source host and the storage host for the duration.
+        """
+        source_semaphore, _ = self._limits(source_url)
+        storage_semaphore, _ = self._limits(SUPABASE_URL)
+        staged = staging_path(source_url)
+        hasher = StreamHasher()
+        async with source_semaphore, storage_semaphore:
+            copied = await self.uploader.upload_from_url(
+                source_url, staged, size=size,
+                before_request=lambda: self._polite(source_url),
+                on_chunk=hasher.update,
+            )
+            sha, path, reused = await self.uploader.store_by_hash(staged, hasher.hexdigest(copied))
+        return {'path': path, 'sha': sha, 'size': copied, 'reused': reused}
+
+    async def store(self, source_url: str, size: int = 0) -> dict:
+        """
+        Stored PDF for source_url: an existing row's object if this URL was
+        imported before, else transfer() it (once per run, even if several
+        jobs share the URL).
+        """
+        if source_url not in self._stored:
+            async def lookup_or_transfer():
+                previous = await self.db(self._find_by_source, source_url)
+                if previous:
+                    return {'path': previous['pdf_storage_path'], 'sha': previous['pdf_sha256'],
+                            'size': previous['pdf_size_bytes'], 'reused': True}
+                return await self.transfer(source_url, size)
+            self._stored[source_url] = asyncio.ensure_future(lookup_or_transfer())
+        return await self._stored[source_url]
+
+    async def db(self, fn, *args):
+        """Run a blocking supabase-py call in a worker thread"""
+        return await asyncio.to_thread(fn, *args)
+
+    def _find_existing(self, job: dict) -> Optional[dict]:
+        existing = self.supabase.table('vehicle_manuals').select(
+            'id, pdf_storage_path, pdf_year, year_mismatch'
+        ).eq('make', job['make']).eq('model', job['model']).eq('year', job['year']).execute()
+        return existing.data[0] if existing.data else None
+
+    def _find_by_source(self, source_url: str) -> Optional[dict]:
+        """A row already holding a hash-keyed copy of source_url's PDF"""
+        rows = self.supabase.table('vehicle_manuals').select(
+            'pdf_storage_path, pdf_sha256, pdf_size_bytes'
+        ).eq('source_url', source_url).like('pdf_storage_path', 'pdf/%').not_.is_(
+            'pdf_sha256', 'null'
+        ).limit(1).execute()
+        return rows.data[0] if rows.data else None
+
+    def _insert(self, job: dict, stored: dict):
+        self.supabase.table('vehicle_manuals').insert({
+            'year': job['year'],
+            'make': job['make'],
+            'model': job['model'],
+            'variant': None,
+            'source_url': job['source_url'],
+            **storage_fields(stored),
+            'content_status': 'pending',
+            'year_mismatch': False,
+            'pdf_year': job['year'],
+        }).execute()
+
+    def _replace(self, record_id: str, stored: dict, year: int):
+        self.supabase.table('vehicle_manuals').update({
+            **storage_fields(stored),
+            'year_mismatch': False,
+            'pdf_year': year,
+            'content_status': 'pending',  # Re-extract with correct PDF
+        }).eq('id', record_id).execute()
+
+        # Delete old extracted content so it gets re-extracted
+        self.supabase.table('manual_content').delete().eq('manual_id', record_id).execute()
+        self.supabase.table('manual_sections').delete().eq('manual_id', record_id).execute()
+
+    def _set_storage(self, record_id: str, stored: dict):
+        # Keep extracted content; only the PDF location changes
+        self.supabase.table('vehicle_manuals').update(storage_fields(stored)).eq('id', record_id).execute()
+
+    async def import_one(self, job: dict) -> str:
+        """Import a single job. Returns 'ok', 'skipped' or 'failed'."""
+        name = job_name(job)
+        action = job['action']
+        prefix = f"{'[DRY RUN] ' if self.dry_run else ''}[{name}]"
+
+        def log(message: str):
+            print(f"{prefix} {message}")
+
+        existing = None
+        if action != 'add':
+            existing = await self.db(self._find_existing, job)
+            if action == 'sync':
+                if existing and existing.get('pdf_storage_path'):
+                    log("SKIP: Already in database with storage")
+                    return 'skipped'
+                action = 'upload' if existing else 'add'
+            elif not existing:
+                log("No existing record found!")
+                return 'skipped' if action == 'fix' else 'failed'
+            elif action == 'fix' and not existing.get('year_mismatch'):
+                log("SKIP: Not marked as mismatched")
+                return 'skipped'
+
+        info = await self.head(job['source_url'])
+        if not info['exists']:
+            log(f"SKIP: source doesn't have this ({info}) {job['source_url']}")
+            return 'failed'
+
+        size_mb = info['size'] / 1024 / 1024
+        if self.dry_run:
+            log(f"Would {action} ({size_mb:.1f} MB) from {job['source_url']}")
+            return 'ok'
+
+        start = time.time()
+        try:
+            stored = await self.store(job['source_url'], info['size'])
+        except (httpx.HTTPError, UploadError) as e:
+            log(f"Transfer failed: {e}")
+            return 'failed'
+        seconds = time.time() - start
+        if stored['reused']:
+            log(f"PDF already stored as {stored['path']}")
+        else:
+            log(f"Streamed {stored['size'] / 1024 / 1024:.1f} MB to {stored['path']} in {seconds:.1f}s")
+
+        try:
+            if action == 'add':
+                await self.db(self._insert, job, stored)
+                log("Added to database")
+            elif action in ('replace', 'fix'):
+                await self.db(self._replace, existing['id'], stored, job['year'])
+                log(f"Replaced PDF, queued re-extraction (id={existing['id']})")
+            else:
+                await self.db(self._set_storage, existing['id'], stored)
+                log(f"Uploaded and updated record (id={existing['id']})")
+        except Exception as e:
+            log(f"DB write failed: {e}")
+            return 'failed'
+        return 'ok'
+
+    async def run(self, jobs: list) -> dict:
+        """Import all jobs concurrently. Returns {'ok': n, 'skipped': n, 'failed': n}."""
+        counts = {'ok': 0, 'skipped': 0, 'failed': 0}
+        limits = httpx.Limits(max_connections=self.per_host * 4, max_keepalive_connections=self.per_host * 4)
+        # identity: Content-Length must describe the bytes we forward to storage
+        async with httpx.AsyncClient(timeout=TIMEOUT, limits=limits,
+                                     headers={'Accept-Encoding': 'identity'}) as self.client:
+            self.uploader = TusUploader(self.client, SUPABASE_URL, self.service_key, BUCKET)
+            async def guarded(job):
+                try:
+                    return await self.import_one(job)
+                except Exception as e:
+                    print(f"[{job_name(job)}] Failed: {e}")
+                    return 'failed'
+
+            for status in await asyncio.gather(*(guarded(job) for job in jobs)):
+                counts[status] += 1
+        return counts
+
+
+def load_manifest(path: Path) -> list:
+    """Jobs from a manifest file: a JSON list of jobs or {'jobs': [...]} (vhr_scanner.py output)"""
+    data = json.loads(Path(path).read_text())
+    return data['jobs'] if isinstance(data, dict) else data
+
+
+def run_cli(title: str, jobs: list, argv: Optional[list] = None):
+    """Entry point shared by the manifest scripts"""
+    parser = argparse.ArgumentParser(description=title)
+    parser.add_argument('--run', action='store_true', help='Actually import (default is a dry run)')
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST,
+                        help=f'Concurrent requests per host (default: {DEFAULT_PER_HOST})')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'Requests/second per source host (default: {DEFAULT_RATE})')
+    parser.add_argument('--manifest', type=Path,
+                        help='Import the jobs in this manifest (e.g. from vhr_scanner.py) instead of the built-in list')
+    args = parser.parse_args(argv)
+
+    if args.manifest:
+        jobs = load_manifest(args.manifest)
+        title = f"{title} - manifest {args.manifest.name}"
+    elif not jobs:
+        parser.error('--manifest is required')
+
+    for job in jobs:
+        if job['action'] not in ACTIONS:
+            raise ValueError(f"{job_name(job)}: unknown action {job['action']!r}")
+
+    dry_run = not args.run
+
+    print("=" * 70)
+    print(title)
+    print("=" * 70)
+
+    if dry_run:
+        print("\nDRY RUN MODE - No changes will be made")
+        print("Run with --run to actually import\n")
+    else:
+        print("\nLIVE MODE - Will stream manuals into storage\n")
+
+    print(f"Manuals to process: {len(jobs)}")
+    for action in ACTIONS:
+        count = sum(1 for job in jobs if job['action'] == action)
+        if count:
+            print(f"  - {action}: {count}")
+
+    by_make = {}
+    for job in jobs:
+        by_make[job['make']] = by_make.get(job['make'], 0) + 1
+    print("\nBy make:")
+    for make, count in sorted(by_make.items()):
+        print(f"  {make}: {count}")
+    print()
+
+    start = time.time()
+    importer = Importer(dry_run=dry_run, per_host=args.per_host, rate=args.rate)
+    counts = asyncio.run(importer.run(jobs))
+
+    print("\n" + "=" * 70)
+    print("SUMMARY")
+    print("=" * 70)
+    print(f"Success: {counts['ok']}")
+    print(f"Failed: {counts['failed']}")
+    print(f"Skipped: {counts['skipped']}")
+    print(f"Time: {time.time() - start:.1f}s")
+
+    if dry_run:
+        print("\nRun with --run to actually import these manuals")
+
+
+if __name__ == "__main__":
+    run_cli("Manifest Importer", [])
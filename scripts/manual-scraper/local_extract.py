@@ -9,20 +9,37 @@ Usage:
   python local_extract.py              # Extract 1 manual
   python local_extract.py --limit 10   # Extract up to 10 manuals
   python local_extract.py --continuous # Keep running until all done
+  python local_extract.py --marker-server  # Use a running marker_server.py
+  python local_extract.py --tiered     # pymupdf first, marker only on pages that need OCR
+  python local_extract.py --no-cache   # Ignore cached extractions of unchanged PDFs
+  python local_extract.py --continuous --prefetch 3  # Download the next 3 PDFs while extracting
+  python local_extract.py --trace traces.jsonl  # Record per-stage spans (summarize with tracing.py)
 """
 
 import os
-import re
 import sys
 import time
 import argparse
 import subprocess
 import tempfile
-import requests
 from pathlib import Path
 from dotenv import load_dotenv
 from supabase import create_client
 
+from bulk_writer import format_batch_stats, save_duplicates, save_extraction
+from downloader import format_download_stats
+from extraction_cache import ExtractionCache, package_version
+from marker_server import DEFAULT_SOCKET, cache_options, convert_pdf, server_available
+from pdf_cache import PdfCache
+from pdf_shards import page_count
+from pipeline import Pipeline, Stage, format_metrics
+from resource_monitor import marker_env
+from sections import parse_sections
+from telemetry import EventLog
+from tiered_extract import OCR_MARKER_OPTIONS, format_tier_stats, tiered_extract
+from tracing import enable as enable_tracing, span, start_span
+from work_queue import LeaseHeartbeat, claim_manuals
+
 load_dotenv()
 
 supabase = create_client(
@@ -30,248 +47,392 @@ supabase = create_client(
     os.getenv('SUPABASE_SERVICE_KEY')
 )
 
+pdf_cache = PdfCache()
+extraction_cache = ExtractionCache()
+events = EventLog(supabase)
 
-def parse_sections(markdown: str) -> list:
-    """Parse markdown into sections based on headers"""
-    sections = []
-    current_title = "Introduction"
-    current_content = []
-
-    for line in markdown.split("\n"):
-        header_match = re.match(r"^(#{1,3})\s+(.+)$", line)
-        if header_match:
-            if current_content:
-                sections.append({
-                    "title": current_title,
-                    "content": "\n".join(current_content).strip(),
-                })
-            current_title = header_match.group(2).strip()
-            current_content = []
-        else:
-            current_content.append(line)
+# marker_single flags that change output (part of the extraction cache key, see cache_options)
+MARKER_OPTIONS = {"disable_image_extraction": True, "paginate_output": True}
 
-    if current_content:
-        sections.append({
-            "title": current_title,
-            "content": "\n".join(current_content).strip(),
-        })
 
-    return sections
+def manual_name(manual: dict) -> str:
+    return f"{manual['year']} {manual['make']} {manual['model']}"
 
 
-def extract_manual(manual: dict) -> dict:
-    """Extract a single manual using marker-pdf locally"""
-    manual_id = manual["id"]
-    pdf_url = manual["pdf_url"]
-    year = manual["year"]
-    make = manual["make"]
-    model = manual["model"]
-    name = f"{year} {make} {model}"
+def extraction_method(job: dict) -> str:
+    return "tiered-marker-pdf-local" if job.get("tiered") else "marker-pdf-local"
 
-    try:
-        print(f"\n[START] {name}")
-        start_time = time.time()
 
-        # Mark as extracting
-        supabase.table("vehicle_manuals").update(
-            {"content_status": "extracting"}
-        ).eq("id", manual_id).execute()
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            pdf_path = Path(tmpdir) / "manual.pdf"
-            output_dir = Path(tmpdir) / "output"
-            output_dir.mkdir()
-
-            # Download PDF
-            print(f"  Downloading PDF...")
-            response = requests.get(pdf_url, timeout=300)
-            response.raise_for_status()
-            pdf_path.write_bytes(response.content)
-            pdf_size = pdf_path.stat().st_size / 1024 / 1024
-            print(f"  Downloaded {pdf_size:.1f} MB")
+def extractors(args) -> tuple:
+    """Extractor family this worker runs, for queue routing (see claim_manuals)"""
+    return ("tiered",) if args.tiered else ("marker",)
+
+
+def count_pages(pdf_path: Path):
+    try:
+        return page_count(pdf_path)
+    except Exception:
+        return None
+
+
+def run_marker(pdf_path: Path, output_dir: Path, timeout_seconds: int = 1200, manual_id: str = None) -> str:
+    """Run marker_single on a PDF (Metal GPU), streaming its progress, and return the markdown"""
+    extract_start = time.time()
+
+    # Set environment with GPU acceleration (tagged so resource_monitor.py can attribute usage)
+    env = marker_env(manual_id)
+    env["TORCH_DEVICE"] = "mps"  # Use Metal GPU on Mac
+
+    process = subprocess.Popen(
+        [
+            "marker_single",
+            str(pdf_path),
+            "--output_dir", str(output_dir),
+            "--output_format", "markdown",
+            "--disable_image_extraction",
+            "--paginate_output",  # Page separators, for per-page quality scores
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        env=env,
+    )
+
+    # Stream output with timeout check
+    import select
+    while True:
+        # Check if process has finished
+        if process.poll() is not None:
+            break
 
+        # Check timeout
+        elapsed = time.time() - extract_start
+        if elapsed > timeout_seconds:
+            process.kill()
+            raise Exception(f"Timeout after {elapsed/60:.1f} minutes")
+
+        # Read output if available (non-blocking)
+        ready, _, _ = select.select([process.stdout], [], [], 1.0)
+        if ready:
+            line = process.stdout.readline()
+            if line:
+                line = line.strip()
+                if line and ("%" in line or "page" in line.lower() or "Recognizing" in line):
+                    print(f"  {line[:80]}")
+                    sys.stdout.flush()
+
+    if process.returncode != 0:
+        raise Exception(f"marker-pdf failed with exit code {process.returncode}")
+
+    print(f"  Extraction completed in {time.time() - extract_start:.1f}s")
+
+    # Find output markdown
+    md_files = list(output_dir.rglob("*.md"))
+    if not md_files:
+        raise Exception("No markdown output generated")
+
+    return md_files[0].read_text()
+
+
+def fetch_stage(job: dict) -> dict:
+    """Download stage: make the manual's PDF available locally (content-addressed cache)"""
+    manual = job["manual"]
+    job["stage"] = "download"
+    print(f"  [{manual_name(manual)}] Fetching PDF...")
+    with events.timed("download", manual["id"]) as fields, span("download", parent=job["span"]) as download_span:
+        pdf_sha256, pdf_path = pdf_cache.get(manual["pdf_url"])
+        download = pdf_cache.last_download
+        fields["bytes"] = download["downloaded"] if download else 0
+        download_span.set(bytes=fields["bytes"], cache_hit=download is None)
+    if download:
+        print(f"  [{manual_name(manual)}] Downloaded {format_download_stats(download)}")
+    pdf_size = pdf_path.stat().st_size / 1024 / 1024
+    print(f"  [{manual_name(manual)}] Got {pdf_size:.1f} MB ({pdf_sha256[:12]})")
+
+    job["pdf_sha256"] = pdf_sha256
+    job["pdf_path"] = pdf_path
+    return job
+
+
+def extract_stage(job: dict) -> dict:
+    """
+    Extract stage: markdown for job's PDF.
+
+    With job["tiered"], pages are extracted with pymupdf first and only
+    failing or image-only pages go through marker. Unless job["use_cache"]
+    is False, a cached extraction of the same PDF bytes with the same
+    extractor version and options is reused instead of running marker again.
+    """
+    job["stage"] = "extract"
+    tiered = job.get("tiered", False)
+    marker_socket = job.get("marker_socket")
+    pdf_sha256 = job["pdf_sha256"]
+    pdf_path = job["pdf_path"]
+
+    extractor = "tiered" if tiered else "marker"
+    extractor_version = package_version("pymupdf4llm", "marker-pdf") if tiered else package_version("marker-pdf")
+    # Backend and the flags it actually runs with (a marker server reports its own)
+    options = cache_options(marker_socket, OCR_MARKER_OPTIONS if tiered else MARKER_OPTIONS)
+    cached = extraction_cache.get(pdf_sha256, extractor, extractor_version, options) \
+        if job.get("use_cache", True) else None
+
+    if cached is not None:
+        span_name = "extraction_cache"
+    else:
+        span_name = "tiered" if tiered else "marker_server" if marker_socket else "marker"
+    timed = events.timed("extract", job["manual"]["id"], extraction_method=extraction_method(job))
+    with timed as fields, span(span_name, parent=job["span"]) as extract_span, \
+            tempfile.TemporaryDirectory() as tmpdir:
+        fields["pages"] = count_pages(pdf_path)
+        output_dir = Path(tmpdir) / "output"
+        output_dir.mkdir()
+
+        if cached is not None:
+            print(f"  Reusing cached {extractor} extraction ({extractor_version})")
+            markdown_content = cached
+        elif tiered:
+            print(f"  Running tiered extraction (pymupdf, marker for failing pages)...")
+            env = marker_env(job["manual"]["id"])
+            env["TORCH_DEVICE"] = "mps"  # Use Metal GPU on Mac
+            markdown_content, tier_stats = tiered_extract(
+                pdf_path, output_dir, marker_socket=marker_socket, env=env, timeout=1200,
+            )
+            print(f"  {format_tier_stats(tier_stats)}")
+        elif marker_socket:
+            # Persistent marker server - models are already loaded
+            print(f"  Converting via marker server ({marker_socket})...")
+            extract_start = time.time()
+            markdown_content = convert_pdf(
+                pdf_path, marker_socket,
+                on_progress=lambda done, total: print(f"  {done}/{total} pages"),
+                timeout=1200,
+            )
+            print(f"  Extraction completed in {time.time() - extract_start:.1f}s")
+        else:
             # Run marker-pdf with 20 minute timeout
             print(f"  Running marker-pdf extraction (20 min timeout)...")
-            extract_start = time.time()
-            timeout_seconds = 1200  # 20 minutes
+            markdown_content = run_marker(pdf_path, output_dir, manual_id=job["manual"]["id"])
 
-            # Set environment with GPU acceleration
-            env = os.environ.copy()
-            env["TORCH_DEVICE"] = "mps"  # Use Metal GPU on Mac
+        print(f"  Got {len(markdown_content):,} chars of markdown")
 
-            process = subprocess.Popen(
-                [
-                    "marker_single",
-                    str(pdf_path),
-                    "--output_dir", str(output_dir),
-                    "--output_format", "markdown",
-                    "--disable_image_extraction",
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                env=env,
-            )
+        extract_span.set(pages=fields["pages"], chars=len(markdown_content))
+        if len(markdown_content) < 1000:
+            raise Exception(f"Output too short: {len(markdown_content)} chars")
 
-            # Stream output with timeout check
-            import select
-            while True:
-                # Check if process has finished
-                if process.poll() is not None:
-                    break
-
-                # Check timeout
-                elapsed = time.time() - extract_start
-                if elapsed > timeout_seconds:
-                    process.kill()
-                    raise Exception(f"Timeout after {elapsed/60:.1f} minutes")
-
-                # Read output if available (non-blocking)
-                ready, _, _ = select.select([process.stdout], [], [], 1.0)
-                if ready:
-                    line = process.stdout.readline()
-                    if line:
-                        line = line.strip()
-                        if line and ("%" in line or "page" in line.lower() or "Recognizing" in line):
-                            print(f"  {line[:80]}")
-                            sys.stdout.flush()
-
-            if process.returncode != 0:
-                raise Exception(f"marker-pdf failed with exit code {process.returncode}")
-
-            extract_time = time.time() - extract_start
-            print(f"  Extraction completed in {extract_time:.1f}s")
-
-            # Find output markdown
-            md_files = list(output_dir.rglob("*.md"))
-            if not md_files:
-                raise Exception("No markdown output generated")
-
-            markdown_content = md_files[0].read_text()
-            print(f"  Got {len(markdown_content):,} chars of markdown")
-
-            if len(markdown_content) < 1000:
-                raise Exception(f"Output too short: {len(markdown_content)} chars")
+    if cached is None:
+        extraction_cache.put(pdf_sha256, extractor, markdown_content, extractor_version, options)
 
-            # Parse sections
-            sections = parse_sections(markdown_content)
-            print(f"  Parsed {len(sections)} sections")
-
-            # Upload to Supabase
-            print(f"  Uploading to Supabase...")
-
-            # Delete existing content
-            supabase.table("manual_content").delete().eq("manual_id", manual_id).execute()
-            supabase.table("manual_sections").delete().eq("manual_id", manual_id).execute()
-
-            # Insert full content
-            supabase.table("manual_content").insert({
-                "manual_id": manual_id,
-                "content_markdown": markdown_content,
-                "total_char_count": len(markdown_content),
-                "total_word_count": len(markdown_content.split()),
-                "extraction_method": "marker-pdf-local",
-            }).execute()
-
-            # Mark as extracted
-            supabase.table("vehicle_manuals").update(
-                {"content_status": "extracted"}
-            ).eq("id", manual_id).execute()
-
-            # Insert sections
-            for i, section in enumerate(sections):
-                if not section["content"].strip():
-                    continue
-                try:
-                    supabase.table("manual_sections").insert({
-                        "manual_id": manual_id,
-                        "section_path": str(i + 1),
-                        "section_title": section["title"],
-                        "sort_order": i,
-                        "depth": 1,
-                        "content_markdown": section["content"],
-                        "content_plain": section["content"],
-                        "char_count": len(section["content"]),
-                        "word_count": len(section["content"].split()),
-                    }).execute()
-                except Exception as e:
-                    print(f"  Warning: Section {i} failed: {str(e)[:50]}")
-
-            total_time = time.time() - start_time
-            print(f"[DONE] {name} - {len(markdown_content):,} chars, {len(sections)} sections in {total_time:.1f}s")
-
-            return {
-                "success": True,
-                "name": name,
-                "chars": len(markdown_content),
-                "sections": len(sections),
-                "time": total_time,
-            }
+    job["markdown"] = markdown_content
+    return job
 
-    except Exception as e:
+
+def upload_stage(job: dict) -> dict:
+    """Upload stage: parse sections and save them, plus manuals sharing the PDF"""
+    manual = job["manual"]
+    job["stage"] = "upload"
+    name = manual_name(manual)
+    markdown_content = job["markdown"]
+    method = extraction_method(job)
+
+    with span("upload", parent=job["span"]):
+        with events.timed("upload", manual["id"], extraction_method=method):
+            # Parse sections
+            with span("parse_sections") as parse_span:
+                sections = parse_sections(markdown_content)
+                parse_span.set(sections=len(sections))
+            print(f"  [{name}] Parsed {len(sections)} sections, uploading to Supabase...")
+
+            # Bulk-write sections, then save content and mark extracted in one transaction
+            saved = save_extraction(
+                supabase, manual["id"], markdown_content, sections,
+                extraction_method=method,
+                lease_token=manual.get("lease_token"),
+            )
+            print(f"  [{name}] Wrote {format_batch_stats(saved['batches'])}")
+
+        # Same PDF referenced by other manuals: reuse this extraction
+        duplicates = save_duplicates(
+            supabase, manual["id"], job["pdf_sha256"], markdown_content, sections,
+            extraction_method=method,
+        )
+    if duplicates:
+        print(f"  [{name}] Also saved to {len(duplicates)} manuals sharing this PDF: {', '.join(duplicates)}")
+
+    total_time = time.time() - job["started"]
+    job["span"].set(sections=len(sections), duplicates=len(duplicates))
+    job["span"].end()
+    print(f"[DONE] {name} - {len(markdown_content):,} chars, {len(sections)} sections in {total_time:.1f}s")
+
+    return {
+        "success": True,
+        "name": name,
+        "chars": len(markdown_content),
+        "sections": len(sections),
+        "time": total_time,
+    }
+
+
+def mark_failed(job: dict, error: Exception, stage: str = None) -> dict:
+    manual = job["manual"]
+    events.failed(manual["id"], stage, error)
+    with span("db.mark_failed", parent=job["span"]):
         supabase.table("vehicle_manuals").update(
             {"content_status": "failed"}
-        ).eq("id", manual_id).execute()
-
-        print(f"[FAIL] {name} - {str(e)[:100]}")
-        return {
-            "success": False,
-            "name": name,
-            "error": str(e),
-        }
+        ).eq("id", manual["id"]).execute()
+    job["span"].end(error=error)
+
+    name = manual_name(manual)
+    print(f"[FAIL] {name} - {str(error)[:100]}")
+    return {
+        "success": False,
+        "name": name,
+        "error": str(error),
+    }
+
+
+def new_job(manual: dict, marker_socket: str = None, tiered: bool = False, use_cache: bool = True) -> dict:
+    return {
+        "manual": manual,
+        "marker_socket": marker_socket,
+        "tiered": tiered,
+        "use_cache": use_cache,
+        "started": time.time(),
+        # Root span for this manual; each stage's span is a child, even across pipeline threads
+        "span": start_span("manual", manual_id=manual["id"], manual=manual_name(manual)),
+    }
+
+
+def extract_manual(manual: dict, marker_socket: str = None, tiered: bool = False,
+                   use_cache: bool = True) -> dict:
+    """
+    Extract a single manual using marker-pdf locally (or a marker server if marker_socket).
+
+    Runs the fetch, extract and upload stages back to back; see
+    run_pipeline() for the overlapped version used by --prefetch.
+    """
+    print(f"\n[START] {manual_name(manual)}")
+    job = new_job(manual, marker_socket, tiered, use_cache)
+    try:
+        return upload_stage(extract_stage(fetch_stage(job)))
+    except Exception as e:
+        return mark_failed(job, e, job.get("stage"))
+
+
+def run_pipeline(args) -> list:
+    """
+    --continuous --prefetch K: overlap downloads, extraction and uploads.
+
+    Manuals are claimed one at a time as prefetch slots free up, so at most
+    K PDFs are downloaded ahead of the extractor. Extraction (marker holds
+    the GPU) runs one manual at a time; uploads drain in the background.
+    """
+    heartbeat = LeaseHeartbeat(supabase, [])
+
+    def claimed():
+        while True:
+            manuals = claim_manuals(supabase, limit=1, extractors=extractors(args))
+            if not manuals:
+                print("\nNo pending manuals!")
+                return
+            heartbeat.track(manuals)
+            events.emit("claim", manuals[0]["id"])
+            print(f"\n[CLAIM] {manual_name(manuals[0])}")
+            yield new_job(manuals[0], args.marker_server, args.tiered, not args.no_cache)
+
+    pipeline = Pipeline([
+        Stage("download", fetch_stage, workers=args.download_workers, queue_size=args.prefetch),
+        Stage("extract", extract_stage, workers=1, queue_size=args.prefetch),
+        Stage("upload", upload_stage, workers=1, queue_size=args.prefetch),
+    ], metrics_interval=300)
+
+    results = []
+    with heartbeat:
+        for outcome in pipeline.run(claimed()):
+            job = outcome["item"]
+            if outcome["error"] is not None and job is None:
+                print(f"ERROR: claim failed: {str(outcome['error'])[:100]}")
+                continue
+            if outcome["error"] is not None:
+                print(f"  [{outcome['stage']}] failed")
+                results.append(mark_failed(job, outcome["error"], outcome["stage"]))
+            else:
+                results.append(outcome["result"])
+            heartbeat.release([job["manual"]["id"]])
+
+    print(f"\nPipeline stages:\n{format_metrics(pipeline.metrics())}")
+    return results
 
 
 def main():
     parser = argparse.ArgumentParser(description="Local PDF extraction")
     parser.add_argument("--limit", type=int, default=1, help="Number of manuals to extract")
     parser.add_argument("--continuous", action="store_true", help="Keep running until done")
+    parser.add_argument("--marker-server", nargs="?", const=DEFAULT_SOCKET, metavar="SOCKET",
+                        help=f"Convert through a running marker_server.py (default socket: {DEFAULT_SOCKET})")
+    parser.add_argument("--tiered", action="store_true",
+                        help="Extract with pymupdf first; send only failing/image-only pages to marker")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Re-extract even if this PDF was already extracted with the same extractor/options")
+    parser.add_argument("--prefetch", type=int, default=0, metavar="K",
+                        help="With --continuous: download up to K PDFs ahead while extracting, upload in the background")
+    parser.add_argument("--download-workers", type=int, default=2,
+                        help="Concurrent downloads in --prefetch mode")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Append per-stage timing spans (OTLP/JSON lines) to FILE")
     args = parser.parse_args()
 
-    # Check if marker_single is available
-    try:
-        subprocess.run(["marker_single", "--help"], capture_output=True, check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print("ERROR: marker_single not found. Install with: pip install marker-pdf")
-        return
+    if args.trace:
+        enable_tracing(args.trace)
 
-    # Random offset to avoid race conditions between instances
-    import random
+    if args.prefetch and not args.continuous:
+        parser.error("--prefetch requires --continuous")
 
-    while True:
-        # Get a random pending manual to avoid collisions between instances
-        # First get count, then pick random offset
-        count_result = supabase.table("vehicle_manuals").select(
-            "id", count="exact"
-        ).eq("content_status", "pending").execute()
-
-        total_pending = count_result.count or 0
-        if total_pending == 0:
-            print("\nNo pending manuals!")
-            break
+    if args.marker_server:
+        if not server_available(args.marker_server):
+            print(f"ERROR: no marker server on {args.marker_server}. Start one with: python marker_server.py")
+            return
+    else:
+        # Check if marker_single is available
+        try:
+            subprocess.run(["marker_single", "--help"], capture_output=True, check=True)
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            print("ERROR: marker_single not found. Install with: pip install marker-pdf")
+            return
 
-        offset = random.randint(0, max(0, total_pending - 1))
+    # Stage events for status.py, flushed in the background
+    with events:
+        run(args)
 
-        pending = supabase.table("vehicle_manuals").select(
-            "id, year, make, model, pdf_url"
-        ).eq("content_status", "pending").range(offset, offset).execute()
 
-        # If no results at offset, try from beginning
-        if not pending.data:
-            pending = supabase.table("vehicle_manuals").select(
-                "id, year, make, model, pdf_url"
-            ).eq("content_status", "pending").limit(args.limit).execute()
+def run(args):
+    if args.prefetch:
+        results = run_pipeline(args)
+        successful = [r for r in results if r["success"]]
+        print(f"\n{'='*50}")
+        print(f"Pipeline complete: {len(successful)} success, {len(results) - len(successful)} failed")
+        return
+
+    while True:
+        # Claim a batch atomically - claimed rows are already marked extracting,
+        # so concurrent instances never pick the same manual
+        pending = claim_manuals(supabase, limit=args.limit, extractors=extractors(args))
 
-        if not pending.data:
+        if not pending:
             print("\nNo pending manuals!")
             break
 
-        print(f"\nFound {len(pending.data)} pending manuals")
+        print(f"\nClaimed {len(pending)} pending manuals")
+        for manual in pending:
+            events.emit("claim", manual["id"])
 
+        # Keep the whole batch's leases alive while manuals wait their turn
         results = []
-        for manual in pending.data:
-            result = extract_manual(manual)
-            results.append(result)
+        with LeaseHeartbeat(supabase, pending):
+            for manual in pending:
+                result = extract_manual(manual, marker_socket=args.marker_server, tiered=args.tiered,
+                                        use_cache=not args.no_cache)
+                results.append(result)
 
         # Summary
         successful = [r for r in results if r["success"]]
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Persistent marker-pdf model server.
+
+marker_single reloads the layout, OCR and text models for every PDF, which
+on CPU workers costs more than converting a short manual. This server loads
+the models once and converts PDFs sent to it over a Unix socket, streaming
+back per-page progress and the final markdown.
+
+Usage:
+  python marker_server.py                          # Listen on /tmp/marker-server.sock
+  python marker_server.py --device mps             # Use Metal GPU on Mac
+  python marker_server.py --socket /tmp/m.sock     # Custom socket path
+
+Workers target it with --marker-server:
+  python local_extract.py --marker-server
+  python extract-marker.py --marker-server /tmp/m.sock
+
+Protocol (one JSON object per line):
+  request   {"pdf_path": "/abs/manual.pdf", "page_range": [0, 50]}   # page_range optional, end exclusive
+  response  {"event": "started"}                                  # conversion began (queue wait is over)
+            {"event": "progress", "pages_done": 10, "pages_total": 412}
+            ...
+            {"event": "done", "markdown": "...", "pages": 412, "seconds": 95.2}
+         or {"event": "error", "error": "..."}
+
+  request   {"op": "options"}
+  response  {"event": "options", "options": {"disable_image_extraction": true, ...}}
+
+The options are the server settings that change its output; workers put
+them in their extraction cache key (see cache_options()).
+
+Conversions run one at a time (the models share one lock); extra requests
+wait in line, so any number of workers can point at one server. Client
+timeouts (convert_pdf) start counting at the "started" event, so time spent
+queued behind other workers never times a request out.
+
+By default each PDF is converted in one pass, exactly like marker_single.
+--progress-pages N converts N pages at a time for progress updates; the
+stitched steps can differ slightly from a single pass (layout and headings
+are detected per step), so N is part of the server's cache options.
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+DEFAULT_SOCKET = '/tmp/marker-server.sock'
+# Pages converted per step, progress reported after each (0 = whole PDF in one pass)
+DEFAULT_PROGRESS_PAGES = 0
+
+
+class MarkerEngine:
+    """marker-pdf models loaded once, reused for every conversion"""
+
+    def __init__(self, disable_image_extraction: bool = True):
+        from marker.models import create_model_dict
+
+        start = time.time()
+        self.models = create_model_dict()
+        self.disable_image_extraction = disable_image_extraction
+        self.load_seconds = time.time() - start
+
+    def convert(self, pdf_path: Path, start: int = 0, end: Optional[int] = None,
+                progress_pages: int = DEFAULT_PROGRESS_PAGES,
+                on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """
+        Convert pages [start, end) of a PDF to markdown.
+
+        With progress_pages, pages are converted in steps of that many and
+        stitched back together, calling on_progress(pages_done, pages_total)
+        after each step; steps see less context than one pass, so the
+        markdown may differ. 0 converts the range in one pass.
+        """
+        from marker.converters.pdf import PdfConverter
+        from marker.output import text_from_rendered
+        from pdf_shards import page_count, plan_shards, stitch_markdown
+
+        if end is None:
+            end = page_count(pdf_path)
+        total = end - start
+
+        parts = []
+        for step_start, step_end in plan_shards(total, progress_pages or total):
+            converter = PdfConverter(
+                artifact_dict=self.models,
+                config={
+                    'output_format': 'markdown',
+                    'page_range': list(range(start + step_start, start + step_end)),
+                    'disable_image_extraction': self.disable_image_extraction,
+                    'paginate_output': True,  # Page separators, for per-page quality scores
+                },
+            )
+            text, _, _ = text_from_rendered(converter(str(pdf_path)))
+            parts.append(text)
+            if on_progress:
+                on_progress(step_end, total)
+
+        return stitch_markdown(parts)
+
+
+class MarkerRequestHandler(socketserver.StreamRequestHandler):
+    """Handle one client connection: read a request line, stream events back"""
+
+    def send(self, event: dict):
+        self.wfile.write((json.dumps(event) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        try:
+            request = json.loads(line)
+            if request.get('op') == 'options':
+                self.send({'event': 'options', 'options': self.server.options()})
+                return
+            pdf_path = Path(request['pdf_path'])
+            start, end = request.get('page_range') or (0, None)
+        except (ValueError, KeyError, TypeError) as e:
+            self.send({'event': 'error', 'error': f'Bad request: {e}'})
+            return
+
+        name = pdf_path.name
+        try:
+            with self.server.lock:
+                print(f"[START] {name}")
+                self.send({'event': 'started'})
+                started = time.time()
+
+                def progress(done, total):
+                    print(f"  {name}: {done}/{total} pages")
+                    self.send({'event': 'progress', 'pages_done': done, 'pages_total': total})
+
+                markdown = self.server.engine.convert(
+                    pdf_path, start, end,
+                    progress_pages=self.server.progress_pages,
+                    on_progress=progress,
+                )
+                elapsed = time.time() - started
+
+            print(f"[DONE] {name} - {len(markdown):,} chars in {elapsed:.1f}s")
+            self.send({'event': 'done', 'markdown': markdown, 'seconds': elapsed})
+
+        except (BrokenPipeError, ConnectionResetError):
+            print(f"[GONE] {name} - client disconnected")
+        except Exception as e:
+            print(f"[FAIL] {name} - {str(e)[:200]}")
+            try:
+                self.send({'event': 'error', 'error': str(e)})
+            except OSError:
+                pass
+
+
+class MarkerServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, engine: MarkerEngine, progress_pages: int):
+        self.engine = engine
+        self.progress_pages = progress_pages
+        self.lock = threading.Lock()
+        super().__init__(socket_path, MarkerRequestHandler)
+
+    def options(self) -> dict:
+        """Settings that change the markdown this server produces"""
+        return {
+            'disable_image_extraction': self.engine.disable_image_extraction,
+            'paginate_output': True,
+            'progress_pages': self.progress_pages,
+        }
+
+
+def server_available(socket_path: str = DEFAULT_SOCKET) -> bool:
+    """True if a marker server is listening on socket_path"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def server_options(socket_path: str = DEFAULT_SOCKET, timeout: float = 10) -> dict:
+    """Output-affecting settings of a running marker server"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(b'{"op": "options"}\n')
+        with sock.makefile('r', encoding='utf-8') as events:
+            event = json.loads(events.readline() or '{}')
+    if event.get('event') != 'options':
+        raise Exception(f"marker server: {event.get('error', 'no options in reply')}")
+    return event['options']
+
+
+def cache_options(marker_socket: Optional[str], cli_options: dict) -> dict:
+    """
+    Extraction cache options for the marker backend that will run: the
+    server's own settings with marker_socket, else the marker_single flags
+    the caller passes (cli_options).
+    """
+    if marker_socket:
+        return {'backend': 'marker_server', **server_options(marker_socket)}
+    return {'backend': 'marker_single', **cli_options}
+
+
+def convert_pdf(pdf_path: Path, socket_path: str = DEFAULT_SOCKET,
+                page_range: Optional[tuple] = None,
+                on_progress: Optional[Callable[[int, int], None]] = None,
+                timeout: Optional[float] = None) -> str:
+    """
+    Convert a PDF through a running marker server and return the markdown.
+
+    on_progress(pages_done, pages_total) is called as pages finish. timeout
+    bounds the wait for any single event once the server has started the
+    conversion; time queued behind other workers doesn't count. Raises on
+    server errors or if the connection drops.
+    """
+    request = {'pdf_path': str(Path(pdf_path).resolve())}
+    if page_range:
+        request['page_range'] = list(page_range)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        sock.settimeout(None)  # Queued: wait for our turn without a deadline
+
+        with sock.makefile('r', encoding='utf-8') as events:
+            for line in events:
+                event = json.loads(line)
+                if event['event'] == 'started':
+                    sock.settimeout(timeout)
+                elif event['event'] == 'progress':
+                    if on_progress:
+                        on_progress(event['pages_done'], event['pages_total'])
+                elif event['event'] == 'done':
+                    return event['markdown']
+                else:
+                    raise Exception(f"marker server: {event.get('error', 'unknown error')}")
+
+    raise Exception("marker server closed the connection without a result")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent marker-pdf model server")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Unix socket path (default: {DEFAULT_SOCKET})")
+    parser.add_argument("--device", help="TORCH_DEVICE for marker (cpu, cuda, mps)")
+    parser.add_argument("--progress-pages", type=int, default=DEFAULT_PROGRESS_PAGES,
+                        help=f"Pages per progress update (default: {DEFAULT_PROGRESS_PAGES}, 0 = whole PDF at once)")
+    parser.add_argument("--keep-images", action="store_true", help="Don't pass disable_image_extraction")
+    args = parser.parse_args()
+
+    # marker reads TORCH_DEVICE when its settings module is first imported
+    if args.device:
+        os.environ["TORCH_DEVICE"] = args.device
+
+    if server_available(args.socket):
+        print(f"ERROR: a marker server is already listening on {args.socket}")
+        sys.exit(1)
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+
+    print("Loading marker models...")
+    engine = MarkerEngine(disable_image_extraction=not args.keep_images)
+    print(f"Models loaded in {engine.load_seconds:.1f}s")
+
+    with MarkerServer(args.socket, engine, args.progress_pages) as server:
+        print(f"Listening on {args.socket}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nStopping...")
+        finally:
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ Usage:
     modal run modal_docling.py          # Test with 1 manual
     modal run modal_docling.py --limit 10  # Process 10 manuals
     modal run modal_docling.py --continuous  # Process all pending
+    modal run modal_docling.py --limit 20 --batch-size 5  # 5 manuals per container call
 """
 
 import modal
@@ -16,6 +17,16 @@ import os
 # Create Modal app
 app = modal.App("docling-extractor")
 
+A10G_HOURLY_COST = 0.60
+# Content-addressed PDF cache shared by all containers and runs (see pdf_cache.py)
+pdf_cache_volume = modal.Volume.from_name("carintel-pdf-cache", create_if_missing=True)
+PDF_CACHE_DIR = "/pdf-cache"
+PDF_CACHE_MAX_BYTES = 200 * 1024 ** 3
+
+# Manuals handed to a container per call; conversions run back to back
+# on the preloaded pipeline
+MANUALS_PER_CONTAINER = 4
+
 # Docker image with Docling and dependencies
 docling_image = (
     modal.Image.debian_slim(python_version="3.11")
@@ -38,176 +49,167 @@ docling_image = (
     .env({
         "OMP_NUM_THREADS": "4",
     })
+    .add_local_python_source("work_queue", "sections", "bulk_writer", "pdf_cache", "downloader", "tracing")
 )
 
 
-@app.function(
+def fetch_pdf(pdf_url: str) -> tuple:
+    """Get (sha256, path) for a PDF from the cache volume, downloading on a miss (caller commits)"""
+    from downloader import format_download_stats
+    from pdf_cache import PdfCache
+
+    cache = PdfCache(PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_BYTES)
+    result = cache.get(pdf_url)
+    if cache.last_download:
+        print(f"  Downloaded {format_download_stats(cache.last_download)}")
+    return result
+
+
+@app.cls(
     image=docling_image,
     gpu="A10G",  # Good balance of cost and performance
-    timeout=1800,  # 30 min max per manual
+    timeout=3600,  # Covers a whole batch of manuals
     retries=1,
     secrets=[modal.Secret.from_name("supabase-secrets")],
+    volumes={PDF_CACHE_DIR: pdf_cache_volume},
 )
-def extract_manual(manual: dict) -> dict:
-    """Extract a single manual using Docling with GPU acceleration."""
-    import tempfile
-    import time
-    import requests
-    from pathlib import Path
-    from supabase import create_client
-
-    manual_id = manual["id"]
-    pdf_url = manual["pdf_url"]
-    year = manual["year"]
-    make = manual["make"]
-    model = manual["model"]
-    name = f"{year} {make} {model}"
-
-    # Initialize Supabase
-    supabase = create_client(
-        os.environ["SUPABASE_URL"],
-        os.environ["SUPABASE_SERVICE_KEY"]
-    )
-
-    try:
-        print(f"[START] {name}")
-        start_time = time.time()
-
-        # Mark as extracting
-        supabase.table("vehicle_manuals").update(
-            {"content_status": "extracting"}
-        ).eq("id", manual_id).execute()
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            pdf_path = Path(tmpdir) / "manual.pdf"
-
-            # Download PDF
-            print(f"  Downloading PDF...")
-            response = requests.get(pdf_url, timeout=300)
-            response.raise_for_status()
-            pdf_path.write_bytes(response.content)
-            pdf_size = pdf_path.stat().st_size / 1024 / 1024
-            print(f"  Downloaded {pdf_size:.1f} MB")
-
-            # Run Docling extraction
-            print(f"  Running Docling extraction...")
-            extract_start = time.time()
-
-            from docling.document_converter import DocumentConverter
-
-            converter = DocumentConverter()
-            result = converter.convert(str(pdf_path))
-            markdown_content = result.document.export_to_markdown()
-
-            extract_time = time.time() - extract_start
-            print(f"  Extraction completed in {extract_time:.1f}s")
-            print(f"  Got {len(markdown_content):,} chars of markdown")
-
-            if len(markdown_content) < 1000:
-                raise Exception(f"Output too short: {len(markdown_content)} chars")
-
-            # Parse sections
-            sections = parse_sections(markdown_content)
-            print(f"  Parsed {len(sections)} sections")
-
-            # Upload to Supabase
-            print(f"  Uploading to Supabase...")
-
-            # Delete existing content
-            supabase.table("manual_content").delete().eq("manual_id", manual_id).execute()
-            supabase.table("manual_sections").delete().eq("manual_id", manual_id).execute()
-
-            # Insert full content
-            supabase.table("manual_content").insert({
-                "manual_id": manual_id,
-                "content_markdown": markdown_content,
-                "total_char_count": len(markdown_content),
-                "total_word_count": len(markdown_content.split()),
-                "extraction_method": "docling-modal-gpu",
-            }).execute()
-
-            # Mark as extracted
-            supabase.table("vehicle_manuals").update(
-                {"content_status": "extracted"}
-            ).eq("id", manual_id).execute()
-
-            # Insert sections in batch (much faster than one-by-one)
-            section_rows = []
-            for i, section in enumerate(sections):
-                if not section["content"].strip():
-                    continue
-                section_rows.append({
-                    "manual_id": manual_id,
-                    "section_path": str(i + 1),
-                    "section_title": section["title"][:255],  # Truncate if too long
-                    "sort_order": i,
-                    "depth": 1,
-                    "content_markdown": section["content"],
-                    "content_plain": section["content"],
-                    "char_count": len(section["content"]),
-                    "word_count": len(section["content"].split()),
-                })
-
-            # Batch insert in chunks of 100 to avoid payload limits
-            for chunk_start in range(0, len(section_rows), 100):
-                chunk = section_rows[chunk_start:chunk_start + 100]
-                try:
-                    supabase.table("manual_sections").insert(chunk).execute()
-                except Exception as e:
-                    print(f"  Warning: Batch insert failed: {str(e)[:50]}")
-
-            total_time = time.time() - start_time
-            print(f"[DONE] {name} - {len(markdown_content):,} chars, {len(sections)} sections in {total_time:.1f}s")
-
-            return {
-                "success": True,
-                "name": name,
-                "chars": len(markdown_content),
-                "sections": len(sections),
-                "time": total_time,
-            }
-
-    except Exception as e:
-        supabase.table("vehicle_manuals").update(
+class DoclingExtractor:
+    """
+    GPU container that builds the Docling pipeline once and converts
+    batches of manuals with it.
+
+    PDFs for a batch are downloaded concurrently up front and fed through
+    DocumentConverter.convert_all, so the GPU moves straight from one manual
+    to the next instead of waiting on downloads or model loads.
+    """
+
+    @modal.enter()
+    def load(self):
+        import time
+        from docling.datamodel.base_models import InputFormat
+        from docling.document_converter import DocumentConverter
+        from supabase import create_client
+
+        start = time.time()
+        self.converter = DocumentConverter()
+        # Build the PDF pipeline (and load its models) now, not on the first manual
+        self.converter.initialize_pipeline(InputFormat.PDF)
+        self.load_seconds = time.time() - start
+        self.load_reported = False
+        print(f"Docling pipeline ready in {self.load_seconds:.1f}s")
+
+        self.supabase = create_client(
+            os.environ["SUPABASE_URL"],
+            os.environ["SUPABASE_SERVICE_KEY"]
+        )
+
+    def mark_failed(self, manual: dict, error: str) -> dict:
+        name = f"{manual['year']} {manual['make']} {manual['model']}"
+        self.supabase.table("vehicle_manuals").update(
             {"content_status": "failed"}
-        ).eq("id", manual_id).execute()
+        ).eq("id", manual["id"]).execute()
 
-        print(f"[FAIL] {name} - {str(e)[:100]}")
+        print(f"[FAIL] {name} - {error[:100]}")
         return {
             "success": False,
             "name": name,
-            "error": str(e),
+            "error": error,
         }
 
+    @modal.method()
+    def extract_batch(self, manuals: list) -> dict:
+        """
+        Extract a batch of manuals.
+
+        Returns {'results': [...], 'seconds': busy time, 'load_seconds': model
+        load time (first batch in a container only)} for throughput reporting.
+        """
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from docling.datamodel.base_models import ConversionStatus
+        from bulk_writer import format_batch_stats, save_duplicates, save_extraction
+        from sections import parse_sections
+        from work_queue import LeaseHeartbeat
+
+        batch_start = time.time()
+        results = []
+
+        with LeaseHeartbeat(self.supabase, manuals):
+            # Fetch the whole batch concurrently (cache volume first) before touching the GPU
+            print(f"Fetching {len(manuals)} PDFs...")
+            ready = []
+            with ThreadPoolExecutor(max_workers=len(manuals) or 1) as pool:
+                futures = [(manual, pool.submit(fetch_pdf, manual["pdf_url"])) for manual in manuals]
+                for manual, future in futures:
+                    try:
+                        ready.append((manual, *future.result()))
+                    except Exception as e:
+                        results.append(self.mark_failed(manual, f"Download failed: {e}"))
+            pdf_cache_volume.commit()
+            print(f"Fetched {len(ready)} PDFs in {time.time() - batch_start:.1f}s")
+
+            # Convert back to back with the preloaded pipeline
+            extract_start = time.time()
+            conversions = self.converter.convert_all(
+                [pdf_path for _, _, pdf_path in ready],
+                raises_on_error=False,
+            )
+            for (manual, pdf_sha256, pdf_path), conversion in zip(ready, conversions):
+                manual_id = manual["id"]
+                name = f"{manual['year']} {manual['make']} {manual['model']}"
+                extract_time = time.time() - extract_start
 
-def parse_sections(markdown: str) -> list:
-    """Parse markdown into sections based on headers."""
-    import re
+                try:
+                    if conversion.status not in (ConversionStatus.SUCCESS, ConversionStatus.PARTIAL_SUCCESS):
+                        errors = "; ".join(e.error_message for e in conversion.errors) or conversion.status.value
+                        raise Exception(f"Docling conversion failed: {errors}")
+
+                    markdown_content = conversion.document.export_to_markdown()
+                    print(f"[CONVERTED] {name} - {len(markdown_content):,} chars in {extract_time:.1f}s")
+
+                    if len(markdown_content) < 1000:
+                        raise Exception(f"Output too short: {len(markdown_content)} chars")
+
+                    sections = parse_sections(markdown_content)
+
+                    # Sections in payload-sized batches, then content + status in one transaction
+                    saved = save_extraction(
+                        self.supabase, manual_id, markdown_content, sections,
+                        extraction_method="docling-modal-gpu",
+                        lease_token=manual.get("lease_token"),
+                    )
+                    print(f"[DONE] {name} - {len(sections)} sections, wrote {format_batch_stats(saved['batches'])}")
+
+                    # Same PDF referenced by other manuals: reuse this extraction
+                    duplicates = save_duplicates(
+                        self.supabase, manual_id, pdf_sha256, markdown_content, sections,
+                        extraction_method="docling-modal-gpu",
+                    )
+                    if duplicates:
+                        print(f"  Also saved to {len(duplicates)} manuals sharing this PDF")
+
+                    results.append({
+                        "success": True,
+                        "name": name,
+                        "chars": len(markdown_content),
+                        "sections": len(sections),
+                        "time": extract_time,
+                    })
 
-    sections = []
-    current_title = "Introduction"
-    current_content = []
+                except Exception as e:
+                    results.append(self.mark_failed(manual, str(e)))
 
-    for line in markdown.split("\n"):
-        header_match = re.match(r"^(#{1,3})\s+(.+)$", line)
-        if header_match:
-            if current_content:
-                sections.append({
-                    "title": current_title,
-                    "content": "\n".join(current_content).strip(),
-                })
-            current_title = header_match.group(2).strip()
-            current_content = []
-        else:
-            current_content.append(line)
+                finally:
+                    extract_start = time.time()
 
-    if current_content:
-        sections.append({
-            "title": current_title,
-            "content": "\n".join(current_content).strip(),
-        })
+        load_seconds = 0.0 if self.load_reported else self.load_seconds
+        self.load_reported = True
 
-    return sections
+        return {
+            "results": results,
+            "seconds": time.time() - batch_start,
+            "load_seconds": load_seconds,
+        }
 
 
 @app.function(
@@ -215,9 +217,10 @@ def parse_sections(markdown: str) -> list:
     timeout=3600,
     secrets=[modal.Secret.from_name("supabase-secrets")],
 )
-def process_batch(limit: int = 10, continuous: bool = False) -> dict:
-    """Process a batch of manuals."""
+def process_batch(limit: int = 10, continuous: bool = False, batch_size: int = MANUALS_PER_CONTAINER) -> dict:
+    """Claim manuals and fan them out to Docling containers in batches."""
     from supabase import create_client
+    from work_queue import LeaseHeartbeat, claim_manuals
 
     supabase = create_client(
         os.environ["SUPABASE_URL"],
@@ -226,21 +229,26 @@ def process_batch(limit: int = 10, continuous: bool = False) -> dict:
 
     total_success = 0
     total_failed = 0
+    gpu_seconds = 0.0
+    extractor = DoclingExtractor()
 
     while True:
-        # Get pending manuals
-        pending = supabase.table("vehicle_manuals").select(
-            "id, year, make, model, pdf_url"
-        ).eq("content_status", "pending").limit(limit).execute()
+        # Claim pending manuals (atomic, marks them extracting)
+        pending = claim_manuals(supabase, limit=limit, extractors=("docling",))
 
-        if not pending.data:
+        if not pending:
             print("No more pending manuals!")
             break
 
-        print(f"\nProcessing batch of {len(pending.data)} manuals...")
+        print(f"\nProcessing batch of {len(pending)} manuals...")
 
-        # Process in parallel using Modal's map
-        results = list(extract_manual.map(pending.data))
+        # One call per batch of manuals, keeping queued manuals' leases alive
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        with LeaseHeartbeat(supabase, pending):
+            batch_results = list(extractor.extract_batch.map(batches))
+
+        results = [r for b in batch_results for r in b["results"]]
+        gpu_seconds += sum(b["seconds"] + b["load_seconds"] for b in batch_results)
 
         # Count results
         for r in results:
@@ -257,11 +265,12 @@ def process_batch(limit: int = 10, continuous: bool = False) -> dict:
     return {
         "total_success": total_success,
         "total_failed": total_failed,
+        "gpu_seconds": gpu_seconds,
     }
 
 
 @app.local_entrypoint()
-def main(limit: int = 1, continuous: bool = False):
+def main(limit: int = 1, continuous: bool = False, batch_size: int = MANUALS_PER_CONTAINER):
     """Main entry point."""
     import time
 
@@ -269,15 +278,16 @@ def main(limit: int = 1, continuous: bool = False):
     print(f"================================")
     print(f"Limit: {limit}")
     print(f"Continuous: {continuous}")
+    print(f"Manuals per container call: {batch_size}")
 
     start = time.time()
 
     if continuous:
         # Process all in batches
-        result = process_batch.remote(limit=50, continuous=True)
+        result = process_batch.remote(limit=50, continuous=True, batch_size=batch_size)
     else:
         # Process limited batch
-        result = process_batch.remote(limit=limit, continuous=False)
+        result = process_batch.remote(limit=limit, continuous=False, batch_size=batch_size)
 
     elapsed = time.time() - start
 
@@ -288,6 +298,10 @@ def main(limit: int = 1, continuous: bool = False):
     print(f"Failed: {result['total_failed']}")
     print(f"Time: {elapsed:.1f}s")
 
-    if result['total_success'] > 0:
-        cost_estimate = (elapsed / 3600) * 0.60 * 1.5  # A10G ~$0.60/hr + overhead
+    gpu_hours = result['gpu_seconds'] / 3600
+    print(f"GPU time: {gpu_hours * 60:.1f} min (busy + model load)")
+
+    if result['total_success'] > 0 and gpu_hours > 0:
+        print(f"Throughput: {result['total_success'] / gpu_hours:.1f} manuals per GPU-hour")
+        cost_estimate = gpu_hours * A10G_HOURLY_COST * 1.5  # + idle/scaledown overhead
         print(f"Estimated cost: ${cost_estimate:.2f}")
@@ -14,6 +14,12 @@ Usage:
   # Run with specific limit
   modal run modal_extract.py --limit 100
 
+  # Split large manuals into 40-page shards extracted in parallel containers
+  modal run modal_extract.py --shard-pages 40
+
+  # Keep marker models loaded in each container instead of running marker_single per PDF
+  modal run modal_extract.py --marker-server
+
   # Deploy as persistent app
   modal deploy modal_extract.py
 """
@@ -24,6 +30,14 @@ import os
 # Create Modal app
 app = modal.App("manual-extractor-cpu")
 
+# Lease for claimed manuals still waiting for a free container
+QUEUED_LEASE_SECONDS = 1800
+
+# Content-addressed PDF cache shared by all containers and runs (see pdf_cache.py)
+pdf_cache_volume = modal.Volume.from_name("carintel-pdf-cache", create_if_missing=True)
+PDF_CACHE_DIR = "/pdf-cache"
+PDF_CACHE_MAX_BYTES = 200 * 1024 ** 3
+
 # CPU-based image (much cheaper than GPU)
 image = (
     modal.Image.debian_slim(python_version="3.11")
@@ -34,8 +48,28 @@ image = (
         "python-dotenv",
         "requests",
     )
+    .add_local_python_source(
+        "work_queue", "sections", "bulk_writer", "pdf_shards", "marker_server", "pdf_cache", "downloader",
+        "telemetry", "tracing", "resource_monitor",
+    )
 )
 
+
+def fetch_pdf(pdf_url: str) -> tuple:
+    """Get (sha256, path) for a PDF from the cache volume, downloading and committing on a miss"""
+    from downloader import format_download_stats
+    from pdf_cache import PdfCache
+
+    cache = PdfCache(PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_BYTES)
+    hit = cache.lookup(pdf_url)
+    if hit:
+        return hit
+    result = cache.get(pdf_url)
+    print(f"  Downloaded {format_download_stats(cache.last_download)}")
+    pdf_cache_volume.commit()
+    return result
+
+
 @app.function(
     image=image,
     cpu=2,  # Use 2 CPU cores per worker
@@ -43,14 +77,25 @@ image = (
     timeout=3600,  # 60 minute timeout per PDF (CPU is slower)
     retries=2,  # Retry failed extractions
     secrets=[modal.Secret.from_name("supabase-secrets")],
+    volumes={PDF_CACHE_DIR: pdf_cache_volume},
 )
-def extract_single_manual(manual_data: dict) -> dict:
-    """Extract a single manual using marker-pdf on Modal"""
+def extract_single_manual(manual_data: dict, shard_pages: int = 0, engine=None) -> dict:
+    """
+    Extract a single manual using marker-pdf on Modal.
+
+    Sharded by page range if shard_pages. MarkerWorker passes its loaded
+    MarkerEngine as `engine` to skip marker_single's per-PDF model load.
+    """
     import subprocess
     import tempfile
-    import requests
     from pathlib import Path
     from supabase import create_client
+    from bulk_writer import format_batch_stats, save_duplicates, save_extraction
+    from pdf_shards import page_count, plan_shards, stitch_markdown
+    from sections import parse_sections
+    from resource_monitor import marker_env
+    from telemetry import EventLog
+    from work_queue import LeaseHeartbeat
 
     manual_id = manual_data["id"]
     pdf_url = manual_data["pdf_url"]
@@ -62,117 +107,124 @@ def extract_single_manual(manual_data: dict) -> dict:
     supabase_url = os.environ["SUPABASE_URL"]
     supabase_key = os.environ["SUPABASE_SERVICE_KEY"]
     supabase = create_client(supabase_url, supabase_key)
+    events = EventLog(supabase)
+    stage = "download"
 
     try:
         print(f"[START] {year} {make} {model} ({manual_id[:8]})")
         import time
         start_time = time.time()
 
-        # Mark as extracting
-        print(f"  [{manual_id[:8]}] Marking as extracting...")
-        supabase.table("vehicle_manuals").update(
-            {"content_status": "extracting"}
-        ).eq("id", manual_id).execute()
-
-        # Download PDF
-        with tempfile.TemporaryDirectory() as tmpdir:
-            pdf_path = Path(tmpdir) / "manual.pdf"
+        # Heartbeat keeps the claim alive through long marker runs
+        with events, LeaseHeartbeat(supabase, [manual_data]), tempfile.TemporaryDirectory() as tmpdir:
             output_dir = Path(tmpdir) / "output"
             output_dir.mkdir()
 
-            # Download
-            print(f"  [{manual_id[:8]}] Downloading PDF from {pdf_url[:50]}...")
-            response = requests.get(pdf_url, timeout=300)
-            response.raise_for_status()
-            pdf_path.write_bytes(response.content)
+            # Fetch PDF (cache volume; only downloads on a miss)
+            print(f"  [{manual_id[:8]}] Fetching PDF from {pdf_url[:50]}...")
+            pdf_sha256, pdf_path = fetch_pdf(pdf_url)
             pdf_size = pdf_path.stat().st_size / 1024 / 1024
-            print(f"  [{manual_id[:8]}] Downloaded {pdf_size:.1f} MB in {time.time() - start_time:.1f}s")
-
-            # Run marker-pdf with real-time output
-            print(f"  [{manual_id[:8]}] Starting marker-pdf extraction...")
-            extract_start = time.time()
-            import sys
-            process = subprocess.Popen(
-                [
-                    "marker_single",
-                    str(pdf_path),
-                    "--output_dir", str(output_dir),
-                    "--output_format", "markdown",
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-            )
-
-            # Stream output in real-time
-            for line in process.stdout:
-                line = line.strip()
-                if line:
-                    print(f"  [{manual_id[:8]}] {line}")
-                    sys.stdout.flush()
-
-            process.wait(timeout=1500)
-            result_code = process.returncode
-            print(f"  [{manual_id[:8]}] marker-pdf finished in {time.time() - extract_start:.1f}s (exit code: {result_code})")
-
-            if result_code != 0:
-                raise Exception(f"marker-pdf failed with exit code {result_code}")
-
-            # Find the output markdown file
-            print(f"  [{manual_id[:8]}] Looking for output markdown...")
-            md_files = list(output_dir.rglob("*.md"))
-            if not md_files:
-                raise Exception("No markdown output generated")
-
-            markdown_content = md_files[0].read_text()
-            print(f"  [{manual_id[:8]}] Got {len(markdown_content):,} chars of markdown")
+            print(f"  [{manual_id[:8]}] Got {pdf_size:.1f} MB in {time.time() - start_time:.1f}s")
+            events.emit("download", manual_id, seconds=time.time() - start_time)
+
+            stage = "extract"
+            pages = page_count(pdf_path)
+
+            # Large manuals: fan page-range shards out to parallel containers
+            shards = plan_shards(pages, shard_pages) if shard_pages else []
+            if len(shards) > 1:
+                print(f"  [{manual_id[:8]}] Extracting {len(shards)} shards of {shard_pages} pages in parallel...")
+                extract_start = time.time()
+                parts = list(extract_shard.map(
+                    [pdf_url] * len(shards),
+                    [start for start, _ in shards],
+                    [end for _, end in shards],
+                ))
+                markdown_content = stitch_markdown(parts)
+                print(f"  [{manual_id[:8]}] {len(shards)} shards finished in {time.time() - extract_start:.1f}s, "
+                      f"stitched {len(markdown_content):,} chars")
+            elif engine is not None:
+                print(f"  [{manual_id[:8]}] Converting with preloaded marker models...")
+                extract_start = time.time()
+                markdown_content = engine.convert(
+                    pdf_path,
+                    on_progress=lambda done, total: print(f"  [{manual_id[:8]}] {done}/{total} pages"),
+                )
+                print(f"  [{manual_id[:8]}] marker-pdf finished in {time.time() - extract_start:.1f}s")
+            else:
+                # Run marker-pdf with real-time output
+                print(f"  [{manual_id[:8]}] Starting marker-pdf extraction...")
+                extract_start = time.time()
+                import sys
+                process = subprocess.Popen(
+                    [
+                        "marker_single",
+                        str(pdf_path),
+                        "--output_dir", str(output_dir),
+                        "--output_format", "markdown",
+                        "--paginate_output",  # Page separators, for per-page quality scores
+                    ],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    bufsize=1,
+                    env=marker_env(manual_id),
+                )
+
+                # Stream output in real-time
+                for line in process.stdout:
+                    line = line.strip()
+                    if line:
+                        print(f"  [{manual_id[:8]}] {line}")
+                        sys.stdout.flush()
+
+                process.wait(timeout=1500)
+                result_code = process.returncode
+                print(f"  [{manual_id[:8]}] marker-pdf finished in {time.time() - extract_start:.1f}s (exit code: {result_code})")
+
+                if result_code != 0:
+                    raise Exception(f"marker-pdf failed with exit code {result_code}")
+
+                # Find the output markdown file
+                print(f"  [{manual_id[:8]}] Looking for output markdown...")
+                md_files = list(output_dir.rglob("*.md"))
+                if not md_files:
+                    raise Exception("No markdown output generated")
+
+                markdown_content = md_files[0].read_text()
+                print(f"  [{manual_id[:8]}] Got {len(markdown_content):,} chars of markdown")
 
             if len(markdown_content) < 1000:
                 raise Exception(f"Output too short: {len(markdown_content)} chars")
 
+            events.emit("extract", manual_id, seconds=time.time() - extract_start, pages=pages,
+                        extraction_method="marker-pdf-modal-cpu")
+            stage = "upload"
+            upload_start = time.time()
+
             # Parse sections from markdown
             sections = parse_sections(markdown_content)
             print(f"  [{manual_id[:8]}] Parsed {len(sections)} sections")
 
             # Upload to Supabase
             print(f"  [{manual_id[:8]}] Uploading to Supabase...")
-            # First, delete any existing content
-            supabase.table("manual_content").delete().eq("manual_id", manual_id).execute()
-            supabase.table("manual_sections").delete().eq("manual_id", manual_id).execute()
-
-            # Insert full content
-            supabase.table("manual_content").insert({
-                "manual_id": manual_id,
-                "content_markdown": markdown_content,
-                "total_char_count": len(markdown_content),
-                "total_word_count": len(markdown_content.split()),
-                "extraction_method": "marker-pdf-modal-cpu",
-            }).execute()
-
-            # Mark as extracted IMMEDIATELY after content is saved
-            # This ensures we don't lose work if section insertion fails
-            supabase.table("vehicle_manuals").update(
-                {"content_status": "extracted"}
-            ).eq("id", manual_id).execute()
-
-            # Insert sections (non-critical - if this fails, content is still saved)
-            try:
-                for i, section in enumerate(sections):
-                    supabase.table("manual_sections").insert({
-                        "manual_id": manual_id,
-                        "section_path": str(i + 1),  # Simple numeric path: "1", "2", "3"...
-                        "section_title": section["title"],
-                        "sort_order": i,
-                        "depth": 1,
-                        "content_markdown": section["content"],
-                        "content_plain": section["content"],
-                        "char_count": len(section["content"]),
-                        "word_count": len(section["content"].split()),
-                    }).execute()
-                print(f"  [{manual_id[:8]}] Inserted {len(sections)} sections")
-            except Exception as section_err:
-                print(f"  [{manual_id[:8]}] Warning: Section insertion failed: {str(section_err)[:100]}")
+            # Sections in payload-sized batches, then content + status in one transaction
+            saved = save_extraction(
+                supabase, manual_id, markdown_content, sections,
+                extraction_method="marker-pdf-modal-cpu",
+                lease_token=manual_data.get("lease_token"),
+            )
+            print(f"  [{manual_id[:8]}] Wrote {format_batch_stats(saved['batches'])}")
+            events.emit("upload", manual_id, seconds=time.time() - upload_start,
+                        extraction_method="marker-pdf-modal-cpu")
+
+            # Same PDF referenced by other manuals: reuse this extraction
+            duplicates = save_duplicates(
+                supabase, manual_id, pdf_sha256, markdown_content, sections,
+                extraction_method="marker-pdf-modal-cpu",
+            )
+            if duplicates:
+                print(f"  [{manual_id[:8]}] Also saved to {len(duplicates)} manuals sharing this PDF")
 
             print(f"[DONE] {year} {make} {model} - {len(markdown_content):,} chars, {len(sections)} sections")
 
@@ -186,6 +238,8 @@ def extract_single_manual(manual_data: dict) -> dict:
 
     except Exception as e:
         # Mark as failed
+        events.failed(manual_id, stage, e)
+        events.flush()
         supabase.table("vehicle_manuals").update(
             {"content_status": "failed"}
         ).eq("id", manual_id).execute()
@@ -200,36 +254,49 @@ def extract_single_manual(manual_data: dict) -> dict:
         }
 
 
-def parse_sections(markdown: str) -> list:
-    """Parse markdown into sections based on headers"""
-    import re
+@app.function(
+    image=image,
+    cpu=2,
+    memory=4096,
+    timeout=1800,
+    retries=2,
+    volumes={PDF_CACHE_DIR: pdf_cache_volume},
+)
+def extract_shard(pdf_url: str, start: int, end: int) -> str:
+    """Extract pages [start, end) of a PDF with marker-pdf and return the markdown"""
+    import tempfile
+    from pathlib import Path
+    from pdf_shards import run_marker_shard
 
-    sections = []
-    current_title = "Introduction"
-    current_content = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _, pdf_path = fetch_pdf(pdf_url)
 
-    for line in markdown.split("\n"):
-        header_match = re.match(r"^(#{1,3})\s+(.+)$", line)
-        if header_match:
-            # Save previous section
-            if current_content:
-                sections.append({
-                    "title": current_title,
-                    "content": "\n".join(current_content).strip(),
-                })
-            current_title = header_match.group(2).strip()
-            current_content = []
-        else:
-            current_content.append(line)
+        print(f"  [shard {start}-{end - 1}] Running marker-pdf...")
+        return run_marker_shard(pdf_path, start, end, Path(tmpdir) / "output", extra_args=("--paginate_output",))
 
-    # Save last section
-    if current_content:
-        sections.append({
-            "title": current_title,
-            "content": "\n".join(current_content).strip(),
-        })
 
-    return sections
+@app.cls(
+    image=image,
+    cpu=2,
+    memory=8192,  # Models stay resident between manuals
+    timeout=3600,
+    retries=2,
+    secrets=[modal.Secret.from_name("supabase-secrets")],
+    volumes={PDF_CACHE_DIR: pdf_cache_volume},
+)
+class MarkerWorker:
+    """Container that loads marker's models once and extracts many manuals"""
+
+    @modal.enter()
+    def load_models(self):
+        from marker_server import MarkerEngine
+
+        self.engine = MarkerEngine()
+        print(f"Marker models loaded in {self.engine.load_seconds:.1f}s")
+
+    @modal.method()
+    def extract(self, manual_data: dict, shard_pages: int = 0) -> dict:
+        return extract_single_manual.local(manual_data, shard_pages, engine=self.engine)
 
 
 @app.function(
@@ -238,24 +305,23 @@ def parse_sections(markdown: str) -> list:
     secrets=[modal.Secret.from_name("supabase-secrets")],
 )
 def get_pending_manuals(limit: int = 100) -> list:
-    """Get pending manuals from Supabase"""
+    """Claim pending manuals from Supabase (claimed rows are marked extracting)"""
     from supabase import create_client
+    from work_queue import claim_manuals
 
     supabase_url = os.environ["SUPABASE_URL"]
     supabase_key = os.environ["SUPABASE_SERVICE_KEY"]
     supabase = create_client(supabase_url, supabase_key)
 
-    result = supabase.table("vehicle_manuals").select(
-        "id, year, make, model, pdf_url"
-    ).eq("content_status", "pending").limit(limit).execute()
-
-    return result.data
+    # Manuals can sit in Modal's queue before a container starts on them,
+    # so claim with a longer lease; running containers heartbeat from there
+    return claim_manuals(supabase, limit=limit, lease_seconds=QUEUED_LEASE_SECONDS, extractors=("marker",))
 
 
 @app.local_entrypoint()
-def main(limit: int = 50):
+def main(limit: int = 50, shard_pages: int = 0, marker_server: bool = False):
     """Main entrypoint - fetch pending manuals and process them in parallel"""
-    print(f"Fetching up to {limit} pending manuals...")
+    print(f"Claiming up to {limit} pending manuals...")
 
     manuals = get_pending_manuals.remote(limit)
     print(f"Found {len(manuals)} manuals to process")
@@ -266,7 +332,8 @@ def main(limit: int = 50):
 
     # Process all manuals in parallel using Modal's map
     print(f"Starting parallel extraction with Modal...")
-    results = list(extract_single_manual.map(manuals))
+    extract = MarkerWorker().extract if marker_server else extract_single_manual
+    results = list(extract.map(manuals, kwargs={"shard_pages": shard_pages}))
 
     # Summary
     successful = [r for r in results if r["success"]]
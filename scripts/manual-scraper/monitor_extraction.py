@@ -1,12 +1,34 @@
 #!/usr/bin/env python3
-"""Monitor extraction progress and system health every 15 minutes"""
+"""Monitor extraction progress and system health every 15 minutes.
+
+Expired extraction leases are reclaimed every minute so crashed workers'
+manuals go back to the queue quickly, while healthy long marker runs keep
+their leases alive via heartbeats and are never reset.
+
+Hourly maintenance recomputes queue priorities (quality score times
+vehicle popularity, plus per-make extractor routing), so newly queued
+manuals and recent API lookups are reflected in claim order, and prunes
+extraction_events past their retention so status.py's percentile queries
+stay fast.
+
+System resources (CPU, memory, swap, disk and network, plus CPU/RSS/swap
+per marker process and the manual it is extracting) are sampled every
+minute via resource_monitor.py and appended to extraction_resources.jsonl;
+`python resource_monitor.py --summary extraction_resources.jsonl` turns
+them into a --workers suggestion. Swapping is logged as soon as it is seen.
+"""
+import json
 import os
 import time
-import subprocess
 from datetime import datetime
 from dotenv import load_dotenv
 from supabase import create_client
 
+from extraction_status import get_extraction_status
+from resource_monitor import ResourceSampler, format_sample, is_swapping
+from telemetry import EVENT_RETENTION_DAYS, prune_events
+from work_queue import reclaim_expired, refresh_priorities
+
 load_dotenv()
 
 supabase = create_client(
@@ -15,6 +37,10 @@ supabase = create_client(
 )
 
 LOG_FILE = "extraction_monitor.log"
+RESOURCE_FILE = "extraction_resources.jsonl"
+STATUS_INTERVAL = 900   # 15 minutes
+RECLAIM_INTERVAL = 60   # 1 minute
+MAINTENANCE_INTERVAL = 3600  # 1 hour
 
 def log(msg):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -23,51 +49,56 @@ def log(msg):
     with open(LOG_FILE, "a") as f:
         f.write(line + "\n")
 
+sampler = ResourceSampler()
+last_sample = None
+
+def sample_resources():
+    """Record one resource sample (rates since the previous one); warn on swapping"""
+    global last_sample
+    last_sample = sampler.sample()
+    with open(RESOURCE_FILE, "a") as f:
+        f.write(json.dumps(last_sample) + "\n")
+    if is_swapping(last_sample):
+        swapped = {m: t['swap'] for m, t in last_sample['manuals'].items() if t['swap']}
+        log(f"WARNING: swapping (in {last_sample['swap_in_bps'] / 1024 / 1024:.1f} MB/s, "
+            f"out {last_sample['swap_out_bps'] / 1024 / 1024:.1f} MB/s); "
+            f"marker swap by manual: {swapped or 'none'} - consider fewer --workers")
+
 def check_status():
-    extracted = supabase.table('vehicle_manuals').select('id', count='exact').eq('content_status', 'extracted').execute()
-    extracting = supabase.table('vehicle_manuals').select('id', count='exact').eq('content_status', 'extracting').execute()
-    pending = supabase.table('vehicle_manuals').select('id', count='exact').eq('content_status', 'pending').execute()
-    failed = supabase.table('vehicle_manuals').select('id', count='exact').eq('content_status', 'failed').execute()
+    counts = get_extraction_status(supabase)
     
-    # Get system stats
-    top_output = subprocess.run(['top', '-l', '1', '-n', '0'], capture_output=True, text=True)
-    cpu_line = [l for l in top_output.stdout.split('\n') if 'CPU usage' in l]
-    mem_line = [l for l in top_output.stdout.split('\n') if 'PhysMem' in l]
-    
-    cpu_idle = "N/A"
-    if cpu_line:
-        import re
-        match = re.search(r'(\d+\.\d+)% idle', cpu_line[0])
-        if match:
-            cpu_idle = match.group(1)
-    
-    log(f"STATUS: extracted={extracted.count}, extracting={extracting.count}, pending={pending.count}, failed={failed.count}, cpu_idle={cpu_idle}%")
-    
-    # Check for stuck extractions (over 30 min)
-    if extracting.count > 0:
-        from datetime import timezone
-        active = supabase.table('vehicle_manuals').select(
-            'id, year, make, model, updated_at'
-        ).eq('content_status', 'extracting').execute()
-        
-        now = datetime.now(timezone.utc)
-        for m in active.data:
-            updated = datetime.fromisoformat(m['updated_at'].replace('Z', '+00:00'))
-            elapsed_min = (now - updated).total_seconds() / 60
-            if elapsed_min > 30:
-                log(f"WARNING: {m['year']} {m['make']} {m['model']} stuck for {elapsed_min:.0f} min - resetting to pending")
-                supabase.table('vehicle_manuals').update(
-                    {'content_status': 'pending'}
-                ).eq('id', m['id']).execute()
+    log(f"STATUS: extracted={counts['extracted']}, extracting={counts['extracting']}, pending={counts['pending']}, failed={counts['failed']}")
+    if last_sample:
+        log(f"RESOURCES: {format_sample(last_sample)}")
+
+def reclaim_stuck():
+    """Requeue manuals whose extraction lease expired (worker crashed or hung)"""
+    for m in reclaim_expired(supabase):
+        log(f"WARNING: {m['year']} {m['make']} {m['model']} lease expired "
+            f"(worker={m.get('claimed_by') or 'unknown'}) - reset to pending")
+
+def maintain():
+    """Recompute extraction priority and routing for queued manuals; prune old events"""
+    log(f"PRIORITY: refreshed {refresh_priorities(supabase):,} queued manuals")
+    log(f"EVENTS: pruned {prune_events(supabase):,} older than {EVENT_RETENTION_DAYS} days")
 
 def main():
     log("=== MONITOR STARTED ===")
+    last_status = 0
+    last_maintenance = 0
     while True:
         try:
-            check_status()
+            reclaim_stuck()
+            sample_resources()
+            if time.time() - last_status >= STATUS_INTERVAL:
+                check_status()
+                last_status = time.time()
+            if time.time() - last_maintenance >= MAINTENANCE_INTERVAL:
+                last_maintenance = time.time()
+                maintain()
         except Exception as e:
             log(f"ERROR: {str(e)[:100]}")
-        time.sleep(900)  # 15 minutes
+        time.sleep(RECLAIM_INTERVAL)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,181 @@
+"""
+Content-addressed on-disk PDF cache.
+
+PDFs are stored once per SHA-256 of their bytes, so the same file reached
+through different URLs (e.g. yearMismatch entries sharing one gimmemanuals
+PDF) is downloaded and stored once. A URL -> hash index makes repeat
+fetches (retries, --reprocess, quality-test --fix) free.
+
+Layout (safe to share between processes; every write is an atomic rename):
+
+    <root>/objects/ab/abcdef....pdf     PDF bytes, named by SHA-256
+    <root>/urls/<sha256 of url>         hash of the PDF last fetched from that URL
+    <root>/tmp/                         in-flight downloads (resumed if interrupted)
+
+A miss downloads and files the PDF under the downloader's lock for that
+URL, so concurrent fetches of one URL download it once and the others
+find it in the index.
+
+The cache is bounded by total object size; least recently used PDFs
+(by mtime, refreshed on every hit) are evicted first.
+
+    cache = PdfCache()
+    sha, pdf_path = cache.get(pdf_url)
+    cache.last_download   # this thread's downloader stats for its last miss, None on a hit
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+from downloader import dest_lock, download_file
+
+DEFAULT_CACHE_DIR = Path(os.getenv('PDF_CACHE_DIR', Path.home() / '.cache' / 'carintel' / 'pdfs'))
+DEFAULT_MAX_BYTES = int(float(os.getenv('PDF_CACHE_MAX_GB', '20')) * 1024 ** 3)
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: Path) -> str:
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PdfCache:
+    """Size-bounded, content-addressed PDF store with a URL index"""
+
+    def __init__(self, root: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.objects = self.root / 'objects'
+        self.urls = self.root / 'urls'
+        self.tmp = self.root / 'tmp'
+        for directory in (self.objects, self.urls, self.tmp):
+            directory.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+    @property
+    def last_download(self) -> Optional[dict]:
+        # Per thread, so concurrent downloaders each see their own stats
+        return getattr(self._local, 'last_download', None)
+
+    @last_download.setter
+    def last_download(self, stats: Optional[dict]):
+        self._local.last_download = stats
+
+    def path_for(self, sha: str) -> Path:
+        return self.objects / sha[:2] / f"{sha}.pdf"
+
+    def _url_entry(self, url: str) -> Path:
+        return self.urls / hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _write_atomic(self, path: Path, text: str):
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def _touch(self, path: Path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def lookup(self, url: str) -> Optional[tuple]:
+        """Return (sha, path) if the PDF behind url is cached, else None"""
+        try:
+            sha = self._url_entry(url).read_text().strip()
+        except FileNotFoundError:
+            return None
+        path = self.path_for(sha)
+        if not path.exists():
+            return None  # Evicted
+        self._touch(path)
+        return sha, path
+
+    def add_file(self, source: Path, url: Optional[str] = None, move: bool = False) -> tuple:
+        """
+        Add a local PDF to the cache (moved if move=True, else copied).
+
+        Returns (sha, path). If the content is already cached the existing
+        object is reused.
+        """
+        sha = hash_file(source)
+        path = self.path_for(sha)
+        if path.exists():
+            self._touch(path)
+            if move:
+                Path(source).unlink()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if move:
+                os.replace(source, path)
+            else:
+                fd, tmp_path = tempfile.mkstemp(dir=self.tmp, suffix='.part')
+                with os.fdopen(fd, 'wb') as out, open(source, 'rb') as src:
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                        out.write(chunk)
+                os.replace(tmp_path, path)
+            self.evict(keep=path)
+
+        if url:
+            self._write_atomic(self._url_entry(url), sha)
+        return sha, path
+
+    def download_path(self, url: str) -> Path:
+        """
+        Where url is downloaded before it is filed under its hash.
+
+        The name is derived from the URL, so a download interrupted in an
+        earlier run resumes from its .part file.
+        """
+        return self.tmp / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.pdf"
+
+    def get(self, url: str, timeout: int = 300) -> tuple:
+        """Return (sha, path) for url, downloading it on a cache miss"""
+        self.last_download = None
+        hit = self.lookup(url)
+        if hit:
+            return hit
+
+        dest = self.download_path(url)
+        # Download, hash and move under one lock: a concurrent fetch of the
+        # same URL waits, then finds the PDF in the index instead of replacing
+        # dest while it is being filed
+        with dest_lock(dest):
+            hit = self.lookup(url)
+            if hit:
+                return hit
+            self.last_download = download_file(url, dest, timeout=(10, timeout), lock=False)
+            return self.add_file(dest, url=url, move=True)
+
+    def size(self) -> int:
+        return sum(p.stat().st_size for p in self.objects.glob('*/*.pdf'))
+
+    def evict(self, keep: Optional[Path] = None) -> int:
+        """Delete least recently used PDFs until under max_bytes. Returns bytes freed."""
+        entries = []
+        total = 0
+        for path in self.objects.glob('*/*.pdf'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        freed = 0
+        for _, size, path in sorted(entries):
+            if total - freed <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            freed += size
+        return freed
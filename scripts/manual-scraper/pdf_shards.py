@@ -0,0 +1,141 @@
+"""
+Page-range sharding for marker-pdf extraction.
+
+A 400-page manual takes marker_single 15+ minutes on one worker. Splitting
+it into page-range shards (marker_single --page_range) lets the shards run
+in parallel across a ProcessPoolExecutor or Modal .map(), so wall-clock
+time per manual scales with cores instead of page count.
+
+The shard outputs are stitched back together in page order. Sections that
+straddle a shard boundary are repaired:
+  - text at the top of a shard (before its first header) is appended to
+    the last section of the previous shard, exactly as if marker had seen
+    the whole document
+  - a sentence cut at the boundary is re-joined with a space instead of a
+    paragraph break, unless the shard starts with a page separator
+    (--paginate_output), which is kept between them as in a single pass
+  - a header repeated at the top of the next shard is dropped
+"""
+
+import re
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+from sections import HEADER_RE, PAGE_SEPARATOR_RE, clean_title
+
+DEFAULT_PAGES_PER_SHARD = 50
+
+# Line endings that finish a sentence/block; anything else may continue
+SENTENCE_END_RE = re.compile(r'[.!?:;)\]"\'|]\s*$')
+
+
+def page_count(pdf_path: Path) -> int:
+    """Count pages in a PDF (pymupdf, falling back to pypdfium2 which ships with marker)"""
+    try:
+        import pymupdf
+        with pymupdf.open(str(pdf_path)) as doc:
+            return len(doc)
+    except ImportError:
+        import pypdfium2
+        doc = pypdfium2.PdfDocument(str(pdf_path))
+        try:
+            return len(doc)
+        finally:
+            doc.close()
+
+
+def plan_shards(pages: int, pages_per_shard: int = DEFAULT_PAGES_PER_SHARD) -> list:
+    """Split `pages` into [(start, end), ...] ranges (0-indexed, end exclusive)"""
+    if pages <= 0:
+        return []
+    pages_per_shard = max(1, pages_per_shard)
+    return [(start, min(start + pages_per_shard, pages)) for start in range(0, pages, pages_per_shard)]
+
+
+def marker_page_range(start: int, end: int) -> str:
+    """Format a shard as a marker --page_range value (0-indexed, inclusive)"""
+    return f"{start}-{end - 1}"
+
+
+def run_marker_shard(pdf_path: Path, start: int, end: int, output_dir: Path,
+                     marker_bin: str = 'marker_single', extra_args: tuple = (),
+                     timeout: int = 1800, env: Optional[dict] = None) -> str:
+    """Run marker_single on pages [start, end) and return the markdown"""
+    shard_dir = Path(output_dir) / f"shard-{start:05d}"
+    shard_dir.mkdir(parents=True, exist_ok=True)
+
+    result = subprocess.run(
+        [
+            str(marker_bin),
+            str(pdf_path),
+            '--output_dir', str(shard_dir),
+            '--output_format', 'markdown',
+            '--page_range', marker_page_range(start, end),
+            *extra_args,
+        ],
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+        env=env,
+    )
+    if result.returncode != 0:
+        raise Exception(f"marker-pdf failed on pages {start}-{end - 1} "
+                        f"(exit {result.returncode}): {result.stderr[:300]}")
+
+    md_files = list(shard_dir.rglob('*.md'))
+    if not md_files:
+        raise Exception(f"No markdown output for pages {start}-{end - 1}")
+    return md_files[0].read_text(encoding='utf-8')
+
+
+def _last_header_title(text: str):
+    for line in reversed(text.splitlines()):
+        header = HEADER_RE.match(line)
+        if header:
+            return clean_title(header.group(2))
+    return None
+
+
+def stitch_markdown(parts: list) -> str:
+    """Join shard markdown (in page order), repairing sections cut at shard boundaries"""
+    stitched = ''
+    for part in parts:
+        part = part.strip()
+        if not part:
+            continue
+        if not stitched:
+            stitched = part
+            continue
+
+        # A page separator (paginated output) stays at the top of its part
+        separator = PAGE_SEPARATOR_RE.match(part)
+        if separator:
+            part = part[separator.end():].lstrip()
+
+        # Drop a header that merely repeats the section we are already in
+        first_line, _, rest = part.partition('\n')
+        header = HEADER_RE.match(first_line)
+        if header and clean_title(header.group(2)) == _last_header_title(stitched):
+            part = rest.lstrip('\n')
+            first_line = part.partition('\n')[0]
+            header = HEADER_RE.match(first_line)
+
+        if separator:
+            stitched += f"\n\n{separator.group(0)}" + (f"\n\n{part}" if part else '')
+            continue
+        if not part:
+            continue
+
+        # Re-join a sentence split across the boundary
+        last_line = stitched.rpartition('\n')[2]
+        continues = (
+            not header
+            and last_line.strip()
+            and not last_line.lstrip().startswith(('#', '|', '-', '*', '>'))
+            and not SENTENCE_END_RE.search(last_line)
+            and first_line[:1].islower()
+        )
+        stitched += (' ' if continues else '\n\n') + part
+
+    return stitched
@@ -0,0 +1,194 @@
+"""
+Staged worker pipeline with bounded queues.
+
+Extraction has three very different kinds of work per manual: download
+(network), extract (CPU/GPU) and upload (database). Run in series, the CPU
+idles during a multi-minute download and the network idles during marker.
+Pipeline runs each stage on its own threads with its own concurrency, joined
+by bounded queues, so the next K PDFs download while the current ones
+extract and finished results upload in the background:
+
+    pipeline = Pipeline([
+        Stage('download', fetch, workers=2, queue_size=4),   # prefetch up to 4
+        Stage('extract', extract, workers=1, queue_size=1),
+        Stage('upload', upload, workers=1, queue_size=4),
+    ])
+    for outcome in pipeline.run(claimed_manuals()):
+        ...   # {'item', 'result', 'error', 'stage'}
+
+Each stage function takes the previous stage's output and returns its own.
+A stage that raises skips the item past the remaining stages and reports
+the error with the failing stage's name. Bounded queues give backpressure:
+the source is only pulled (and new manuals claimed) when the first queue
+has room.
+
+Queue depth, throughput and busy time per stage are available from
+metrics() and printed by format_metrics().
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+_DONE = object()
+
+
+class Stage:
+    """One pipeline stage: fn applied by `workers` threads, fed by a queue of queue_size"""
+
+    def __init__(self, name: str, fn: Callable, workers: int = 1, queue_size: int = 1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.active = 0
+        self.max_depth = 0
+
+    def record_depth(self):
+        with self.lock:
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+
+
+class Pipeline:
+    """Run items through stages concurrently; see module docstring"""
+
+    def __init__(self, stages: list, metrics_interval: Optional[float] = None):
+        self.stages = stages
+        self.metrics_interval = metrics_interval
+        self.results = queue.Queue()
+        self.started = None
+        self._stop = threading.Event()
+
+    def _put(self, stage: Stage, item):
+        stage.queue.put(item)
+        stage.record_depth()
+
+    def _feed(self, source: Iterable):
+        first = self.stages[0]
+        try:
+            for item in source:
+                if self._stop.is_set():
+                    break
+                self._put(first, item)
+        except Exception as e:
+            self.results.put({'item': None, 'result': None, 'error': e, 'stage': 'source'})
+        finally:
+            for _ in range(first.workers):
+                first.queue.put(_DONE)
+
+    def _work(self, index: int, remaining: list, remaining_lock: threading.Lock):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item = stage.queue.get()
+            if item is _DONE:
+                break
+
+            with stage.lock:
+                stage.active += 1
+            start = time.time()
+            try:
+                output = stage.fn(item)
+                error = None
+            except Exception as e:
+                output, error = None, e
+            elapsed = time.time() - start
+
+            with stage.lock:
+                stage.active -= 1
+                stage.busy_seconds += elapsed
+                if error is None:
+                    stage.processed += 1
+                else:
+                    stage.failed += 1
+
+            if error is not None:
+                self.results.put({'item': item, 'result': None, 'error': error, 'stage': stage.name})
+            elif next_stage is not None:
+                self._put(next_stage, output)
+            else:
+                self.results.put({'item': item, 'result': output, 'error': None, 'stage': stage.name})
+
+        # Last worker out closes the next stage
+        with remaining_lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last:
+            if next_stage is not None:
+                for _ in range(next_stage.workers):
+                    next_stage.queue.put(_DONE)
+            else:
+                self.results.put(_DONE)
+
+    def _report(self):
+        while not self._stop.wait(self.metrics_interval):
+            print(format_metrics(self.metrics()))
+
+    def run(self, source: Iterable) -> Iterator[dict]:
+        """Push every item from source through the stages, yielding outcomes as they finish"""
+        self.started = time.time()
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+
+        threads = [threading.Thread(target=self._feed, args=(source,), daemon=True, name='pipeline-source')]
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(index, remaining, remaining_lock),
+                    daemon=True, name=f"pipeline-{stage.name}-{n}",
+                ))
+        if self.metrics_interval:
+            threads.append(threading.Thread(target=self._report, daemon=True, name='pipeline-metrics'))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                outcome = self.results.get()
+                if outcome is _DONE:
+                    break
+                yield outcome
+        finally:
+            # Stop pulling new work if the consumer bails out early
+            self._stop.set()
+
+    def stop(self):
+        """Stop pulling from the source; items already queued still finish"""
+        self._stop.set()
+
+    def metrics(self) -> dict:
+        """Per-stage queue depth, throughput and utilisation"""
+        elapsed = time.time() - self.started if self.started else 0.0
+        metrics = {}
+        for stage in self.stages:
+            with stage.lock:
+                metrics[stage.name] = {
+                    'queue_depth': stage.queue.qsize(),
+                    'max_queue_depth': stage.max_depth,
+                    'queue_size': stage.queue.maxsize,
+                    'active': stage.active,
+                    'workers': stage.workers,
+                    'processed': stage.processed,
+                    'failed': stage.failed,
+                    'busy_seconds': stage.busy_seconds,
+                    'utilization': stage.busy_seconds / (elapsed * stage.workers) if elapsed else 0.0,
+                }
+        return metrics
+
+
+def format_metrics(metrics: dict) -> str:
+    """One line per stage, e.g. 'download   queue 3/4 (max 4)  active 2/2  done 12  failed 0  busy 81%'"""
+    lines = []
+    for name, m in metrics.items():
+        lines.append(
+            f"  {name:<10} queue {m['queue_depth']}/{m['queue_size']} (max {m['max_queue_depth']})  "
+            f"active {m['active']}/{m['workers']}  done {m['processed']}  failed {m['failed']}  "
+            f"busy {m['utilization']:.0%}"
+        )
+    return '\n'.join(lines)
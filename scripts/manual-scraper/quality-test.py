@@ -5,18 +5,28 @@ Quality test script for extracted manual content
 Evaluates the quality of extracted markdown content and identifies
 manuals that may need re-extraction.
 
+Manuals are read a page at a time from the get_quality_audit_page RPC
+(keyset-paginated on manual_id, section counts aggregated in the database)
+and scored on a process pool while the next page downloads.
+
 Usage:
   python quality-test.py                  # Test all extracted manuals
   python quality-test.py --limit 10       # Test only 10 manuals
   python quality-test.py --method marker-pdf  # Filter by extraction method
   python quality-test.py --verbose        # Show detailed output
-  python quality-test.py --fix            # Mark low-quality as pending for re-extraction
+  python quality-test.py --fix            # Requeue low-quality manuals (with the reason) for re-extraction,
+                                          # prioritized by score and vehicle popularity
+  python quality-test.py --audit          # Score the corpus into manual_quality, skipping
+                                          # manuals whose content is unchanged since last scored
+  python quality-test.py --audit --force  # Rescore everything
 """
 
 import os
 import sys
-import re
+import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -24,6 +34,10 @@ load_dotenv()
 
 from supabase import create_client, Client
 
+from bulk_writer import upsert_rows
+from quality import evaluate_quality
+from work_queue import requeue_manuals
+
 SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://jxpbnnmefwtazfvoxvge.supabase.co')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 
@@ -33,186 +47,92 @@ if not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Manuals per RPC page: full markdown is ~0.1-2 MB per manual, and pages
+# must stay under PostgREST's max-rows cap
+DEFAULT_PAGE_SIZE = 25
+# Stored with each score (the rest of evaluate_quality's output is per-section detail)
+METRIC_KEYS = ('content_length', 'section_count', 'header_count', 'garbled_ratio',
+               'spacing_ratio', 'avg_word_length', 'special_char_ratio')
+MAX_PROBLEM_SECTIONS = 10
 
-# Quality thresholds
-MIN_CONTENT_LENGTH = 5000       # Minimum characters (manuals should be substantial)
-MIN_SECTIONS = 5                # Minimum number of sections
-MIN_HEADERS = 3                 # Minimum markdown headers
-MAX_GARBLED_RATIO = 0.05        # Max ratio of garbled text patterns
-MIN_WORD_LENGTH_AVG = 3.5       # Average word length (garbled text has weird lengths)
-MAX_SPECIAL_CHAR_RATIO = 0.15   # Max ratio of special characters
-
-
-def check_garbled_text(content: str) -> tuple[float, list[str]]:
-    """
-    Check for garbled text patterns common in bad PDF extraction
-    Returns (ratio, examples)
-    """
-    patterns = [
-        r'[a-z]\s[a-z]\s[a-z]\s[a-z]',  # Spaced out characters: "t h i s"
-        r'[A-Z]{10,}',                    # Long uppercase strings
-        r'[\x00-\x08\x0b\x0c\x0e-\x1f]',  # Control characters
-        r'[^\x00-\x7F]{5,}',              # Long non-ASCII sequences
-        r'\d{20,}',                        # Very long numbers
-        r'([a-zA-Z])\1{4,}',              # Repeated characters: "aaaaa"
-    ]
-
-    total_matches = 0
-    examples = []
-
-    for pattern in patterns:
-        matches = re.findall(pattern, content)
-        total_matches += len(matches)
-        if matches and len(examples) < 3:
-            examples.extend(matches[:2])
-
-    ratio = total_matches / max(len(content), 1)
-    return ratio, examples[:5]
 
-
-def check_character_spacing(content: str) -> float:
-    """
-    Check for character spacing issues (common in pdfjs extraction)
-    Returns ratio of spaced-out words
+def iter_audit_pages(method: Optional[str] = None, force: bool = True,
+                     page_size: int = DEFAULT_PAGE_SIZE, limit: Optional[int] = None):
     """
-    # Pattern for words with spaces between each character
-    spaced_pattern = r'\b[a-zA-Z]\s[a-zA-Z]\s[a-zA-Z]\b'
-    matches = re.findall(spaced_pattern, content)
-
-    words = content.split()
-    if not words:
-        return 0
+    Yield pages of extracted manuals, following the manual_id cursor.
 
-    return len(matches) / len(words)
-
-
-def check_headers(content: str) -> tuple[int, list[str]]:
-    """
-    Check for proper markdown headers
-    Returns (count, sample_headers)
-    """
-    header_pattern = r'^#{1,6}\s+(.+)$'
-    matches = re.findall(header_pattern, content, re.MULTILINE)
-    return len(matches), matches[:5]
-
-
-def calculate_avg_word_length(content: str) -> float:
-    """Calculate average word length (garbled text often has unusual lengths)"""
-    words = re.findall(r'\b[a-zA-Z]+\b', content)
-    if not words:
-        return 0
-    return sum(len(w) for w in words) / len(words)
-
-
-def calculate_special_char_ratio(content: str) -> float:
-    """Calculate ratio of special characters to total"""
-    if not content:
-        return 0
-    special = len(re.findall(r'[^a-zA-Z0-9\s\.\,\!\?\-\:\;\'\"\(\)]', content))
-    return special / len(content)
-
-
-def evaluate_quality(content: str, sections: list) -> dict:
-    """
-    Evaluate the quality of extracted content
-    Returns quality metrics and pass/fail status
+    Rows carry content_markdown and section_count only when the content has
+    changed since it was last scored (or always, with force).
     """
-    metrics = {
-        'content_length': len(content),
-        'section_count': len(sections),
-        'header_count': 0,
-        'sample_headers': [],
-        'garbled_ratio': 0,
-        'garbled_examples': [],
-        'spacing_ratio': 0,
-        'avg_word_length': 0,
-        'special_char_ratio': 0,
-        'issues': [],
-        'score': 100,
-        'passed': True
+    after = None
+    seen = 0
+    while limit is None or seen < limit:
+        size = page_size if limit is None else min(page_size, limit - seen)
+        rows = supabase.rpc('get_quality_audit_page', {
+            'p_after': after,
+            'p_limit': size,
+            'p_method': method,
+            'p_force': force,
+        }).execute().data or []
+        if not rows:
+            return
+        yield rows
+        seen += len(rows)
+        after = rows[-1]['manual_id']
+        if len(rows) < size:
+            return
+
+
+def score_manual(content: str, section_count: int) -> dict:
+    """Score one manual (runs in a worker process)"""
+    return evaluate_quality(content or '', section_count or 0)
+
+
+def quality_row(manual: dict, metrics: dict) -> dict:
+    """manual_quality row for a scored manual"""
+    problem_sections = sorted((s for s in metrics['section_scores'] if s['issues']),
+                              key=lambda s: (s['score'], -s['chars']))
+    return {
+        'manual_id': manual['manual_id'],
+        'extraction_method': manual['extraction_method'],
+        'content_hash': manual['content_hash'],
+        'score': metrics['score'],
+        'passed': metrics['passed'],
+        'issues': metrics['issues'],
+        'metrics': {key: metrics[key] for key in METRIC_KEYS},
+        'problem_sections': problem_sections[:MAX_PROBLEM_SECTIONS],
+        'problem_pages': [p['page'] for p in metrics['page_scores'] if p['issues']],
+        'scored_at': datetime.now(timezone.utc).isoformat(),
     }
 
-    # Check content length
-    if metrics['content_length'] < MIN_CONTENT_LENGTH:
-        metrics['issues'].append(f"Content too short: {metrics['content_length']:,} chars (min: {MIN_CONTENT_LENGTH:,})")
-        metrics['score'] -= 30
 
-    # Check section count
-    if metrics['section_count'] < MIN_SECTIONS:
-        metrics['issues'].append(f"Too few sections: {metrics['section_count']} (min: {MIN_SECTIONS})")
-        metrics['score'] -= 20
-
-    # Check headers
-    metrics['header_count'], metrics['sample_headers'] = check_headers(content)
-    if metrics['header_count'] < MIN_HEADERS:
-        metrics['issues'].append(f"Too few headers: {metrics['header_count']} (min: {MIN_HEADERS})")
-        metrics['score'] -= 15
-
-    # Check for garbled text
-    metrics['garbled_ratio'], metrics['garbled_examples'] = check_garbled_text(content)
-    if metrics['garbled_ratio'] > MAX_GARBLED_RATIO:
-        metrics['issues'].append(f"High garbled text ratio: {metrics['garbled_ratio']:.2%} (max: {MAX_GARBLED_RATIO:.2%})")
-        metrics['score'] -= 25
-
-    # Check character spacing
-    metrics['spacing_ratio'] = check_character_spacing(content)
-    if metrics['spacing_ratio'] > 0.01:  # More than 1% spaced words is bad
-        metrics['issues'].append(f"Character spacing issues: {metrics['spacing_ratio']:.2%}")
-        metrics['score'] -= 20
-
-    # Check average word length
-    metrics['avg_word_length'] = calculate_avg_word_length(content)
-    if metrics['avg_word_length'] < MIN_WORD_LENGTH_AVG:
-        metrics['issues'].append(f"Low avg word length: {metrics['avg_word_length']:.1f} (min: {MIN_WORD_LENGTH_AVG})")
-        metrics['score'] -= 15
-
-    # Check special character ratio
-    metrics['special_char_ratio'] = calculate_special_char_ratio(content)
-    if metrics['special_char_ratio'] > MAX_SPECIAL_CHAR_RATIO:
-        metrics['issues'].append(f"High special char ratio: {metrics['special_char_ratio']:.2%} (max: {MAX_SPECIAL_CHAR_RATIO:.2%})")
-        metrics['score'] -= 10
-
-    # Determine pass/fail
-    metrics['score'] = max(0, metrics['score'])
-    metrics['passed'] = metrics['score'] >= 70 and len(metrics['issues']) <= 2
-
-    return metrics
-
-
-def get_extracted_manuals(limit: Optional[int] = None, method: Optional[str] = None):
-    """Get manuals with extracted content"""
-    query = supabase.table('vehicle_manuals').select(
-        'id, year, make, model, variant'
-    ).eq('content_status', 'extracted')
-
-    if limit:
-        query = query.limit(limit)
-
-    result = query.execute()
-    return result.data
-
-
-def get_manual_content(manual_id: str) -> tuple[str, list]:
-    """Get content and sections for a manual"""
-    # Get full content
-    content_result = supabase.table('manual_content').select(
-        'content_markdown, extraction_method'
-    ).eq('manual_id', manual_id).execute()
-
-    content = ''
-    method = 'unknown'
-    if content_result.data:
-        content = content_result.data[0].get('content_markdown', '')
-        method = content_result.data[0].get('extraction_method', 'unknown')
-
-    # Get sections
-    sections_result = supabase.table('manual_sections').select(
-        'section_title, content_markdown'
-    ).eq('manual_id', manual_id).execute()
-
-    sections = sections_result.data or []
-
-    return content, sections, method
+def requeue_reason(failed: dict) -> str:
+    """Why a manual is sent back for re-extraction (vehicle_manuals.requeue_reason)"""
+    return f"quality {failed['score']}/100 ({failed['method']}): {'; '.join(failed['issues'])}"
+
+
+def print_manual(i: int, name: str, method: str, metrics: dict, verbose: bool):
+    status = "✅ PASS" if metrics['passed'] else "❌ FAIL"
+    print(f"[{i}] {status} {name}")
+    print(f"    Method: {method}")
+    print(f"    Score: {metrics['score']}/100")
+    print(f"    Content: {metrics['content_length']:,} chars, {metrics['section_count']} sections")
+    if metrics['issues']:
+        for issue in metrics['issues']:
+            print(f"    ⚠️  {issue}")
+    if metrics['garbled_examples'] and verbose:
+        print(f"    Garbled samples: {metrics['garbled_examples'][:3]}")
+    # Where the problems are: worst sections and pages
+    bad_sections = [s for s in metrics['section_scores'] if s['issues']]
+    if bad_sections:
+        print(f"    Problem sections: {len(bad_sections)}/{len(metrics['section_scores'])}")
+        for s in sorted(bad_sections, key=lambda s: (s['score'], -s['chars']))[:3 if verbose else 1]:
+            print(f"      {s['score']:>3}  {s['path']} {s['title'][:40]} ({', '.join(s['issues'])})")
+    bad_pages = [p['page'] for p in metrics['page_scores'] if p['issues']]
+    if bad_pages:
+        print(f"    Problem pages: {len(bad_pages)}/{len(metrics['page_scores'])} "
+              f"(first: {', '.join(str(p) for p in bad_pages[:10])})")
+    print()
 
 
 def main():
@@ -220,74 +140,80 @@ def main():
     parser.add_argument('--limit', type=int, help='Limit number of manuals to test')
     parser.add_argument('--method', type=str, help='Filter by extraction method')
     parser.add_argument('--verbose', '-v', action='store_true', help='Show detailed output')
-    parser.add_argument('--fix', action='store_true', help='Mark low-quality manuals as pending for re-extraction')
+    parser.add_argument('--fix', action='store_true',
+                        help='Requeue low-quality manuals for re-extraction (scores are saved to manual_quality)')
+    parser.add_argument('--audit', action='store_true',
+                        help='Save scores to manual_quality and skip manuals whose content is unchanged')
+    parser.add_argument('--force', action='store_true', help='With --audit, rescore unchanged manuals too')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Scoring processes')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='Manuals fetched per request')
     args = parser.parse_args()
 
-    print("🔍 Manual Content Quality Test")
+    print("🔍 Manual Content Quality Test" + (" (audit)" if args.audit else ""))
     print("=" * 50)
-
-    # Get extracted manuals
-    manuals = get_extracted_manuals(limit=args.limit)
-
-    if not manuals:
-        print("No extracted manuals found!")
-        return
-
-    print(f"\n📋 Testing {len(manuals)} extracted manuals...\n")
+    print(f"\n📋 Testing extracted manuals with {args.workers} workers...\n")
 
     results = {
         'passed': 0,
         'failed': 0,
+        'skipped': 0,
         'by_method': {},
-        'failed_manuals': []
+        'failed_manuals': [],
+        'scoring_seconds': 0.0
     }
-
-    for i, manual in enumerate(manuals, 1):
-        name = f"{manual['year']} {manual['make']} {manual['model']}"
-
-        # Get content
-        content, sections, method = get_manual_content(manual['id'])
-
-        # Filter by method if specified
-        if args.method and method != args.method:
-            continue
-
-        # Track by method
-        if method not in results['by_method']:
-            results['by_method'][method] = {'passed': 0, 'failed': 0}
-
-        # Evaluate quality
-        metrics = evaluate_quality(content, sections)
-
-        if metrics['passed']:
-            results['passed'] += 1
-            results['by_method'][method]['passed'] += 1
-            status = "✅ PASS"
-        else:
-            results['failed'] += 1
-            results['by_method'][method]['failed'] += 1
-            results['failed_manuals'].append({
-                'id': manual['id'],
-                'name': name,
-                'method': method,
-                'score': metrics['score'],
-                'issues': metrics['issues']
-            })
-            status = "❌ FAIL"
-
-        if args.verbose or not metrics['passed']:
-            print(f"[{i}/{len(manuals)}] {status} {name}")
-            print(f"    Method: {method}")
-            print(f"    Score: {metrics['score']}/100")
-            print(f"    Content: {metrics['content_length']:,} chars, {metrics['section_count']} sections")
-            if metrics['issues']:
-                for issue in metrics['issues']:
-                    print(f"    ⚠️  {issue}")
-            if metrics['garbled_examples'] and args.verbose:
-                print(f"    Garbled samples: {metrics['garbled_examples'][:3]}")
-            print()
-        elif i % 10 == 0:
-            print(f"  Tested {i}/{len(manuals)}...")
+    start_time = time.time()
+    tested = 0
+
+    def collect(scored: list):
+        """Report and save one page of scores (futures from the previous page)"""
+        nonlocal tested
+        rows = []
+        for manual, future in scored:
+            metrics = future.result()
+            tested += 1
+            method = manual['extraction_method']
+            name = f"{manual['year']} {manual['make']} {manual['model']}"
+            results['by_method'].setdefault(method, {'passed': 0, 'failed': 0})
+            if metrics['passed']:
+                results['passed'] += 1
+                results['by_method'][method]['passed'] += 1
+            else:
+                results['failed'] += 1
+                results['by_method'][method]['failed'] += 1
+                results['failed_manuals'].append({
+                    'id': manual['manual_id'],
+                    'name': name,
+                    'method': method,
+                    'score': metrics['score'],
+                    'issues': metrics['issues']
+                })
+            if args.verbose or not metrics['passed']:
+                print_manual(tested, name, method, metrics, args.verbose)
+            elif tested % 50 == 0:
+                print(f"  Tested {tested}...")
+            rows.append(quality_row(manual, metrics))
+
+        # --fix saves too: requeue priority and extractor routing are computed from manual_quality
+        if (args.audit or args.fix) and rows:
+            upsert_rows(supabase, 'manual_quality', rows, on_conflict='manual_id,extraction_method')
+
+    pages = iter_audit_pages(method=args.method, force=args.force or not args.audit,
+                             page_size=args.page_size, limit=args.limit)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        previous = []
+        for page in pages:
+            scored = []
+            for manual in page:
+                if manual['content_markdown'] is None:
+                    results['skipped'] += 1
+                    continue
+                scored.append((manual, pool.submit(score_manual, manual['content_markdown'],
+                                                   manual['section_count'])))
+            # This page scores while the previous one is reported and the next one fetched
+            collect(previous)
+            previous = scored
+        collect(previous)
+    results['scoring_seconds'] = time.time() - start_time
 
     # Print summary
     print("\n" + "=" * 50)
@@ -300,13 +226,23 @@ def main():
         print(f"\n  Total tested: {total}")
         print(f"  ✅ Passed: {results['passed']} ({pass_rate:.1f}%)")
         print(f"  ❌ Failed: {results['failed']} ({100-pass_rate:.1f}%)")
+    if results['skipped']:
+        print(f"  ⏭️  Unchanged since last audit: {results['skipped']}")
+    print(f"  ⏱️  {results['scoring_seconds']:.1f}s ({total / max(results['scoring_seconds'], 0.001):.1f} manuals/s)")
 
     print("\n  By Extraction Method:")
-    for method, counts in results['by_method'].items():
-        total_method = counts['passed'] + counts['failed']
-        if total_method > 0:
-            rate = (counts['passed'] / total_method) * 100
-            print(f"    {method}: {counts['passed']}/{total_method} passed ({rate:.1f}%)")
+    if args.audit:
+        # Corpus-wide, including manuals skipped as unchanged
+        for row in supabase.rpc('get_quality_summary').execute().data or []:
+            rate = (row['passed'] / row['manuals']) * 100 if row['manuals'] else 0
+            print(f"    {row['extraction_method']}: {row['passed']}/{row['manuals']} passed "
+                  f"({rate:.1f}%, avg score {row['avg_score']:.0f})")
+    else:
+        for method, counts in results['by_method'].items():
+            total_method = counts['passed'] + counts['failed']
+            if total_method > 0:
+                rate = (counts['passed'] / total_method) * 100
+                print(f"    {method}: {counts['passed']}/{total_method} passed ({rate:.1f}%)")
 
     if results['failed_manuals']:
         print(f"\n  Failed manuals ({len(results['failed_manuals'])}):")
@@ -315,14 +251,13 @@ def main():
         if len(results['failed_manuals']) > 10:
             print(f"    ... and {len(results['failed_manuals']) - 10} more")
 
-    # Fix option: mark failed manuals for re-extraction
+    # Fix option: requeue failed manuals for re-extraction
     if args.fix and results['failed_manuals']:
-        print(f"\n🔧 Marking {len(results['failed_manuals'])} failed manuals for re-extraction...")
-        for fm in results['failed_manuals']:
-            supabase.table('vehicle_manuals').update({
-                'content_status': 'pending'
-            }).eq('id', fm['id']).execute()
-        print("  Done! These will be re-extracted with marker-pdf.")
+        print(f"\n🔧 Requeueing {len(results['failed_manuals'])} failed manuals for re-extraction...")
+        requeued = requeue_manuals(supabase, [
+            {'manual_id': fm['id'], 'reason': requeue_reason(fm)} for fm in results['failed_manuals']
+        ])
+        print(f"  Done! {requeued} requeued, worst scores and most-requested vehicles first.")
 
     print()
 
@@ -0,0 +1,381 @@
+"""
+Extraction quality heuristics.
+
+Shared by quality-test.py (scoring of extracted content) and
+tiered_extract.py (per-page scoring of the fast pymupdf pass, to decide
+which pages need marker OCR).
+
+Scoring is a handful of linear byte-level scans rather than a regex pass
+per metric. The text is viewed as bytes: latin-1, with every other
+character replaced by one byte of the same class (0xa0 for whitespace,
+0xaa for letters and digits, 0x80 otherwise), so offsets line up with the
+str and whitespace, word characters and str.split() behave as they
+would on the str. Then:
+
+  - translate() maps it onto character classes, so each garbled pattern
+    is a search for a literal run (b'a a a', b'AAAAAAAAAA', ...) that the
+    regex engine skips straight to instead of trying every position
+  - repeated letters ("aaaaa") are one backreference search on the view
+  - special characters, words and letter words are counted with
+    translate(None, ...), split() and bytes.isalpha, all in C
+
+Only the (rare) garbled runs reach Python. Counts are additive, so header
+and page-separator lines split the text into pieces that roll up into
+per-section scores (keyed by the manual_sections path), per-page scores
+(from marker's --paginate_output separators, which the marker and tiered
+extractors write; sections.py leaves them out of manual_sections) and the
+whole-manual score:
+
+    metrics = evaluate_quality(markdown, sections)
+    metrics['score'], metrics['issues']
+    metrics['section_scores']   # [{'path', 'title', 'chars', 'score', 'issues'}]
+    metrics['page_scores']      # [{'page', 'chars', 'score', 'issues'}], [] if unpaginated
+"""
+
+import bisect
+import re
+import string
+from typing import Union
+
+from sections import MAX_HEADER_LEVEL, INTRO_TITLE, clean_title
+
+# Quality thresholds
+MIN_CONTENT_LENGTH = 5000       # Minimum characters (manuals should be substantial)
+MIN_SECTIONS = 5                # Minimum number of sections
+MIN_HEADERS = 3                 # Minimum markdown headers
+MAX_GARBLED_RATIO = 0.05        # Max ratio of garbled text patterns
+MIN_WORD_LENGTH_AVG = 3.5       # Average word length (garbled text has weird lengths)
+MAX_SPECIAL_CHAR_RATIO = 0.15   # Max ratio of special characters
+MAX_SPACING_RATIO = 0.01        # Max ratio of spaced-out words ("t h i s")
+
+# Per-page thresholds (tiered extraction)
+MIN_PAGE_CHARS = 40             # Less text than this on a page with images = image-only page
+MIN_PAGE_WORDS = 20             # Word-length check is meaningless on shorter pages
+PAGE_PASS_SCORE = 70
+
+MAX_EXAMPLES = 5
+
+
+LOWER = string.ascii_lowercase.encode()
+UPPER = string.ascii_uppercase.encode()
+DIGITS = string.digits.encode()
+# What \w matches: ASCII word characters plus latin-1 letters and digits (é, ñ, ², ...)
+WORD_CHARS = frozenset(LOWER + UPPER + DIGITS + b'_' + bytes(c for c in range(0x80, 0x100) if chr(c).isalnum()))
+WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f\x85\xa0'   # What \s and str.split() treat as whitespace
+CONTROL = bytes(range(0x00, 0x09)) + b'\x0b\x0c' + bytes(range(0x0e, 0x20))
+NOT_SPECIAL = (string.ascii_letters + string.digits + '.,!?-:;\'"()').encode() + WHITESPACE
+
+
+def _classes(groups: dict, default: str) -> bytes:
+    """translate() table mapping each group of bytes to one class byte"""
+    table = bytearray(ord(default) for _ in range(256))
+    for chars, cls in groups.items():
+        for char in chars:
+            table[char] = ord(cls)
+    return bytes(table)
+
+
+# Letters and whitespace: spaced-out text is a run of b'a a a'
+SPACING = _classes({LOWER + UPPER: 'a', WHITESPACE: ' '}, '.')
+# Uppercase, digits and non-ASCII: long runs of b'A', b'0' or b'N'
+SHAPES = _classes({UPPER: 'A', DIGITS: '0', bytes(range(0x80, 0x100)): 'N'}, '.')
+# Whitespace-separated words: count the starts of b'x' runs
+WORD_BREAKS = _classes({WHITESPACE: ' '}, 'x')
+# Letter/digit/underscore runs kept, everything else a space: the tokens
+# that are all letters are the \b[a-zA-Z]+\b words
+WORD_SPLIT = bytes(c if c in WORD_CHARS else ord(' ') for c in range(256))
+
+# Garbled text, common in bad PDF extraction; each is a literal run in a class view
+SPACED_RE = re.compile(rb'a a a(?:(?: a)+|(?!a))')  # Spaced out characters: "t h i s"
+UPPER_RE = re.compile(b'A' * 10 + b'+')             # Long uppercase strings
+NONASCII_RE = re.compile(b'N' * 5 + b'+')           # Long non-ASCII sequences
+DIGITS_RE = re.compile(b'0' * 20 + b'+')            # Very long numbers
+REPEAT_RE = re.compile(rb'([a-zA-Z])\1{4,}')        # Repeated characters: "aaaaa"
+UPPERCASE_RE = re.compile(rb'[A-Z]')
+# Control characters count one each (see _count_piece)
+
+# Markdown headers (same rule as sections.HEADER_RE, without crossing lines)
+# and marker --paginate_output page separators: "{12}" + 48 dashes
+BOUNDARY_RE = re.compile(rb'^(?:(#{1,6})[^\S\n]+(.+)|\{(\d+)\}-{48}[^\S\n]*)$', re.MULTILINE)
+
+
+NON_LATIN1_RE = re.compile('[^\x00-\xff]')
+
+
+def _view_char(match: re.Match) -> str:
+    """Latin-1 stand-in for a character outside latin-1: whitespace, word character or other"""
+    char = match.group()
+    return '\xa0' if char.isspace() else '\xaa' if char.isalnum() else '\x80'
+
+
+def _view(text: str) -> bytes:
+    """The latin-1 byte view of text (see the module docstring)"""
+    try:
+        return text.encode('latin-1')
+    except UnicodeEncodeError:
+        return NON_LATIN1_RE.sub(_view_char, text).encode('latin-1')
+
+
+def new_counts() -> dict:
+    return {'chars': 0, 'words': 0, 'letter_words': 0, 'letters': 0, 'special': 0,
+            'garbled': 0, 'spaced': 0, 'examples': []}
+
+
+def add_counts(total: dict, counts: dict):
+    for key, value in counts.items():
+        if key == 'examples':
+            total['examples'].extend(value[:MAX_EXAMPLES - len(total['examples'])])
+        else:
+            total[key] += value
+
+
+def _count_piece(view: bytes, counts: dict):
+    """Add the character, word, special and control character counts of one piece"""
+    if not view:
+        return
+    letter_words = list(filter(bytes.isalpha, view.translate(WORD_SPLIT).split()))
+    breaks = view.translate(WORD_BREAKS)
+
+    counts['chars'] += len(view)
+    counts['words'] += breaks.count(b' x') + (breaks[:1] == b'x')
+    counts['letter_words'] += len(letter_words)
+    counts['letters'] += sum(map(len, letter_words))
+    counts['special'] += len(view.translate(None, NOT_SPECIAL))
+    counts['garbled'] += len(view) - len(view.translate(None, CONTROL))
+
+
+def _garbled_runs(text: str, view: bytes):
+    """
+    Yield (offset, garbled hits, spaced-out words, example) for each garbled
+    run, counted the way re.findall of the original patterns counts them.
+    """
+    for match in SPACED_RE.finditer(view.translate(SPACING)):
+        start, end = match.span()
+        letters = view[start:end:2]
+        # "[a-z]\s[a-z]\s[a-z]\s[a-z]": lowercase only, may start/end inside a word
+        hits = sum(len(run) // 4 for run in UPPERCASE_RE.split(letters))
+        # "\b[a-zA-Z]\s[a-zA-Z]\s[a-zA-Z]\b": single letters only
+        single = len(letters)
+        single -= start > 0 and view[start - 1] in WORD_CHARS
+        single -= end < len(view) and view[end] in WORD_CHARS
+        yield start, hits, max(single, 0) // 3, text[start:end]
+
+    shapes = view.translate(SHAPES)
+    for pattern in (UPPER_RE, NONASCII_RE, DIGITS_RE):
+        for match in pattern.finditer(shapes):
+            yield match.start(), 1, 0, text[match.start():match.end()]
+
+    # Stand-in bytes are never ASCII letters, so runs match as on the str
+    for match in REPEAT_RE.finditer(view):
+        yield match.start(), 1, 0, text[match.start():match.end()]
+
+
+def scan_markdown(content: str) -> dict:
+    """
+    Count quality signals for the whole text, each section and each page.
+
+    Returns {'total': counts, 'sections': [{'path', 'title', 'counts'}],
+    'pages': [{'page', 'counts'}], 'headers': [titles]}.
+    """
+    view = _view(content)
+    sections = [{'path': '0', 'title': INTRO_TITLE, 'counts': new_counts()}]
+    pages = []
+    headers = []
+    pieces = []  # (start, end, section, page, is_header)
+    counters = [0] * MAX_HEADER_LEVEL
+    section, page = sections[0], None
+    start = 0
+
+    # Section paths and titles follow sections.iter_sections
+    for match in BOUNDARY_RE.finditer(view):
+        pieces.append((start, match.start(), section, page, False))
+        if match.group(1):
+            level = len(match.group(1))
+            counters[level - 1] += 1
+            for i in range(level, MAX_HEADER_LEVEL):
+                counters[i] = 0
+            title = content[match.start(2):match.end(2)]
+            headers.append(title)
+            section = {
+                'path': '.'.join(str(c) for c in counters[:level]),
+                'title': clean_title(title),
+                'counts': new_counts(),
+            }
+            sections.append(section)
+            pieces.append((match.start(), match.end(), section, page, True))
+        else:
+            page = {'page': int(match.group(3)), 'counts': new_counts()}
+            pages.append(page)
+        start = match.end()         # Separator lines aren't content
+    pieces.append((start, len(content), section, page, False))
+
+    piece_counts = []
+    for piece_start, piece_end, section, page, is_header in pieces:
+        piece = view[piece_start:piece_end]
+        counts = new_counts()
+        _count_piece(piece, counts)
+        piece_counts.append(counts)
+        if not is_header and piece and not piece.isspace():
+            section['has_content'] = True
+
+    # Garbled runs count towards the piece they start in
+    starts = [piece[0] for piece in pieces]
+    for offset, hits, spaced, example in _garbled_runs(content, view):
+        counts = piece_counts[bisect.bisect_right(starts, offset) - 1]
+        counts['garbled'] += hits
+        counts['spaced'] += spaced
+        if hits and len(counts['examples']) < MAX_EXAMPLES:
+            counts['examples'].append(example[:40])
+
+    total = new_counts()
+    for (_, _, section, page, _), counts in zip(pieces, piece_counts):
+        add_counts(section['counts'], counts)
+        if page is not None:
+            add_counts(page['counts'], counts)
+        add_counts(total, counts)
+
+    # Sections without content aren't stored (see sections.iter_sections)
+    sections = [s for s in sections if s.get('has_content')]
+    return {'total': total, 'sections': sections, 'pages': pages, 'headers': headers}
+
+
+def score_counts(counts: dict) -> dict:
+    """
+    Score a piece of text from its counts with the garbled, spacing,
+    word-length and special-character checks (no length, section or header
+    requirements). Returns {'score', 'issues', 'passed'} and the ratios.
+    """
+    chars = max(counts['chars'], 1)
+    garbled_ratio = counts['garbled'] / chars
+    spacing_ratio = counts['spaced'] / counts['words'] if counts['words'] else 0
+    avg_word_length = counts['letters'] / counts['letter_words'] if counts['letter_words'] else 0
+    special_char_ratio = counts['special'] / chars
+
+    score = 100
+    issues = []
+    # Garbled or spaced-out text fails on its own: a page that is nothing
+    # but either still scores 75-80, and re-extracting it is the point
+    severe = False
+    if garbled_ratio > MAX_GARBLED_RATIO:
+        issues.append(f"garbled {garbled_ratio:.2%}")
+        score -= 25
+        severe = True
+    if spacing_ratio > MAX_SPACING_RATIO:
+        issues.append(f"spacing {spacing_ratio:.2%}")
+        score -= 20
+        severe = True
+    if counts['words'] >= MIN_PAGE_WORDS and avg_word_length < MIN_WORD_LENGTH_AVG:
+        issues.append(f"avg word length {avg_word_length:.1f}")
+        score -= 15
+    if special_char_ratio > MAX_SPECIAL_CHAR_RATIO:
+        issues.append(f"special chars {special_char_ratio:.2%}")
+        score -= 10
+
+    score = max(0, score)
+    return {
+        'score': score,
+        'issues': issues,
+        'passed': score >= PAGE_PASS_SCORE and not severe,
+        'garbled_ratio': garbled_ratio,
+        'spacing_ratio': spacing_ratio,
+        'avg_word_length': avg_word_length,
+        'special_char_ratio': special_char_ratio,
+    }
+
+
+def evaluate_quality(content: str, sections: Union[list, int]) -> dict:
+    """
+    Evaluate the quality of extracted content (sections: the manual's
+    sections, or just their count)
+    Returns quality metrics and pass/fail status, plus per-section and
+    per-page scores
+    """
+    scan = scan_markdown(content)
+    total = scan['total']
+    ratios = score_counts(total)
+
+    metrics = {
+        'content_length': len(content),
+        'section_count': sections if isinstance(sections, int) else len(sections),
+        'header_count': len(scan['headers']),
+        'sample_headers': scan['headers'][:5],
+        'garbled_ratio': ratios['garbled_ratio'],
+        'garbled_examples': total['examples'],
+        'spacing_ratio': ratios['spacing_ratio'],
+        'avg_word_length': ratios['avg_word_length'],
+        'special_char_ratio': ratios['special_char_ratio'],
+        'issues': [],
+        'score': 100,
+        'passed': True
+    }
+
+    # Check content length
+    if metrics['content_length'] < MIN_CONTENT_LENGTH:
+        metrics['issues'].append(f"Content too short: {metrics['content_length']:,} chars (min: {MIN_CONTENT_LENGTH:,})")
+        metrics['score'] -= 30
+
+    # Check section count
+    if metrics['section_count'] < MIN_SECTIONS:
+        metrics['issues'].append(f"Too few sections: {metrics['section_count']} (min: {MIN_SECTIONS})")
+        metrics['score'] -= 20
+
+    # Check headers
+    if metrics['header_count'] < MIN_HEADERS:
+        metrics['issues'].append(f"Too few headers: {metrics['header_count']} (min: {MIN_HEADERS})")
+        metrics['score'] -= 15
+
+    # Check for garbled text
+    if metrics['garbled_ratio'] > MAX_GARBLED_RATIO:
+        metrics['issues'].append(f"High garbled text ratio: {metrics['garbled_ratio']:.2%} (max: {MAX_GARBLED_RATIO:.2%})")
+        metrics['score'] -= 25
+
+    # Check character spacing
+    if metrics['spacing_ratio'] > MAX_SPACING_RATIO:
+        metrics['issues'].append(f"Character spacing issues: {metrics['spacing_ratio']:.2%}")
+        metrics['score'] -= 20
+
+    # Check average word length
+    if metrics['avg_word_length'] < MIN_WORD_LENGTH_AVG:
+        metrics['issues'].append(f"Low avg word length: {metrics['avg_word_length']:.1f} (min: {MIN_WORD_LENGTH_AVG})")
+        metrics['score'] -= 15
+
+    # Check special character ratio
+    if metrics['special_char_ratio'] > MAX_SPECIAL_CHAR_RATIO:
+        metrics['issues'].append(f"High special char ratio: {metrics['special_char_ratio']:.2%} (max: {MAX_SPECIAL_CHAR_RATIO:.2%})")
+        metrics['score'] -= 10
+
+    # Determine pass/fail
+    metrics['score'] = max(0, metrics['score'])
+    metrics['passed'] = metrics['score'] >= 70 and len(metrics['issues']) <= 2
+
+    # Where the problems are
+    metrics['section_scores'] = []
+    for s in scan['sections']:
+        score = score_counts(s['counts'])
+        metrics['section_scores'].append({'path': s['path'], 'title': s['title'], 'chars': s['counts']['chars'],
+                                          'score': score['score'], 'issues': score['issues']})
+    metrics['page_scores'] = []
+    for p in scan['pages']:
+        score = score_counts(p['counts'])
+        metrics['page_scores'].append({'page': p['page'], 'chars': p['counts']['chars'],
+                                       'score': score['score'], 'issues': score['issues']})
+
+    return metrics
+
+
+def score_page(text: str) -> dict:
+    """
+    Score the text extracted from a single page.
+
+    Uses the same garbled/spacing/word-length/special-character checks as
+    evaluate_quality, without the whole-manual length, section and header
+    requirements. Returns {'score', 'issues', 'passed'}.
+    """
+    view = _view(text)
+    counts = new_counts()
+    _count_piece(view, counts)
+    for _, hits, spaced, _ in _garbled_runs(text, view):
+        counts['garbled'] += hits
+        counts['spaced'] += spaced
+    score = score_counts(counts)
+    return {'score': score['score'], 'issues': score['issues'], 'passed': score['passed']}
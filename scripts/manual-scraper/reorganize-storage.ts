@@ -5,6 +5,10 @@ import 'dotenv/config';
 /**
  * Reorganize storage files into folder structure:
  * vehicle_manuals/{make}/{model}/{year}[-variant].pdf
+ *
+ * Only for legacy per-row objects. Hash-keyed objects (pdf/{sha[:2]}/{sha}.pdf,
+ * see storage_upload.py) and any object shared by several rows are left
+ * alone: moving one would delete the file its sibling rows still point at.
  */
 
 import { createClient } from '@supabase/supabase-js';
@@ -42,9 +46,24 @@ async function reorganizeStorage() {
 
   console.log(`Found ${manuals.length} manuals to reorganize\n`);
 
+  // Rows per storage object
+  const references = new Map<string, number>();
+  for (const manual of manuals) {
+    references.set(manual.pdf_storage_path, (references.get(manual.pdf_storage_path) ?? 0) + 1);
+  }
+
   for (const manual of manuals) {
     const oldPath = manual.pdf_storage_path;
 
+    if (oldPath.startsWith('pdf/')) {
+      console.log(`⏭️  ${manual.year} ${manual.make} ${manual.model}: hash-keyed object, skipping`);
+      continue;
+    }
+    if ((references.get(oldPath) ?? 0) > 1) {
+      console.log(`⏭️  ${manual.year} ${manual.make} ${manual.model}: ${oldPath} is shared by ${references.get(oldPath)} rows, skipping`);
+      continue;
+    }
+
     // Build new path: {make}/{model}/{year}-{make}-{model}[-variant].pdf
     const makeSlug = toSlug(manual.make);
     const modelSlug = toSlug(manual.model);
@@ -85,7 +104,18 @@ async function reorganizeStorage() {
       continue;
     }
 
-    // Delete old file
+    // Delete old file, unless a row we didn't fetch still points at it
+    const { count: remaining } = await supabase
+      .from('vehicle_manuals')
+      .select('id', { count: 'exact', head: true })
+      .eq('pdf_storage_path', oldPath);
+
+    if (remaining !== 0) {
+      console.log(`   ℹ️  ${oldPath} still referenced, not deleting`);
+      console.log(`   ✅ Done`);
+      continue;
+    }
+
     const { error: deleteError } = await supabase.storage
       .from(BUCKET_NAME)
       .remove([oldPath]);
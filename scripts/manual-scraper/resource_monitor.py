@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+CPU, memory, disk and network sampler for extraction workers.
+
+Reads /proc directly on Linux and falls back to psutil elsewhere (macOS).
+Each sample carries system-wide rates plus one entry per marker process.
+Workers start marker with CARINTEL_MANUAL_ID in its environment
+(marker_env()), so each process entry, and the processes it spawns, is
+tagged with the manual it is extracting.
+
+    sampler = ResourceSampler()
+    sample = sampler.sample()        # rates since the previous call
+    print(format_sample(sample))
+    sample['manuals'][manual_id]     # {'cpu_percent', 'rss', 'swap', 'processes'}
+
+Usage:
+    python resource_monitor.py                           # Print a sample every 5 seconds
+    python resource_monitor.py --out resources.jsonl     # Also append samples as JSON lines
+    python resource_monitor.py --summary resources.jsonl # Per-manual peaks and a --workers suggestion
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+MANUAL_ID_ENV = 'CARINTEL_MANUAL_ID'
+
+# Processes counted as marker runs even without a manual id
+# (marker_single, marker, marker_server.py)
+MARKER_NAMES = ('marker',)
+
+# Block devices that would double count (stacked on real disks) or aren't disks
+VIRTUAL_DISK_PREFIXES = ('loop', 'ram', 'zram', 'dm-', 'md', 'sr')
+
+
+def marker_env(manual_id: Optional[str], env: Optional[dict] = None) -> dict:
+    """Environment for a marker subprocess, tagged with the manual it extracts"""
+    env = dict(os.environ if env is None else env)
+    if manual_id:
+        env[MANUAL_ID_ENV] = str(manual_id)
+    return env
+
+
+def _script_name(argv: list) -> str:
+    """'marker_single' for ['/venv/bin/python', '/venv/bin/marker_single', ...]"""
+    names = [os.path.basename(arg) for arg in argv[:2]]
+    if len(names) > 1 and names[0].startswith('python'):
+        return names[1]
+    return names[0] if names else ''
+
+
+# =============================================
+# Backends: cumulative counters
+# =============================================
+
+class ProcBackend:
+    """Linux counters from /proc"""
+
+    def __init__(self, root: str = '/proc'):
+        self.root = Path(root)
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        disks = Path('/sys/block')
+        self.disks = {d.name for d in disks.iterdir() if not d.name.startswith(VIRTUAL_DISK_PREFIXES)} \
+            if disks.exists() else None
+
+    def _read(self, *parts) -> str:
+        return self.root.joinpath(*parts).read_text()
+
+    def cpu(self) -> dict:
+        # cpu  user nice system idle iowait irq softirq steal ...
+        fields = [int(v) for v in self._read('stat').split('\n', 1)[0].split()[1:9]]
+        return {'total': sum(fields), 'idle': fields[3], 'iowait': fields[4]}
+
+    def memory(self) -> dict:
+        info = {}
+        for line in self._read('meminfo').splitlines():
+            key, value = line.split(':', 1)
+            info[key] = int(value.split()[0]) * 1024
+        vmstat = dict(line.split() for line in self._read('vmstat').splitlines())
+        return {
+            'total': info['MemTotal'],
+            'available': info.get('MemAvailable', info['MemFree']),
+            'swap_used': info['SwapTotal'] - info['SwapFree'],
+            'swap_in': int(vmstat.get('pswpin', 0)) * self.page_size,
+            'swap_out': int(vmstat.get('pswpout', 0)) * self.page_size,
+        }
+
+    def disk(self) -> tuple:
+        read = written = 0
+        for line in self._read('diskstats').splitlines():
+            fields = line.split()
+            if self.disks is not None and fields[2] not in self.disks:
+                continue
+            read += int(fields[5]) * 512     # sectors are always 512 bytes here
+            written += int(fields[9]) * 512
+        return read, written
+
+    def network(self) -> tuple:
+        rx = tx = 0
+        for line in self._read('net/dev').splitlines()[2:]:
+            name, data = line.split(':', 1)
+            if name.strip() == 'lo':
+                continue
+            fields = data.split()
+            rx += int(fields[0])
+            tx += int(fields[8])
+        return rx, tx
+
+    def processes(self) -> dict:
+        found = {}
+        for entry in self.root.iterdir():
+            if not entry.name.isdigit():
+                continue
+            try:
+                argv = (entry / 'cmdline').read_bytes().split(b'\0')
+                argv = [arg.decode('utf-8', 'replace') for arg in argv if arg]
+                if not argv:
+                    continue
+                name = _script_name(argv)
+                manual_id = None
+                # Only python/marker processes can be ours; skip reading everyone's environ
+                if name.startswith(MARKER_NAMES) or os.path.basename(argv[0]).startswith('python'):
+                    for var in (entry / 'environ').read_bytes().split(b'\0'):
+                        if var.startswith(MANUAL_ID_ENV.encode() + b'='):
+                            manual_id = var.split(b'=', 1)[1].decode()
+                            break
+                if manual_id is None and not name.startswith(MARKER_NAMES):
+                    continue
+
+                stat = (entry / 'stat').read_text()
+                fields = stat[stat.rindex(')') + 2:].split()
+                status = {}
+                for line in (entry / 'status').read_text().splitlines():
+                    if line.startswith(('VmRSS:', 'VmSwap:')):
+                        key, value = line.split(':', 1)
+                        status[key] = int(value.split()[0]) * 1024
+            except (FileNotFoundError, ProcessLookupError, PermissionError, ValueError):
+                continue  # Exited mid-read, or not ours to inspect
+
+            found[int(entry.name)] = {
+                'name': name,
+                'manual_id': manual_id,
+                'cpu_seconds': (int(fields[11]) + int(fields[12])) / self.clock_ticks,
+                'rss': status.get('VmRSS', 0),
+                'swap': status.get('VmSwap', 0),
+            }
+        return found
+
+
+class PsutilBackend:
+    """Counters from psutil (macOS and anywhere without /proc)"""
+
+    def __init__(self):
+        import psutil
+        self.psutil = psutil
+
+    def cpu(self) -> dict:
+        times = self.psutil.cpu_times()
+        return {'total': sum(times), 'idle': times.idle, 'iowait': getattr(times, 'iowait', 0)}
+
+    def memory(self) -> dict:
+        memory = self.psutil.virtual_memory()
+        swap = self.psutil.swap_memory()
+        return {
+            'total': memory.total,
+            'available': memory.available,
+            'swap_used': swap.used,
+            'swap_in': swap.sin,
+            'swap_out': swap.sout,
+        }
+
+    def disk(self) -> tuple:
+        counters = self.psutil.disk_io_counters()
+        return (counters.read_bytes, counters.write_bytes) if counters else (0, 0)
+
+    def network(self) -> tuple:
+        counters = self.psutil.net_io_counters()
+        return counters.bytes_recv, counters.bytes_sent
+
+    def processes(self) -> dict:
+        found = {}
+        for process in self.psutil.process_iter(['pid', 'cmdline']):
+            try:
+                argv = process.info['cmdline'] or []
+                if not argv:
+                    continue
+                name = _script_name(argv)
+                manual_id = None
+                if name.startswith(MARKER_NAMES) or os.path.basename(argv[0]).startswith('python'):
+                    manual_id = process.environ().get(MANUAL_ID_ENV)
+                if manual_id is None and not name.startswith(MARKER_NAMES):
+                    continue
+                cpu = process.cpu_times()
+                found[process.pid] = {
+                    'name': name,
+                    'manual_id': manual_id,
+                    'cpu_seconds': cpu.user + cpu.system,
+                    'rss': process.memory_info().rss,
+                    'swap': None,  # Not reported per process outside Linux
+                }
+            except (self.psutil.NoSuchProcess, self.psutil.AccessDenied, self.psutil.ZombieProcess):
+                continue
+        return found
+
+
+def default_backend():
+    if sys.platform.startswith('linux') and os.path.exists('/proc/stat'):
+        return ProcBackend()
+    try:
+        return PsutilBackend()
+    except ImportError:
+        raise RuntimeError("No /proc on this platform; install psutil: pip install psutil")
+
+
+# =============================================
+# Sampler
+# =============================================
+
+class ResourceSampler:
+    """Turns cumulative counters into per-interval rates"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or default_backend()
+        self.cpu_count = os.cpu_count() or 1
+        self._last = None
+
+    def _counters(self) -> dict:
+        return {
+            'time': time.time(),
+            'cpu': self.backend.cpu(),
+            'memory': self.backend.memory(),
+            'disk': self.backend.disk(),
+            'network': self.backend.network(),
+            'processes': self.backend.processes(),
+        }
+
+    def sample(self, warmup: float = 1.0) -> dict:
+        """
+        Rates since the previous sample. The first call measures over
+        `warmup` seconds so it never returns empty rates.
+        """
+        if self._last is None:
+            self._last = self._counters()
+            time.sleep(warmup)
+        previous, current = self._last, self._counters()
+        self._last = current
+
+        elapsed = max(current['time'] - previous['time'], 1e-6)
+        cpu_total = max(current['cpu']['total'] - previous['cpu']['total'], 1e-6)
+        idle = current['cpu']['idle'] - previous['cpu']['idle']
+        iowait = current['cpu']['iowait'] - previous['cpu']['iowait']
+        memory, last_memory = current['memory'], previous['memory']
+
+        def rate(now, before):
+            return max(now - before, 0) / elapsed
+
+        processes = []
+        manuals = {}
+        for pid, proc in current['processes'].items():
+            before = previous['processes'].get(pid)
+            # New since the last sample: average over the time we've seen it (none yet)
+            cpu_percent = rate(proc['cpu_seconds'], before['cpu_seconds']) * 100 if before else None
+            entry = {'pid': pid, **{k: v for k, v in proc.items() if k != 'cpu_seconds'}, 'cpu_percent': cpu_percent}
+            processes.append(entry)
+
+            if proc['manual_id']:
+                totals = manuals.setdefault(proc['manual_id'], {'cpu_percent': 0.0, 'rss': 0, 'swap': 0, 'processes': 0})
+                totals['cpu_percent'] += cpu_percent or 0.0
+                totals['rss'] += proc['rss']
+                totals['swap'] += proc['swap'] or 0
+                totals['processes'] += 1
+
+        return {
+            'time': datetime.fromtimestamp(current['time'], timezone.utc).isoformat(),
+            'cpu_count': self.cpu_count,
+            'cpu_percent': (cpu_total - idle - iowait) / cpu_total * 100,
+            'iowait_percent': iowait / cpu_total * 100,
+            'mem_total': memory['total'],
+            'mem_available': memory['available'],
+            'swap_used': memory['swap_used'],
+            'swap_in_bps': rate(memory['swap_in'], last_memory['swap_in']),
+            'swap_out_bps': rate(memory['swap_out'], last_memory['swap_out']),
+            'disk_read_bps': rate(current['disk'][0], previous['disk'][0]),
+            'disk_write_bps': rate(current['disk'][1], previous['disk'][1]),
+            'net_rx_bps': rate(current['network'][0], previous['network'][0]),
+            'net_tx_bps': rate(current['network'][1], previous['network'][1]),
+            'processes': sorted(processes, key=lambda p: p['pid']),
+            'manuals': manuals,
+        }
+
+
+def is_swapping(sample: dict, min_bps: float = 1024 * 1024) -> bool:
+    """Memory pressure: paging in/out at more than min_bps, or a marker process with swapped-out pages"""
+    if sample['swap_in_bps'] + sample['swap_out_bps'] >= min_bps:
+        return True
+    return any(p['swap'] for p in sample['processes'])
+
+
+def format_sample(sample: dict) -> str:
+    mb = 1024 * 1024
+    gb = 1024 * mb
+    line = (f"cpu={sample['cpu_percent']:.0f}% (iowait {sample['iowait_percent']:.0f}%, {sample['cpu_count']} cores), "
+            f"mem_avail={sample['mem_available'] / gb:.1f}/{sample['mem_total'] / gb:.1f}GB, "
+            f"swap={sample['swap_used'] / gb:.1f}GB "
+            f"(in {sample['swap_in_bps'] / mb:.1f} / out {sample['swap_out_bps'] / mb:.1f} MB/s), "
+            f"disk r/w={sample['disk_read_bps'] / mb:.1f}/{sample['disk_write_bps'] / mb:.1f} MB/s, "
+            f"net rx/tx={sample['net_rx_bps'] / mb:.1f}/{sample['net_tx_bps'] / mb:.1f} MB/s, "
+            f"marker_procs={len(sample['processes'])}")
+    for manual_id, totals in sorted(sample['manuals'].items()):
+        line += (f"\n    manual {manual_id[:8]}: cpu={totals['cpu_percent']:.0f}% "
+                 f"rss={totals['rss'] / gb:.2f}GB swap={totals['swap'] / mb:.0f}MB "
+                 f"({totals['processes']} procs)")
+    return line
+
+
+# =============================================
+# Summaries
+# =============================================
+
+def summarize(path: str):
+    """Per-manual peak RSS and mean CPU from a samples file, and the --workers they support"""
+    samples = [json.loads(line) for line in open(path) if line.strip()]
+    if not samples:
+        print("No samples")
+        return
+
+    manuals = {}
+    for sample in samples:
+        for manual_id, totals in sample['manuals'].items():
+            stats = manuals.setdefault(manual_id, {'peak_rss': 0, 'peak_swap': 0, 'cpu': [], 'samples': 0})
+            stats['peak_rss'] = max(stats['peak_rss'], totals['rss'])
+            stats['peak_swap'] = max(stats['peak_swap'], totals['swap'])
+            stats['cpu'].append(totals['cpu_percent'])
+            stats['samples'] += 1
+
+    gb = 1024 ** 3
+    swapping = sum(1 for s in samples if is_swapping(s))
+    print(f"{len(samples)} samples, {len(manuals)} manuals, {swapping} samples under swap pressure\n")
+    if not manuals:
+        return
+
+    print(f"  {'Manual':<38} {'Samples':>7} {'Peak RSS':>9} {'Mean CPU':>9} {'Peak swap':>10}")
+    for manual_id, stats in sorted(manuals.items(), key=lambda i: -i[1]['peak_rss'])[:20]:
+        mean_cpu = sum(stats['cpu']) / len(stats['cpu'])
+        print(f"  {manual_id:<38} {stats['samples']:>7} {stats['peak_rss'] / gb:>8.2f}G {mean_cpu:>8.0f}% "
+              f"{stats['peak_swap'] / 1024 / 1024:>8.0f}MB")
+
+    # Size the pool for the heavy manuals, not the average one
+    peaks = sorted(stats['peak_rss'] for stats in manuals.values())
+    cores = sorted(sum(stats['cpu']) / len(stats['cpu']) / 100 for stats in manuals.values())
+    p95_rss = peaks[min(len(peaks) - 1, int(len(peaks) * 0.95))]
+    median_cores = cores[len(cores) // 2]
+    mem_total = samples[-1]['mem_total']
+    cpu_count = samples[-1]['cpu_count']
+
+    by_memory = int(mem_total * 0.85 // p95_rss) if p95_rss else None
+    by_cpu = int(cpu_count // median_cores) if median_cores >= 0.1 else None
+    print()
+    print(f"  p95 peak RSS per manual: {p95_rss / gb:.2f}GB of {mem_total / gb:.1f}GB -> "
+          f"{by_memory if by_memory is not None else '?'} workers fit in 85% of memory")
+    print(f"  median CPU per manual:   {median_cores:.1f} cores of {cpu_count} -> "
+          f"{by_cpu if by_cpu is not None else '?'} workers saturate the CPU")
+    limits = [n for n in (by_memory, by_cpu) if n is not None]
+    if limits:
+        print(f"  Suggested --workers {max(1, min(limits))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sample CPU, memory, disk and network for marker runs')
+    parser.add_argument('--interval', type=float, default=5, help='Seconds between samples')
+    parser.add_argument('--out', metavar='FILE', help='Append samples to FILE as JSON lines')
+    parser.add_argument('--summary', metavar='FILE', help='Summarize a samples file and exit')
+    args = parser.parse_args()
+
+    if args.summary:
+        summarize(args.summary)
+        return
+
+    sampler = ResourceSampler()
+    try:
+        while True:
+            sample = sampler.sample()
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {format_sample(sample)}")
+            if is_swapping(sample):
+                print("  ⚠️  Swapping - fewer workers would likely be faster")
+            if args.out:
+                with open(args.out, 'a') as f:
+                    f.write(json.dumps(sample) + '\n')
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\nStopped.")
+
+
+if __name__ == '__main__':
+    main()
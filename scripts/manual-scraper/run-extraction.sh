@@ -22,18 +22,8 @@ while true; do
     python extract-marker.py --workers 4 --limit 40
 
     # Check if there are more pending
-    PENDING=$(python -c "
-from supabase import create_client
-import os
-from dotenv import load_dotenv
-load_dotenv()
-supabase = create_client(
-    os.getenv('SUPABASE_URL', 'https://jxpbnnmefwtazfvoxvge.supabase.co'),
-    os.getenv('SUPABASE_SERVICE_KEY')
-)
-result = supabase.table('vehicle_manuals').select('id', count='exact').eq('content_status', 'pending').execute()
-print(result.count)
-")
+    # Single RPC over the status counters
+    PENDING=$(python extraction_status.py pending)
 
     echo "Remaining pending: $PENDING"
 
@@ -0,0 +1,163 @@
+"""
+Shared markdown section parser for extracted manuals.
+
+Every extraction worker (local_extract, extract-marker, modal_extract,
+modal_docling) and backfill_sections parse through this module, so the
+same markdown always produces the same manual_sections rows.
+
+Parsing is a single linear pass with a precompiled header pattern. Input
+can be a markdown string, an open file handle or any iterator of lines,
+and sections are yielded lazily:
+
+    with open('manual.md') as f:
+        for section in iter_sections(f):
+            ...
+
+Section rules:
+  - Headers are levels 1-6 (# .. ######)
+  - Paths are hierarchical: "1", "1.2", "1.2.3"; a skipped level counts as 0
+  - Content before the first header becomes section "0" ("Introduction")
+  - depth = header level - 1 (introduction is 0)
+  - Sections with no content are dropped; sort_order counts emitted sections
+  - marker --paginate_output page separators ("{12}" + 48 dashes) are
+    dropped; they stay in manual_content for per-page quality scores
+"""
+
+import io
+import re
+from typing import Iterable, Iterator, Union
+
+HEADER_RE = re.compile(r'^(#{1,6})\s+(.+)$')
+PAGE_SEPARATOR_RE = re.compile(r'^\{(\d+)\}-{48}[^\S\n]*$', re.MULTILINE)
+EMPHASIS_RE = re.compile(r'\*+')
+LINK_RE = re.compile(r'\[([^\]]+)\]\([^)]+\)')
+WORD_CLEAN_RE = re.compile(r'[^a-z]')
+
+MAX_HEADER_LEVEL = 6
+MAX_TITLE_LENGTH = 200
+INTRO_TITLE = 'Introduction'
+
+AUTO_TERMS = (
+    'tire', 'oil', 'brake', 'engine', 'battery', 'fuel', 'light', 'warning',
+    'maintenance', 'safety', 'airbag', 'seat', 'belt', 'door', 'window',
+    'mirror', 'wiper', 'filter', 'fluid', 'pressure', 'temperature', 'gauge',
+    'dashboard', 'instrument', 'control', 'switch', 'button', 'key', 'fob',
+    'start', 'stop', 'drive', 'park', 'reverse', 'neutral', 'transmission',
+    'cruise', 'lane', 'assist', 'camera', 'sensor', 'navigation', 'audio',
+    'bluetooth', 'phone', 'climate', 'ac', 'heat', 'defrost', 'vent'
+)
+
+
+def clean_title(title: str) -> str:
+    """Strip markdown emphasis and links from a header title"""
+    title = EMPHASIS_RE.sub('', title)
+    title = LINK_RE.sub(r'\1', title)
+    return title.strip()[:MAX_TITLE_LENGTH] or 'Untitled'
+
+
+def iter_sections(source: Union[str, Iterable[str]]) -> Iterator[dict]:
+    """
+    Yield sections from markdown text, a file handle or a line iterator.
+
+    Each section is a dict with path, title, depth, sort_order and content.
+    """
+    lines = io.StringIO(source) if isinstance(source, str) else source
+
+    counters = [0] * MAX_HEADER_LEVEL
+    path, title, depth = '0', INTRO_TITLE, 0
+    sort_order = 0
+    buffer = []
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        header = HEADER_RE.match(line)
+        if header is None:
+            if PAGE_SEPARATOR_RE.match(line):
+                # Drop the separator and the blank line before it (one paragraph break remains)
+                while buffer and not buffer[-1].strip():
+                    buffer.pop()
+            else:
+                buffer.append(line)
+            continue
+
+        content = '\n'.join(buffer).strip()
+        if content:
+            yield {
+                'path': path,
+                'title': title,
+                'depth': depth,
+                'sort_order': sort_order,
+                'content': content,
+            }
+            sort_order += 1
+
+        level = len(header.group(1))
+        counters[level - 1] += 1
+        for i in range(level, MAX_HEADER_LEVEL):
+            counters[i] = 0
+
+        path = '.'.join(str(c) for c in counters[:level])
+        title = clean_title(header.group(2))
+        depth = level - 1
+        buffer = []
+
+    content = '\n'.join(buffer).strip()
+    if content:
+        yield {
+            'path': path,
+            'title': title,
+            'depth': depth,
+            'sort_order': sort_order,
+            'content': content,
+        }
+
+
+def parse_sections(source: Union[str, Iterable[str]]) -> list:
+    """Parse markdown into a list of sections (see iter_sections)"""
+    return list(iter_sections(source))
+
+
+def extract_keywords(content: str, title: str) -> list:
+    """Extract automotive keywords from section content and title"""
+    keywords = set()
+    text = (title + ' ' + content).lower()
+
+    for term in AUTO_TERMS:
+        if term in text:
+            keywords.add(term)
+
+    # Add title words
+    for word in title.lower().split():
+        word = WORD_CLEAN_RE.sub('', word)
+        if len(word) > 3:
+            keywords.add(word)
+
+    return sorted(keywords)[:20]
+
+
+def section_row(manual_id: str, section: dict) -> dict:
+    """
+    Build a manual_sections row for a parsed section.
+
+    char_count, word_count, token_count and content_plain are filled in by
+    the calculate_section_tokens trigger.
+    """
+    return {
+        'manual_id': manual_id,
+        'section_path': section['path'],
+        'section_title': section['title'],
+        'depth': section['depth'],
+        'sort_order': section['sort_order'],
+        'content_markdown': section['content'],
+        'keywords': extract_keywords(section['content'], section['title']),
+    }
+
+
+def build_toc(sections: list) -> list:
+    """Build the manual_content.table_of_contents entries for parsed sections"""
+    return [{
+        'path': s['path'],
+        'title': s['title'],
+        'depth': s['depth'],
+        'token_count': len(s['content']) // 4
+    } for s in sections]
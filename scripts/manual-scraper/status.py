@@ -2,9 +2,14 @@
 """
 Live extraction status monitor.
 
+Speed and latencies come from the stage events workers emit (telemetry.py),
+so they are real from the first finished manual instead of being derived
+from polled counts.
+
 Usage:
-    python status.py          # Live updating display
-    python status.py --once   # Single check
+    python status.py              # Live updating display
+    python status.py --once       # Single check
+    python status.py --window 60  # Throughput over the last 60 minutes (default 15)
 """
 
 import sys
@@ -13,6 +18,9 @@ from supabase import create_client
 from pathlib import Path
 from datetime import datetime
 
+from extraction_status import get_extraction_status
+from telemetry import get_failures, get_throughput
+
 # Load credentials
 env_file = Path(__file__).parent / '.env'
 env_content = env_file.read_text()
@@ -20,26 +28,65 @@ service_key = env_content.split('SUPABASE_SERVICE_KEY=')[1].split('\n')[0].strip
 
 supabase = create_client('https://jxpbnnmefwtazfvoxvge.supabase.co', service_key)
 
-# Track history for speed calculation
-history = []
+STAGES = ['claim', 'download', 'extract', 'upload', 'failed']
 
 def get_status():
-    counts = {}
-    total = 0
-    for status in ['pending', 'extracting', 'extracted', 'failed']:
-        result = supabase.table('vehicle_manuals').select('id', count='exact').eq('content_status', status).execute()
-        count = result.count or 0
-        counts[status] = count
-        total += count
-    
-    # Get docling count
-    docling = supabase.table('manual_content').select('id', count='exact').eq('extraction_method', 'docling-modal-gpu').execute()
-    counts['docling'] = docling.count or 0
-    counts['total'] = total
-    
+    # One RPC over trigger-maintained counters instead of a count per status
+    counts = get_extraction_status(supabase)
+    counts['docling'] = counts['methods'].get('docling-modal-gpu', 0)
     return counts
 
-def display(counts, speed_per_hour=None, eta_hours=None):
+def format_seconds(seconds):
+    if seconds is None:
+        return '-'
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    return f"{seconds / 60:.1f}m"
+
+def format_rate(row):
+    if row.get('bytes_per_sec'):
+        return f"{row['bytes_per_sec'] / 1024 / 1024:.1f} MB/s"
+    if row.get('pages_per_sec'):
+        return f"{row['pages_per_sec']:.1f} pages/s"
+    return ''
+
+def display_throughput(throughput, failures, window):
+    stages = throughput['stages']
+    if not stages:
+        print(f"  No worker events in the last {window} minutes")
+        return
+
+    print(f"  {'Stage':<10} {'Count':>6} {'/hour':>7} {'p50':>7} {'p95':>7}  Rate   (last {window} min)")
+    print(f"  {'-'*56}")
+    for stage in STAGES:
+        row = stages.get(stage)
+        if row:
+            print(f"  {stage:<10} {row['events']:>6} {row['per_hour']:>7.0f} "
+                  f"{format_seconds(row['p50_seconds']):>7} {format_seconds(row['p95_seconds']):>7}  {format_rate(row)}")
+
+    # Per worker: completed manuals and extraction latency
+    workers = {}
+    for stage in ('extract', 'upload', 'failed'):
+        for row in throughput['workers'].get(stage, []):
+            workers.setdefault(row['worker'], {})[stage] = row
+    if workers:
+        print()
+        print(f"  {'Worker':<28} {'Done':>5} {'/hour':>6} {'Fail':>5} {'Extract p50/p95':>16}")
+        print(f"  {'-'*64}")
+        for worker, rows in sorted(workers.items()):
+            done = rows.get('upload', {})
+            extract = rows.get('extract', {})
+            print(f"  {worker[:28]:<28} {done.get('events', 0):>5} {done.get('per_hour', 0):>6.0f} "
+                  f"{rows.get('failed', {}).get('events', 0):>5} "
+                  f"{format_seconds(extract.get('p50_seconds')):>7} / {format_seconds(extract.get('p95_seconds')):<7}")
+
+    if failures:
+        print()
+        print("  Recent failures:")
+        for failure in failures:
+            print(f"  ❌ {failure['failures']:>3}x [{failure['stage'] or '?'}] {(failure['error'] or '')[:60]}")
+
+def display(counts, throughput=None, failures=None, window=15):
     # Clear screen
     print("\033[2J\033[H", end="")
     
@@ -70,66 +117,47 @@ def display(counts, speed_per_hour=None, eta_hours=None):
     print()
     print(f"  Docling GPU:  {counts['docling']}")
     
-    # Speed and ETA
-    if speed_per_hour is not None and speed_per_hour > 0:
-        print()
-        print(f"  {'-'*40}")
-        print(f"  ⚡ Speed:     {speed_per_hour:.0f} manuals/hour")
-        if eta_hours is not None:
+    # Speed and ETA from completed uploads
+    if throughput is not None:
+        speed_per_hour = throughput['stages'].get('upload', {}).get('per_hour')
+        if speed_per_hour:
+            eta_hours = counts['pending'] / speed_per_hour
+            print()
+            print(f"  {'-'*40}")
+            print(f"  ⚡ Speed:     {speed_per_hour:.0f} manuals/hour")
             if eta_hours < 1:
                 print(f"  ⏱️  ETA:       {eta_hours * 60:.0f} minutes")
             else:
                 print(f"  ⏱️  ETA:       {eta_hours:.1f} hours")
+        print()
+        display_throughput(throughput, failures, window)
     
     print()
     print("=" * 60)
     print("  Press Ctrl+C to exit")
     print("=" * 60)
 
+def refresh(window):
+    counts = get_status()
+    throughput = get_throughput(supabase, window_minutes=window)
+    failures = get_failures(supabase, window_minutes=max(window, 60))
+    display(counts, throughput, failures, window)
+
 def main():
-    global history
-    
     once = '--once' in sys.argv
+    window = int(sys.argv[sys.argv.index('--window') + 1]) if '--window' in sys.argv else 15
     
     if once:
-        counts = get_status()
-        display(counts)
+        refresh(window)
         return
     
-    print("Starting live monitor... (updating every 30 seconds)")
+    print("Starting live monitor... (updating every 10 seconds)")
     time.sleep(1)
     
     while True:
         try:
-            counts = get_status()
-            now = time.time()
-            
-            # Track history
-            history.append((now, counts['extracted']))
-            
-            # Keep last 10 minutes of history
-            history = [(t, c) for t, c in history if now - t < 600]
-            
-            # Calculate speed
-            speed_per_hour = None
-            eta_hours = None
-            
-            if len(history) >= 2:
-                oldest_time, oldest_count = history[0]
-                newest_time, newest_count = history[-1]
-                
-                time_diff = newest_time - oldest_time
-                count_diff = newest_count - oldest_count
-                
-                if time_diff > 0 and count_diff > 0:
-                    speed_per_hour = (count_diff / time_diff) * 3600
-                    remaining = counts['pending']
-                    if speed_per_hour > 0:
-                        eta_hours = remaining / speed_per_hour
-            
-            display(counts, speed_per_hour, eta_hours)
-            
-            time.sleep(30)
+            refresh(window)
+            time.sleep(10)
             
         except KeyboardInterrupt:
             print("\n\nStopped.")
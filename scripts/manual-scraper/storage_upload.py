@@ -0,0 +1,455 @@
+"""
+Streaming, resumable uploads to Supabase Storage.
+
+Uploads go through Supabase's TUS endpoint (/storage/v1/upload/resumable)
+in fixed 6 MB chunks, read either from a local file or straight from a
+source HTTP response. At most one chunk is held in memory per transfer, so
+several parallel imports of 80 MB manuals stay within a few tens of MB.
+
+Both sides resume:
+
+  - if the source connection drops, it is re-requested from the current
+    offset with a Range header and an If-Range validator (the ETag or
+    Last-Modified of the first response). If the source answers 200 or
+    reports a different total length, it changed: the upload starts over
+  - if the upload is interrupted (network error, killed process), the next
+    attempt asks the TUS server for its offset and continues from there.
+    Upload URLs are persisted in a small JSON file, so this also works
+    across runs (Supabase keeps unfinished uploads for 24 hours).
+
+    async with httpx.AsyncClient() as client:
+        uploader = TusUploader(client, SUPABASE_URL, service_key)
+        await uploader.upload_file(Path('manual.pdf'), 'kia/k5/2021-kia-k5.pdf')
+        await uploader.upload_from_url(pdf_url, 'kia/k5/2021-kia-k5.pdf', size=info['size'])
+
+Sources whose size is unknown can't use TUS (Upload-Length is required) and
+fall back to one streaming POST, which is bounded in memory but not
+resumable.
+
+PDFs are stored once per content hash under hashed_path(sha) =
+pdf/ab/abcdef....pdf. Since the hash is only known once the bytes have
+passed through, uploads go to a staging object first (hashing each chunk
+as the server accepts it) and store_by_hash() then moves the staged object
+into place, or drops it if that PDF is already stored.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import httpx
+
+# Supabase requires 6 MB TUS chunks (only the last may be shorter)
+CHUNK_SIZE = 6 * 1024 * 1024
+RETRIES = 5
+TUS_VERSION = '1.0.0'
+DEFAULT_STATE_FILE = Path(os.getenv('TUS_STATE_FILE', Path.home() / '.cache' / 'carintel' / 'tus-uploads.json'))
+
+
+def hashed_path(pdf_sha256: str) -> str:
+    """Content-addressed object name for a PDF"""
+    return f"pdf/{pdf_sha256[:2]}/{pdf_sha256}.pdf"
+
+
+def staging_path(source: str) -> str:
+    """Stable staging object name for a source URL/file, so retries resume the same upload"""
+    return f"staging/{hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]}.pdf"
+
+
+class StreamHasher:
+    """
+    SHA-256 of an upload, fed chunks as the server accepts them.
+
+    Chunks must arrive in order; a resumed upload that starts past what was
+    hashed (e.g. resumed from an earlier run) leaves the hash incomplete.
+    A chunk at offset 0 starts the hash over (the upload restarted).
+    """
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.position = 0
+        self.broken = False
+
+    def update(self, start: int, chunk: bytes):
+        if start == 0 and self.position:
+            self.__init__()
+        if start != self.position:
+            self.broken = self.broken or start > self.position
+            if start > self.position:
+                return
+            chunk = chunk[self.position - start:]  # Re-sent bytes already hashed
+        self.digest.update(chunk)
+        self.position += len(chunk)
+
+    def hexdigest(self, size: int) -> Optional[str]:
+        """The hash if every byte up to size was seen, else None"""
+        if self.broken or self.position != size:
+            return None
+        return self.digest.hexdigest()
+
+
+def _already_exists(resp: httpx.Response) -> bool:
+    """Storage's answer to moving onto an existing object (409, or 400 with a 409 body)"""
+    if resp.status_code == 409:
+        return True
+    text = resp.text.lower()
+    return resp.status_code == 400 and ('already exists' in text or 'duplicate' in text or '"409"' in text)
+
+
+class UploadError(Exception):
+    """Upload could not be completed after retries"""
+
+
+class SourceChanged(Exception):
+    """The source no longer serves the bytes a resumed upload started with"""
+
+
+def _validator(resp: httpx.Response) -> Optional[str]:
+    """If-Range value for a source response: a strong ETag, else Last-Modified"""
+    etag = resp.headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return resp.headers.get('last-modified')
+
+
+def _total_length(resp: httpx.Response) -> Optional[int]:
+    """Full size from a 206 Content-Range ("bytes 100-199/5000")"""
+    total = resp.headers.get('content-range', '').rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+
+class UploadStore:
+    """
+    Persisted upload URLs keyed by upload fingerprint, so interrupted uploads
+    resume. Entries are {'url', 'validator'}; validator is the source's
+    If-Range value for uploads streamed from a URL.
+    """
+
+    def __init__(self, path: Path = DEFAULT_STATE_FILE):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            return json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write(self, entries: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.part')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _entry(self, fingerprint: str) -> dict:
+        entry = self._read().get(fingerprint)
+        return {'url': entry} if isinstance(entry, str) else entry or {}
+
+    def get(self, fingerprint: str) -> Optional[str]:
+        with self.lock:
+            return self._entry(fingerprint).get('url')
+
+    def put(self, fingerprint: str, upload_url: str):
+        with self.lock:
+            entries = self._read()
+            entries[fingerprint] = {'url': upload_url}
+            self._write(entries)
+
+    def validator(self, fingerprint: str) -> Optional[str]:
+        with self.lock:
+            return self._entry(fingerprint).get('validator')
+
+    def set_validator(self, fingerprint: str, validator: Optional[str]):
+        with self.lock:
+            entries = self._read()
+            if fingerprint in entries:
+                entries[fingerprint] = {**self._entry(fingerprint), 'validator': validator}
+                self._write(entries)
+
+    def remove(self, fingerprint: str):
+        with self.lock:
+            entries = self._read()
+            if entries.pop(fingerprint, None) is not None:
+                self._write(entries)
+
+
+def _b64(value: str) -> str:
+    return base64.b64encode(value.encode('utf-8')).decode('ascii')
+
+
+async def _rechunk(chunks: AsyncIterator[bytes], size: int) -> AsyncIterator[bytes]:
+    """Regroup an async byte stream into `size`-byte chunks (last one may be short)"""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+class TusUploader:
+    """Resumable chunked uploads into one Storage bucket; see module docstring"""
+
+    def __init__(self, client: httpx.AsyncClient, supabase_url: str, service_key: str,
+                 bucket: str = 'vehicle_manuals', chunk_size: int = CHUNK_SIZE,
+                 store: Optional[UploadStore] = None):
+        self.client = client
+        self.supabase_url = supabase_url.rstrip('/')
+        self.service_key = service_key
+        self.bucket = bucket
+        self.chunk_size = chunk_size
+        self.store = store or UploadStore()
+        self.endpoint = f"{self.supabase_url}/storage/v1/upload/resumable"
+
+    def _auth(self, **extra) -> dict:
+        return {'Authorization': f"Bearer {self.service_key}", 'apikey': self.service_key, **extra}
+
+    def _headers(self, **extra) -> dict:
+        return self._auth(**{'Tus-Resumable': TUS_VERSION, **extra})
+
+    async def _create(self, object_name: str, size: int, content_type: str, upsert: bool) -> str:
+        metadata = ','.join(f"{key} {_b64(value)}" for key, value in {
+            'bucketName': self.bucket,
+            'objectName': object_name,
+            'contentType': content_type,
+            'cacheControl': '3600',
+        }.items())
+        resp = await self.client.post(self.endpoint, headers=self._headers(**{
+            'Upload-Length': str(size),
+            'Upload-Metadata': metadata,
+            'x-upsert': 'true' if upsert else 'false',
+        }))
+        resp.raise_for_status()
+        location = resp.headers['location']
+        return location if location.startswith('http') else f"{self.supabase_url}{location}"
+
+    async def _offset(self, upload_url: str) -> Optional[int]:
+        """Bytes the server already has for upload_url, or None if it no longer exists"""
+        resp = await self.client.head(upload_url, headers=self._headers())
+        if resp.status_code in (404, 410):
+            return None
+        resp.raise_for_status()
+        return int(resp.headers['upload-offset'])
+
+    async def _upload(self, object_name: str, size: int, fingerprint: str,
+                      read_from: Callable[[int], AsyncIterator[bytes]],
+                      content_type: str, upsert: bool,
+                      on_chunk: Optional[Callable[[int, bytes], None]] = None) -> int:
+        """
+        Core TUS loop: resume or create the upload, then PATCH chunks from
+        read_from(offset) until the server has all `size` bytes.
+        on_chunk(start, chunk) is called for each chunk the server accepted.
+        """
+        upload_url = self.store.get(fingerprint)
+        failures = 0
+
+        while True:
+            try:
+                offset = await self._offset(upload_url) if upload_url else None
+                if offset is None:
+                    upload_url = await self._create(object_name, size, content_type, upsert)
+                    self.store.put(fingerprint, upload_url)
+                    offset = 0
+
+                if offset < size:
+                    chunks = read_from(offset)
+                    try:
+                        async for chunk in chunks:
+                            resp = await self.client.patch(upload_url, content=chunk, headers=self._headers(**{
+                                'Upload-Offset': str(offset),
+                                'Content-Type': 'application/offset+octet-stream',
+                            }))
+                            resp.raise_for_status()
+                            if on_chunk:
+                                on_chunk(offset, chunk)
+                            offset = int(resp.headers['upload-offset'])
+                            failures = 0  # Progress made; reset the retry budget
+                            if offset >= size:
+                                break
+                    finally:
+                        await chunks.aclose()  # Close the source connection now, not at GC
+
+                if offset < size:
+                    raise UploadError(f"source ended at {offset:,} of {size:,} bytes")
+
+                self.store.remove(fingerprint)
+                return size
+
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                if status == 409:
+                    pass  # Offset mismatch: re-read it from the server
+                elif status in (404, 410):
+                    upload_url = None  # Upload expired; start a new one
+                elif status < 500:
+                    self.store.remove(fingerprint)
+                    raise
+                failures += 1
+            except SourceChanged:
+                # Bytes already uploaded belong to another version of the source: start over
+                self.store.remove(fingerprint)
+                upload_url = None
+                failures += 1
+            except (httpx.TransportError, UploadError):
+                failures += 1
+
+            if failures >= RETRIES:
+                raise UploadError(f"{object_name}: giving up after {failures} failed attempts")
+            await asyncio.sleep(min(2 ** failures, 30))
+
+    async def upload_file(self, path: Path, object_name: str, content_type: str = 'application/pdf',
+                          upsert: bool = True, on_chunk: Optional[Callable[[int, bytes], None]] = None) -> int:
+        """Upload a local file in chunks. Returns the byte count."""
+        path = Path(path)
+        stat = path.stat()
+        size = stat.st_size
+        fingerprint = hashlib.sha256(
+            f"{self.bucket}/{object_name}|{path.resolve()}|{size}|{stat.st_mtime_ns}".encode('utf-8')
+        ).hexdigest()
+
+        async def read_from(offset: int) -> AsyncIterator[bytes]:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                while True:
+                    chunk = await asyncio.to_thread(f.read, self.chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return await self._upload(object_name, size, fingerprint, read_from, content_type, upsert, on_chunk)
+
+    async def upload_from_url(self, source_url: str, object_name: str, size: Optional[int] = None,
+                              content_type: str = 'application/pdf', upsert: bool = True,
+                              before_request: Optional[Callable[[], Awaitable[None]]] = None,
+                              on_chunk: Optional[Callable[[int, bytes], None]] = None) -> int:
+        """
+        Stream source_url into object_name without touching disk. Returns the byte count.
+
+        size should come from a HEAD (Content-Length); without it the upload
+        is a single non-resumable streaming POST. before_request is awaited
+        before every source request (e.g. a rate limiter).
+        """
+        if not size:
+            return await self.post_stream(source_url, object_name, content_type, upsert, before_request, on_chunk)
+
+        fingerprint = hashlib.sha256(
+            f"{self.bucket}/{object_name}|{source_url}|{size}".encode('utf-8')
+        ).hexdigest()
+
+        async def read_from(offset: int) -> AsyncIterator[bytes]:
+            headers = {}
+            if offset:
+                validator = self.store.validator(fingerprint)
+                if not validator:
+                    raise SourceChanged("no validator for the uploaded bytes")
+                headers = {'Range': f'bytes={offset}-', 'If-Range': validator}
+            if before_request:
+                await before_request()
+            async with self.client.stream('GET', source_url, headers=headers, follow_redirects=True) as resp:
+                resp.raise_for_status()
+                if offset and (resp.status_code != 206 or _total_length(resp) != size):
+                    # 200: If-Range failed (or Range unsupported); either way the upload restarts
+                    raise SourceChanged(f"{source_url} changed (HTTP {resp.status_code})")
+                if not offset:
+                    self.store.set_validator(fingerprint, _validator(resp))
+                async for chunk in _rechunk(resp.aiter_bytes(), self.chunk_size):
+                    yield chunk
+
+        return await self._upload(object_name, size, fingerprint, read_from, content_type, upsert, on_chunk)
+
+    async def post_stream(self, source_url: str, object_name: str, content_type: str = 'application/pdf',
+                          upsert: bool = True, before_request: Optional[Callable[[], Awaitable[None]]] = None,
+                          on_chunk: Optional[Callable[[int, bytes], None]] = None) -> int:
+        """Single streaming POST from source_url (bounded memory, not resumable)"""
+        if before_request:
+            await before_request()
+        copied = 0
+        async with self.client.stream('GET', source_url, follow_redirects=True) as source:
+            source.raise_for_status()
+
+            async def body():
+                nonlocal copied
+                async for chunk in source.aiter_bytes(self.chunk_size):
+                    if on_chunk:
+                        on_chunk(copied, chunk)
+                    copied += len(chunk)
+                    yield chunk
+
+            resp = await self.client.post(
+                self._object_url(object_name),
+                content=body(),
+                headers=self._auth(**{
+                    'Content-Type': content_type,
+                    'x-upsert': 'true' if upsert else 'false',
+                }),
+            )
+            resp.raise_for_status()
+        return copied
+
+    # Object operations used for the hash-keyed layout
+
+    def _object_url(self, object_name: str) -> str:
+        return f"{self.supabase_url}/storage/v1/object/{self.bucket}/{object_name}"
+
+    async def exists(self, object_name: str) -> bool:
+        resp = await self.client.head(self._object_url(object_name), headers=self._auth())
+        if resp.status_code in (400, 404):
+            return False  # Storage answers 400 for missing objects
+        resp.raise_for_status()
+        return True
+
+    async def move(self, source: str, destination: str):
+        resp = await self.client.post(
+            f"{self.supabase_url}/storage/v1/object/move",
+            json={'bucketId': self.bucket, 'sourceKey': source, 'destinationKey': destination},
+            headers=self._auth(),
+        )
+        resp.raise_for_status()
+
+    async def remove(self, object_name: str):
+        resp = await self.client.request(
+            'DELETE', f"{self.supabase_url}/storage/v1/object/{self.bucket}",
+            json={'prefixes': [object_name]}, headers=self._auth(),
+        )
+        resp.raise_for_status()
+
+    async def hash_object(self, object_name: str) -> str:
+        """SHA-256 of a stored object, streamed back from Storage"""
+        digest = hashlib.sha256()
+        async with self.client.stream('GET', self._object_url(object_name), headers=self._auth()) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.aiter_bytes(self.chunk_size):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    async def store_by_hash(self, staged: str, pdf_sha256: Optional[str] = None) -> tuple:
+        """
+        Move a staged upload to hashed_path(sha). Returns (sha, object_name, reused).
+
+        If the same PDF is already stored (or another import moves it into
+        place first) the staged copy is deleted and the existing object reused. pdf_sha256 comes from a StreamHasher; when
+        the hash is incomplete the staged object is read back to hash it.
+        """
+        pdf_sha256 = pdf_sha256 or await self.hash_object(staged)
+        object_name = hashed_path(pdf_sha256)
+        if await self.exists(object_name):
+            await self.remove(staged)
+            return pdf_sha256, object_name, True
+        try:
+            await self.move(staged, object_name)
+        except httpx.HTTPStatusError as e:
+            if not _already_exists(e.response):
+                raise
+            # Another import of the same bytes moved its copy in after our exists() check
+            await self.remove(staged)
+            return pdf_sha256, object_name, True
+        return pdf_sha256, object_name, False
@@ -0,0 +1,195 @@
+"""
+Per-manual extraction events.
+
+Workers emit one structured event per manual per stage into the
+extraction_events table (migration 20251213000006_add_extraction_events.sql):
+
+    claim      manual handed to this worker
+    download   seconds, bytes fetched (0 on a PDF cache hit)
+    extract    seconds, pages converted, extraction_method
+    upload     seconds to write sections + content
+    failed     stage that failed, error message
+
+Events are buffered in memory and inserted in batches from a background
+thread, so instrumentation never adds a PostgREST round-trip to the
+extraction itself. Batches that can't be inserted are appended to a local
+JSON-lines file instead of being dropped.
+
+    events = EventLog(supabase)
+    with events:
+        events.emit('claim', manual_id)
+        with events.timed('extract', manual_id, extraction_method='marker-pdf-local') as fields:
+            markdown = run_marker(...)
+            fields['pages'] = page_count(pdf_path)
+
+status.py reads the aggregates back with get_throughput(), and
+monitor_extraction.py deletes events older than EVENT_RETENTION_DAYS with
+prune_events() every hour.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+from work_queue import worker_id
+
+EVENT_TYPES = ('claim', 'download', 'extract', 'upload', 'failed')
+EVENT_FIELDS = ('stage', 'seconds', 'bytes', 'pages', 'extraction_method', 'error')
+# Events older than this are deleted by prune_events()
+EVENT_RETENTION_DAYS = 30
+
+FLUSH_INTERVAL_SECONDS = 5
+MAX_BATCH = 500
+DEFAULT_SPILL_PATH = Path(os.getenv(
+    'EXTRACTION_EVENTS_FILE', Path.home() / '.cache' / 'carintel' / 'extraction-events.jsonl'
+))
+
+
+class EventLog:
+    """
+    Buffered writer for extraction_events.
+
+    emit() only appends to an in-memory buffer; a background thread flushes
+    every `flush_interval` seconds (sooner once `max_batch` events are
+    waiting). With supabase=None events go straight to the local file.
+    """
+
+    def __init__(self, supabase, worker: str = None, flush_interval: float = FLUSH_INTERVAL_SECONDS,
+                 max_batch: int = MAX_BATCH, spill_path: Path = DEFAULT_SPILL_PATH):
+        self.supabase = supabase
+        self.worker = worker or worker_id()
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.spill_path = Path(spill_path)
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def emit(self, event: str, manual_id: str = None, **fields):
+        """Record an event; fields are any of EVENT_FIELDS"""
+        if event not in EVENT_TYPES:
+            raise ValueError(f"unknown event type: {event}")
+        unknown = set(fields) - set(EVENT_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown event fields: {', '.join(sorted(unknown))}")
+
+        # Every row carries every column so PostgREST accepts the batch as one insert
+        record = {
+            'occurred_at': datetime.now(timezone.utc).isoformat(),
+            'worker': self.worker,
+            'event': event,
+            'manual_id': manual_id,
+        }
+        for field in EVENT_FIELDS:
+            record[field] = fields.get(field)
+        if record['error'] is not None:
+            record['error'] = str(record['error'])[:1000]
+
+        with self._lock:
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.max_batch
+        if full:
+            self._wake.set()
+
+    @contextmanager
+    def timed(self, event: str, manual_id: str = None, **fields):
+        """
+        Time a block and emit `event` with its duration when it completes.
+
+        Yields the fields dict so the block can add bytes/pages it only knows
+        at the end. Nothing is emitted if the block raises; callers record
+        the failure (with its reason) themselves.
+        """
+        start = time.time()
+        yield fields
+        self.emit(event, manual_id, seconds=time.time() - start, **fields)
+
+    def failed(self, manual_id: str, stage: str, error):
+        self.emit('failed', manual_id, stage=stage, error=error)
+
+    def flush(self) -> int:
+        """Write buffered events now. Returns the number written (to the table or the local file)."""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+
+        if self.supabase is not None:
+            try:
+                for i in range(0, len(batch), self.max_batch):
+                    self.supabase.table('extraction_events').insert(batch[i:i + self.max_batch]).execute()
+                return len(batch)
+            except Exception as e:
+                print(f"  ⚠️  Event insert failed ({str(e)[:80]}); appending {len(batch)} events to {self.spill_path}")
+
+        self._spill(batch)
+        return len(batch)
+
+    def _spill(self, batch: list):
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, 'a') as f:
+            for record in batch:
+                f.write(json.dumps(record) + '\n')
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+        self.flush()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def get_throughput(supabase, window_minutes: int = 15) -> dict:
+    """
+    Throughput and latency per stage over the last `window_minutes`.
+
+    Returns {'stages': {event: row}, 'workers': {event: [row, ...]}} where a
+    row has events, per_hour, p50_seconds, p95_seconds, bytes_per_sec,
+    pages_per_sec and last_at (plus worker in the per-worker rows).
+    """
+    rows = supabase.rpc('get_extraction_throughput', {'p_window_minutes': window_minutes}).execute().data or []
+    stages = {}
+    workers = {}
+    for row in rows:
+        if row['worker'] is None:
+            stages[row['event']] = row
+        else:
+            workers.setdefault(row['event'], []).append(row)
+    return {'stages': stages, 'workers': workers}
+
+
+def get_failures(supabase, window_minutes: int = 60, limit: int = 5) -> list:
+    """Most frequent failure reasons: [{'stage', 'error', 'failures', 'last_at'}]"""
+    return supabase.rpc('get_extraction_failures', {
+        'p_window_minutes': window_minutes,
+        'p_limit': limit,
+    }).execute().data or []
+
+
+def prune_events(supabase, keep_days: int = EVENT_RETENTION_DAYS) -> int:
+    """Delete events older than `keep_days`. Returns the number deleted."""
+    return supabase.rpc('prune_extraction_events', {'p_keep_days': keep_days}).execute().data or 0
@@ -6,10 +6,10 @@ Test all PDF extraction methods on the same manual and compare quality.
 import os
 import sys
 import time
-import tempfile
-import requests
 from pathlib import Path
 
+from pdf_cache import PdfCache
+
 # Get Supabase credentials
 SUPABASE_URL = 'https://jxpbnnmefwtazfvoxvge.supabase.co'
 env_file = Path('.env').read_text()
@@ -42,14 +42,13 @@ def get_test_pdf():
     return manual, marker_content
 
 
-def download_pdf(url: str, dest: Path) -> int:
-    """Download PDF and return page count"""
-    print(f"Downloading PDF...")
-    response = requests.get(url, timeout=300)
-    dest.write_bytes(response.content)
+def download_pdf(url: str) -> tuple:
+    """Fetch PDF through the local PDF cache and return (path, page count)"""
+    print(f"Fetching PDF...")
+    _, dest = PdfCache().get(url)
 
     size_mb = dest.stat().st_size / 1024 / 1024
-    print(f"Downloaded: {size_mb:.1f} MB")
+    print(f"Fetched: {size_mb:.1f} MB")
 
     # Get page count
     try:
@@ -57,9 +56,9 @@ def download_pdf(url: str, dest: Path) -> int:
         doc = pymupdf.open(str(dest))
         pages = len(doc)
         doc.close()
-        return pages
+        return dest, pages
     except:
-        return 0
+        return dest, 0
 
 
 def test_pymupdf4llm(pdf_path: Path) -> dict:
@@ -322,23 +321,21 @@ def main():
     name = f"{manual['year']} {manual['make']} {manual['model']}"
     print(f"\nTest Manual: {name}")
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        pdf_path = Path(tmpdir) / "test.pdf"
-        pages = download_pdf(manual['pdf_url'], pdf_path)
-        print(f"Pages: {pages}")
+    pdf_path, pages = download_pdf(manual['pdf_url'])
+    print(f"Pages: {pages}")
 
-        results = []
+    results = []
 
-        # Test each extractor
-        results.append(test_pymupdf4llm(pdf_path))
-        results.append(test_docling(pdf_path))
-        results.append(test_mineru(pdf_path))
-        results.append(test_marker_llm(pdf_path))
+    # Test each extractor
+    results.append(test_pymupdf4llm(pdf_path))
+    results.append(test_docling(pdf_path))
+    results.append(test_mineru(pdf_path))
+    results.append(test_marker_llm(pdf_path))
 
-        # Compare
-        compare_results(results, marker_existing, pages)
+    # Compare
+    compare_results(results, marker_existing, pages)
 
-        print(f"\n\nAll outputs saved to: {OUTPUT_DIR}")
+    print(f"\n\nAll outputs saved to: {OUTPUT_DIR}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('requests')
+
+from downloader import download_file
+
+BODY = bytes(range(256)) * 64
+ETAG = '"v2"'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves BODY with ETag, Range and If-Range like a CDN"""
+
+    def do_GET(self):
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range', ETAG) == ETAG:
+            start = int(range_header.split('=')[1].rstrip('-'))
+        if start >= len(BODY):
+            error = b'<html>Range Not Satisfiable</html>'
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(BODY)}')  # No Content-Length: body ends at close
+            self.end_headers()
+            self.wfile.write(error)
+            return
+        body = BODY[start:]
+        self.send_response(206 if start else 200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        if start:
+            self.send_header('Content-Range', f'bytes {start}-{len(BODY) - 1}/{len(BODY)}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/manual.pdf'
+    server.shutdown()
+
+
+def leftover(dest, data, meta):
+    dest.with_name(dest.name + '.part').write_bytes(data)
+    dest.with_name(dest.name + '.part.json').write_text(json.dumps(meta))
+
+
+def test_resumes_unchanged_file(tmp_path, url):
+    dest = tmp_path / 'manual.pdf'
+    leftover(dest, BODY[:1000], {'validator': ETAG, 'size': len(BODY)})
+
+    stats = download_file(url, dest)
+
+    assert dest.read_bytes() == BODY
+    assert stats['downloaded'] == len(BODY) - 1000
+    assert not dest.with_name(dest.name + '.part.json').exists()
+    assert not dest.with_name(dest.name + '.part.lock').exists()
+
+
+def test_restarts_when_remote_file_changed(tmp_path, url):
+    dest = tmp_path / 'manual.pdf'
+    leftover(dest, b'x' * 1000, {'validator': '"v1"', 'size': len(BODY)})
+
+    stats = download_file(url, dest)
+
+    assert dest.read_bytes() == BODY
+    assert stats['downloaded'] == len(BODY)
+
+
+def test_restarts_without_saved_validator(tmp_path, url):
+    dest = tmp_path / 'manual.pdf'
+    dest.with_name(dest.name + '.part').write_bytes(b'x' * 1000)
+
+    download_file(url, dest)
+
+    assert dest.read_bytes() == BODY
+
+
+def test_restarts_when_total_size_changed(tmp_path, url):
+    dest = tmp_path / 'manual.pdf'
+    leftover(dest, BODY[:1000], {'validator': ETAG, 'size': len(BODY) + 5})
+
+    download_file(url, dest, retries=2)
+
+    assert dest.read_bytes() == BODY
+
+
+def test_complete_partial_file_is_accepted_on_416(tmp_path, url):
+    dest = tmp_path / 'manual.pdf'
+    leftover(dest, BODY, {'validator': ETAG, 'size': len(BODY)})
+
+    stats = download_file(url, dest)
+
+    assert dest.read_bytes() == BODY
+    assert stats['downloaded'] == 0
+
+
+def test_partial_file_longer_than_remote_is_refetched_on_416(tmp_path, url):
+    # The remote file shrank: "bytes */N" is shorter than the .part
+    dest = tmp_path / 'manual.pdf'
+    leftover(dest, BODY + b'x' * 100, {'validator': ETAG, 'size': len(BODY) + 100})
+
+    download_file(url, dest, retries=2)
+
+    assert dest.read_bytes() == BODY
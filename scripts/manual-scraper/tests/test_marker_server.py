@@ -0,0 +1,61 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from marker_server import MarkerServer, cache_options, convert_pdf
+
+
+def serve(tmp_path, **engine):
+    socket_path = str(tmp_path / 'marker.sock')
+    server = MarkerServer(socket_path, SimpleNamespace(**engine), progress_pages=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, socket_path
+
+
+def test_cache_options_reports_server_settings(tmp_path):
+    server, socket_path = serve(tmp_path, disable_image_extraction=False)
+    try:
+        assert cache_options(socket_path, {'disable_image_extraction': True}) == {
+            'backend': 'marker_server', 'disable_image_extraction': False, 'paginate_output': True,
+            'progress_pages': 0,
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_cache_options_differ_by_backend(tmp_path):
+    server, socket_path = serve(tmp_path, disable_image_extraction=True)
+    try:
+        flags = {'disable_image_extraction': True}
+        assert cache_options(None, flags) == {'backend': 'marker_single', 'disable_image_extraction': True}
+        assert cache_options(socket_path, flags) != cache_options(None, flags)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_queue_wait_does_not_count_toward_timeout(tmp_path):
+    release = threading.Event()
+
+    def convert(pdf_path, start, end, progress_pages, on_progress):
+        if pdf_path.name == 'slow.pdf':
+            release.wait(5)
+        return f'# {pdf_path.stem}'
+
+    server, socket_path = serve(tmp_path, disable_image_extraction=True, convert=convert)
+    try:
+        results = {}
+        slow = threading.Thread(target=lambda: results.update(slow=convert_pdf(tmp_path / 'slow.pdf', socket_path)))
+        slow.start()
+        while not server.lock.locked():
+            time.sleep(0.01)
+        # Queued behind slow.pdf for longer than its own timeout
+        threading.Timer(0.5, release.set).start()
+        results['fast'] = convert_pdf(tmp_path / 'fast.pdf', socket_path, timeout=0.2)
+        slow.join()
+        assert results == {'slow': '# slow', 'fast': '# fast'}
+    finally:
+        release.set()
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,50 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('requests')
+
+from pdf_cache import PdfCache
+
+BODY = b'%PDF-1.7 ' + bytes(range(256)) * 256
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Serves BODY slowly enough for concurrent fetches to overlap"""
+
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        time.sleep(0.2)
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_concurrent_misses_download_once(tmp_path):
+    SlowHandler.requests = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/manual.pdf'
+    try:
+        cache = PdfCache(tmp_path)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda _: cache.get(url), range(4)))
+    finally:
+        server.shutdown()
+
+    sha = hashlib.sha256(BODY).hexdigest()
+    assert results == [(sha, cache.path_for(sha))] * 4
+    assert cache.path_for(sha).read_bytes() == BODY
+    assert SlowHandler.requests == 1
+    assert list(cache.tmp.iterdir()) == []
@@ -0,0 +1,69 @@
+from pdf_shards import stitch_markdown
+from quality import evaluate_quality, score_page
+from sections import parse_sections
+from tiered_extract import page_separator
+
+CLEAN = ("Check the tire pressure once a month when the tires are cold. The recommended "
+         "pressures are listed on the label on the driver's door jamb. Inflate the tires "
+         "to these pressures and check the spare as well before long trips. ") * 3
+
+
+def test_clean_page_passes():
+    result = score_page(CLEAN)
+    assert result['passed']
+    assert result['issues'] == []
+
+
+def test_fully_spaced_out_page_fails():
+    page = ' '.join(CLEAN)  # "C h e c k   t h e ..."
+    result = score_page(page)
+    assert not result['passed']
+    assert any(issue.startswith('spacing') for issue in result['issues'])
+
+
+def test_fully_garbled_page_fails():
+    # Text layer of control bytes, as from a font without a usable ToUnicode map
+    page = ''.join(chr(1 + i % 8) for i in range(len(CLEAN)))
+    result = score_page(page)
+    assert not result['passed']
+    assert any(issue.startswith('garbled') for issue in result['issues'])
+
+
+def test_single_severe_issue_fails_despite_score():
+    # Garbled runs in an otherwise clean page cost 25 points: 75 is above PAGE_PASS_SCORE
+    page = CLEAN + '\x01' * (len(CLEAN) // 12)
+    result = score_page(page)
+    assert result['score'] == 75
+    assert not result['passed']
+
+
+def test_paginated_markdown_gets_page_scores():
+    markdown = '\n\n'.join([
+        page_separator(0), '# Tires', CLEAN,
+        page_separator(1), ' '.join(CLEAN),
+    ])
+    pages = evaluate_quality(markdown, 1)['page_scores']
+    assert [p['page'] for p in pages] == [0, 1]
+    assert pages[0]['issues'] == []
+    assert any(issue.startswith('spacing') for issue in pages[1]['issues'])
+
+
+def test_page_separators_survive_stitching_but_not_sections():
+    markdown = stitch_markdown([
+        f"{page_separator(0)}\n\n# Tires\n\nCheck the pressure",
+        f"{page_separator(1)}\n\n# Tires\n\nmonthly.",
+    ])
+    assert markdown.count('-' * 48) == 2
+    assert [p['page'] for p in evaluate_quality(markdown, 1)['page_scores']] == [0, 1]
+    (section,) = parse_sections(markdown)
+    assert section['content'] == 'Check the pressure\n\nmonthly.'
+
+
+def test_ratios_count_characters_on_non_ascii_text():
+    # As the str regexes see it: "é", "ł" and "ï" are word characters, the
+    # em space is whitespace, so only "x y z" is spaced out
+    text = 'a b cé ł x y\u2003z naïve café 12€'
+    metrics = evaluate_quality(text, 0)
+    assert metrics['spacing_ratio'] == 1 / 10
+    assert metrics['avg_word_length'] == 1.0  # a, b, x, y, z
+    assert metrics['special_char_ratio'] == 5 / len(text)
@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import json
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+
+from storage_upload import StreamHasher, TusUploader, UploadStore, hashed_path
+
+SHA = 'ab' + '0' * 62
+
+
+def make_uploader(tmp_path, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return TusUploader(client, 'https://example.supabase.co', 'key',
+                       store=UploadStore(tmp_path / 'tus.json'))
+
+
+def test_store_by_hash_moves_new_pdf(tmp_path):
+    calls = []
+
+    def handler(request):
+        calls.append((request.method, request.url.path))
+        if request.method == 'HEAD':
+            return httpx.Response(404)
+        return httpx.Response(200, json={})
+
+    uploader = make_uploader(tmp_path, handler)
+    result = asyncio.run(uploader.store_by_hash('staging/a.pdf', SHA))
+
+    assert result == (SHA, hashed_path(SHA), False)
+    assert ('POST', '/storage/v1/object/move') in calls
+    assert not any(method == 'DELETE' for method, _ in calls)
+
+
+@pytest.mark.parametrize('conflict', [
+    httpx.Response(409, json={'error': 'Duplicate', 'message': 'The resource already exists'}),
+    httpx.Response(400, json={'statusCode': '409', 'error': 'Duplicate',
+                              'message': 'The resource already exists'}),
+])
+def test_store_by_hash_reuses_object_moved_by_concurrent_import(tmp_path, conflict):
+    deleted = []
+
+    def handler(request):
+        if request.method == 'HEAD':
+            return httpx.Response(404)  # Not there yet when checked...
+        if request.url.path == '/storage/v1/object/move':
+            return conflict             # ...but another import moved its copy in first
+        if request.method == 'DELETE':
+            deleted.extend(json.loads(request.content)['prefixes'])
+            return httpx.Response(200, json=[])
+        return httpx.Response(500)
+
+    uploader = make_uploader(tmp_path, handler)
+    result = asyncio.run(uploader.store_by_hash('staging/b.pdf', SHA))
+
+    assert result == (SHA, hashed_path(SHA), True)
+    assert deleted == ['staging/b.pdf']
+
+
+def test_store_by_hash_raises_other_move_errors(tmp_path):
+    def handler(request):
+        if request.method == 'HEAD':
+            return httpx.Response(404)
+        return httpx.Response(500, json={'message': 'boom'})
+
+    uploader = make_uploader(tmp_path, handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(uploader.store_by_hash('staging/c.pdf', SHA))
+
+
+
+class FakeStorage:
+    """TUS endpoint and a Range/If-Range source, behind one MockTransport"""
+
+    SOURCE = 'https://manuals.example.com/a.pdf'
+
+    def __init__(self, content: bytes, etag: str, reported_total: int = None):
+        self.content = content
+        self.etag = etag
+        self.reported_total = reported_total or len(content)
+        self.uploads = {}
+        self.source_requests = []
+
+    def handler(self, request):
+        url = str(request.url)
+        if url == self.SOURCE:
+            self.source_requests.append(request.headers)
+            offset = int(request.headers.get('range', 'bytes=0-')[len('bytes='):-1])
+            if offset and request.headers.get('if-range') == self.etag:
+                return httpx.Response(206, content=self.content[offset:], headers={
+                    'etag': self.etag,
+                    'content-range': f'bytes {offset}-{len(self.content) - 1}/{self.reported_total}',
+                })
+            return httpx.Response(200, content=self.content, headers={'etag': self.etag})
+        if request.method == 'POST':
+            location = f'https://example.supabase.co/storage/v1/upload/resumable/{len(self.uploads)}'
+            self.uploads[location] = b''
+            return httpx.Response(201, headers={'location': location})
+        if request.method == 'HEAD':
+            return httpx.Response(200, headers={'upload-offset': str(len(self.uploads[url]))})
+        if request.method == 'PATCH':
+            self.uploads[url] += request.content
+            return httpx.Response(204, headers={'upload-offset': str(len(self.uploads[url]))})
+        return httpx.Response(500)
+
+
+def resume_upload(tmp_path, monkeypatch, storage, uploaded: bytes, validator: str):
+    """Upload storage.SOURCE as if an earlier run had sent `uploaded` before dying"""
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(asyncio, 'sleep', no_sleep)
+    uploader = make_uploader(tmp_path, storage.handler)
+    uploader.chunk_size = 4
+    size = len(storage.content)
+    fingerprint = hashlib.sha256(f"vehicle_manuals/staging/a.pdf|{storage.SOURCE}|{size}".encode('utf-8')).hexdigest()
+    stale = 'https://example.supabase.co/storage/v1/upload/resumable/stale'
+    storage.uploads[stale] = uploaded
+    uploader.store.put(fingerprint, stale)
+    uploader.store.set_validator(fingerprint, validator)
+
+    hasher = StreamHasher()
+    asyncio.run(uploader.upload_from_url(storage.SOURCE, 'staging/a.pdf', size=size, on_chunk=hasher.update))
+    return stale, hasher
+
+
+def test_upload_from_url_resumes_unchanged_source(tmp_path, monkeypatch):
+    storage = FakeStorage(b'0123456789abcdef', etag='"v1"')
+    stale, _ = resume_upload(tmp_path, monkeypatch, storage, b'01234567', validator='"v1"')
+
+    assert storage.source_requests[0]['range'] == 'bytes=8-'
+    assert storage.source_requests[0]['if-range'] == '"v1"'
+    assert list(storage.uploads) == [stale]
+    assert storage.uploads[stale] == storage.content
+
+
+@pytest.mark.parametrize('storage', [
+    FakeStorage(b'ABCDEFGHIJKLMNOP', etag='"v2"'),                     # New version: If-Range fails, 200
+    FakeStorage(b'ABCDEFGHIJKLMNOP', etag='"v1"', reported_total=20),  # 206 for a different length
+])
+def test_upload_from_url_restarts_when_source_changed(tmp_path, monkeypatch, storage):
+    stale, hasher = resume_upload(tmp_path, monkeypatch, storage, b'01234567', validator='"v1"')
+
+    (new,) = [url for url in storage.uploads if url != stale]
+    assert storage.uploads[stale] == b'01234567'  # Abandoned, never appended to
+    assert storage.uploads[new] == storage.content
+    assert hasher.hexdigest(len(storage.content)) == hashlib.sha256(storage.content).hexdigest()
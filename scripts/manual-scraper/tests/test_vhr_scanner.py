@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('httpx')
+pytest.importorskip('supabase')  # via importer
+
+from vhr_scanner import ScanCache, VhrScanner, candidate_urls
+
+GM_SUFFIX = '%20Owner%20Manual.pdf'
+
+
+class FakeScanner(VhrScanner):
+    """HEADs answered locally: only the GM-style URL exists"""
+
+    def __init__(self, tmp_path, concurrency):
+        super().__init__(ScanCache(tmp_path / 'cache.json'), concurrency=concurrency, rate=1000)
+        self.tried = {}
+
+    async def head(self, url):
+        model = url.split('_')[2]
+        self.tried.setdefault(model, []).append(url)
+        await asyncio.sleep(0)
+        return {'exists': url.endswith(GM_SUFFIX), 'size': 1}
+
+
+def test_later_rows_try_learned_pattern_first(tmp_path):
+    # An unlisted make tries every style; the GM style is last in the default order
+    models = ['Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo', 'Foxtrot']
+    rows = [{'year': '2020', 'make': 'Acme', 'model': m} for m in models]
+    default_order = candidate_urls(2020, 'Acme', 'Alpha')
+    assert not default_order[0][0].endswith(GM_SUFFIX)
+
+    scanner = FakeScanner(tmp_path, concurrency=2)
+    jobs = asyncio.run(scanner.scan(rows))
+
+    assert len(jobs) == len(models)
+    # The first batch (one row per worker) had to search...
+    assert len(scanner.tried['Alpha']) > 1
+    # ...the rows after it go straight to the pattern that hit
+    for model in models[2:]:
+        assert len(scanner.tried[model]) == 1
+        assert scanner.tried[model][0].endswith(GM_SUFFIX)
@@ -0,0 +1,186 @@
+"""
+Tiered PDF extraction: fast pymupdf pass first, marker OCR only where needed.
+
+Most manual pages have a clean text layer, and pymupdf4llm turns them into
+markdown orders of magnitude faster than marker. Each page from the fast
+pass is scored with quality.score_page; only pages that fail (garbled text,
+character spacing, special-character noise) or have no text layer at all
+(scanned / image-only pages) are sent to marker, in one marker run with
+--page_range and --paginate_output. The results are merged back in page
+order, each page under a marker-style page separator so quality.py can
+score pages.
+
+    markdown, stats = tiered_extract(pdf_path, output_dir)
+    # stats: {'pages', 'fast_pages', 'ocr_pages', 'fast_seconds', 'ocr_seconds'}
+"""
+
+import subprocess
+import time
+from pathlib import Path
+from typing import Optional
+
+from pdf_shards import stitch_markdown
+from quality import MIN_PAGE_CHARS, score_page
+from sections import PAGE_SEPARATOR_RE
+
+# marker_single flags for the OCR pass (part of the extraction cache key)
+OCR_MARKER_OPTIONS = {'disable_image_extraction': True, 'paginate_output': True}
+
+
+def page_separator(page: int) -> str:
+    """The line marker --paginate_output writes before each page: "{page_id}" and 48 dashes"""
+    return f"{{{page}}}" + '-' * 48
+
+
+def fast_pass(pdf_path: Path) -> list:
+    """
+    Extract every page with pymupdf4llm and score it.
+
+    Returns [{'page', 'markdown', 'needs_ocr', 'reason'}] in page order
+    (0-indexed pages, matching marker's --page_range).
+    """
+    import pymupdf
+    import pymupdf4llm
+
+    pages = []
+    with pymupdf.open(str(pdf_path)) as doc:
+        chunks = pymupdf4llm.to_markdown(doc, page_chunks=True, show_progress=False)
+        for page_index, chunk in enumerate(chunks):
+            markdown = chunk['text']
+            page = doc[page_index]
+            text = page.get_text()
+
+            if len(text.strip()) < MIN_PAGE_CHARS:
+                # No usable text layer; only worth OCR if there is something to read
+                needs_ocr = bool(page.get_images(full=False))
+                reason = 'image-only' if needs_ocr else 'blank'
+            else:
+                score = score_page(text)
+                needs_ocr = not score['passed']
+                reason = ', '.join(score['issues']) if needs_ocr else ''
+
+            pages.append({
+                'page': page_index,
+                'markdown': markdown,
+                'needs_ocr': needs_ocr,
+                'reason': reason,
+            })
+    return pages
+
+
+def page_runs(pages: list) -> list:
+    """Collapse sorted page numbers into [(start, end), ...] runs (end exclusive)"""
+    runs = []
+    for page in pages:
+        if runs and runs[-1][1] == page:
+            runs[-1] = (runs[-1][0], page + 1)
+        else:
+            runs.append((page, page + 1))
+    return runs
+
+
+def split_paginated(markdown: str) -> dict:
+    """Split marker --paginate_output markdown into {page: markdown}"""
+    pages = {}
+    matches = list(PAGE_SEPARATOR_RE.finditer(markdown))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(markdown)
+        pages[int(match.group(1))] = markdown[match.end():end].strip()
+    return pages
+
+
+def ocr_pages(pdf_path: Path, pages: list, output_dir: Path,
+              marker_bin: str = 'marker_single', marker_socket: Optional[str] = None,
+              env: Optional[dict] = None, timeout: int = 1800) -> dict:
+    """
+    Run marker on just the given pages. Returns {page: markdown}.
+
+    With a marker server (which converts contiguous ranges), each run of
+    consecutive pages is split on its page separators; a server that
+    doesn't paginate returns the run as one block keyed by its first page,
+    with the rest of the run mapped to ''.
+    """
+    if not pages:
+        return {}
+
+    runs = page_runs(sorted(pages))
+
+    if marker_socket:
+        from marker_server import convert_pdf
+        ocr = {}
+        for start, end in runs:
+            markdown = convert_pdf(pdf_path, marker_socket, page_range=(start, end), timeout=timeout)
+            pages = split_paginated(markdown)
+            if not pages:  # Server without pagination: the whole run as one block
+                pages = {page: '' for page in range(start, end)}
+                pages[start] = markdown
+            ocr.update(pages)
+        return ocr
+
+    page_range = ','.join(str(s) if e - s == 1 else f"{s}-{e - 1}" for s, e in runs)
+    output_dir = Path(output_dir) / 'ocr'
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    result = subprocess.run(
+        [
+            str(marker_bin),
+            str(pdf_path),
+            '--output_dir', str(output_dir),
+            '--output_format', 'markdown',
+            '--disable_image_extraction',
+            '--paginate_output',
+            '--page_range', page_range,
+        ],
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+        env=env,
+    )
+    if result.returncode != 0:
+        raise Exception(f"marker-pdf failed on OCR pages (exit {result.returncode}): {result.stderr[:300]}")
+
+    md_files = list(output_dir.rglob('*.md'))
+    if not md_files:
+        raise Exception("No markdown output for OCR pages")
+    return split_paginated(md_files[0].read_text(encoding='utf-8'))
+
+
+def tiered_extract(pdf_path: Path, output_dir: Path, marker_bin: str = 'marker_single',
+                   marker_socket: Optional[str] = None, env: Optional[dict] = None,
+                   timeout: int = 1800) -> tuple:
+    """
+    Extract a PDF with pymupdf4llm, re-running only failing pages through marker.
+
+    Returns (markdown, stats).
+    """
+    start = time.time()
+    pages = fast_pass(pdf_path)
+    fast_seconds = time.time() - start
+
+    ocr_needed = [p['page'] for p in pages if p['needs_ocr']]
+    start = time.time()
+    ocr = ocr_pages(pdf_path, ocr_needed, output_dir, marker_bin=marker_bin,
+                    marker_socket=marker_socket, env=env, timeout=timeout)
+    ocr_seconds = time.time() - start
+
+    # Merge in page order; marker output replaces the fast-pass page,
+    # falling back to the fast pass if marker returned nothing for it
+    parts = []
+    for page in pages:
+        markdown = ocr.get(page['page'], page['markdown']) if page['needs_ocr'] else page['markdown']
+        parts.append(f"{page_separator(page['page'])}\n\n{markdown}")
+
+    stats = {
+        'pages': len(pages),
+        'fast_pages': len(pages) - len(ocr_needed),
+        'ocr_pages': len(ocr_needed),
+        'fast_seconds': fast_seconds,
+        'ocr_seconds': ocr_seconds,
+    }
+    return stitch_markdown(parts), stats
+
+
+def format_tier_stats(stats: dict) -> str:
+    """One-line summary of tiered_extract stats for worker logs"""
+    return (f"{stats['fast_pages']}/{stats['pages']} pages via pymupdf ({stats['fast_seconds']:.1f}s), "
+            f"{stats['ocr_pages']} via marker ({stats['ocr_seconds']:.1f}s)")
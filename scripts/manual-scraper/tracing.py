@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing spans for extraction workers.
+
+    with span('download', manual_id=manual['id']) as s:
+        pdf_path = fetch(...)
+        s.set(bytes=pdf_path.stat().st_size)
+
+Spans nest through a contextvar, so a DB write inside bulk_writer becomes a
+child of whichever stage is running in that thread. Work that hops threads
+or processes (pipeline stages, ProcessPoolExecutor workers) passes the
+parent explicitly: span(..., parent=job_span) or parent=span.context().
+
+Tracing is off unless a trace file is configured (enable() or the
+CARINTEL_TRACE_FILE environment variable, which child processes inherit);
+spans are still timed but nothing is written. Finished spans are appended
+one per line in OTLP/JSON (the format of OpenTelemetry's file exporter and
+the collector's otlpjsonfile receiver), so a trace can be read with jq,
+shipped to any OTel backend, or summarized here:
+
+    python tracing.py traces.jsonl                 # Slowest manuals, time per stage
+    python tracing.py traces.jsonl --manual <id>   # Span tree for one manual
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Union
+
+TRACE_FILE_ENV = 'CARINTEL_TRACE_FILE'
+SERVICE_NAME = os.path.splitext(os.path.basename(sys.argv[0] or 'carintel'))[0] or 'carintel'
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current = contextvars.ContextVar('carintel_span', default=None)
+_write_lock = threading.Lock()
+
+
+def enable(path: str):
+    """Write spans to path (also exported to child processes via CARINTEL_TRACE_FILE)"""
+    os.environ[TRACE_FILE_ENV] = str(path)
+
+
+def trace_file() -> Optional[str]:
+    return os.getenv(TRACE_FILE_ENV) or None
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class Span:
+    """A timed operation; end() exports it if tracing is enabled"""
+
+    def __init__(self, name: str, parent: Union['Span', dict, None] = None, **attributes):
+        if isinstance(parent, Span):
+            parent = parent.context()
+        self.name = name
+        self.trace_id = parent['trace_id'] if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent['span_id'] if parent else None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def context(self) -> dict:
+        """Picklable reference for parenting spans in another thread or process"""
+        return {'trace_id': self.trace_id, 'span_id': self.span_id}
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def fail(self, message: str):
+        """Mark failed without an exception (for code that returns errors as values)"""
+        self.error = str(message)[:500]
+
+    @property
+    def seconds(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"[:500]
+        export(self)
+
+    def to_otlp(self) -> dict:
+        record = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,  # INTERNAL
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_attribute(k, v) for k, v in self.attributes.items()],
+            'status': {'code': STATUS_ERROR, 'message': self.error} if self.error else {'code': STATUS_OK},
+        }
+        if self.parent_id:
+            record['parentSpanId'] = self.parent_id
+        return record
+
+
+def export(finished: Span):
+    path = trace_file()
+    if not path:
+        return
+    line = json.dumps({'resourceSpans': [{
+        'resource': {'attributes': [
+            _attribute('service.name', SERVICE_NAME),
+            _attribute('process.pid', os.getpid()),
+        ]},
+        'scopeSpans': [{'scope': {'name': 'carintel.extraction'}, 'spans': [finished.to_otlp()]}],
+    }]})
+    with _write_lock, open(path, 'a') as f:
+        f.write(line + '\n')
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_span(name: str, parent: Union[Span, dict, None] = None, **attributes) -> Span:
+    """
+    Start a span that outlives a with-block (e.g. one per manual, ended when
+    its last pipeline stage finishes). Defaults to the current span as parent.
+    """
+    return Span(name, parent if parent is not None else _current.get(), **attributes)
+
+
+@contextmanager
+def span(name: str, parent: Union[Span, dict, None] = None, **attributes):
+    """Time a block as a child of `parent` (default: the current span); errors mark it failed"""
+    current = start_span(name, parent, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+# =============================================
+# Summaries
+# =============================================
+
+def read_spans(path: str) -> list:
+    """Flatten an OTLP/JSON lines file into span dicts with plain attributes and seconds"""
+    spans = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource in json.loads(line).get('resourceSpans', []):
+                for scope in resource.get('scopeSpans', []):
+                    for record in scope.get('spans', []):
+                        attributes = {}
+                        for attribute in record.get('attributes', []):
+                            attributes[attribute['key']] = next(iter(attribute['value'].values()))
+                        spans.append({
+                            'trace_id': record['traceId'],
+                            'span_id': record['spanId'],
+                            'parent_id': record.get('parentSpanId'),
+                            'name': record['name'],
+                            'start_ns': int(record['startTimeUnixNano']),
+                            'seconds': (int(record['endTimeUnixNano']) - int(record['startTimeUnixNano'])) / 1e9,
+                            'attributes': attributes,
+                            'error': record.get('status', {}).get('message'),
+                        })
+    return spans
+
+
+def print_tree(spans: list, trace_id: str):
+    children = {}
+    for s in spans:
+        if s['trace_id'] == trace_id:
+            children.setdefault(s['parent_id'], []).append(s)
+    known = {s['span_id'] for s in spans if s['trace_id'] == trace_id}
+
+    def walk(s, depth):
+        attributes = ' '.join(f"{k}={v}" for k, v in s['attributes'].items() if k != 'manual_id')
+        error = f"  ❌ {s['error'][:60]}" if s['error'] else ''
+        print(f"  {'  ' * depth}{s['name']:<{32 - 2 * depth}} {s['seconds']:>8.2f}s  {attributes}{error}")
+        for child in sorted(children.get(s['span_id'], []), key=lambda c: c['start_ns']):
+            walk(child, depth + 1)
+
+    # Roots: no parent, or a parent that was never written (e.g. still running)
+    roots = [s for parent_id, group in children.items() if parent_id not in known for s in group]
+    for root in sorted(roots, key=lambda s: s['start_ns']):
+        walk(root, 0)
+
+
+def summarize(spans: list, top: int = 10):
+    """Slowest manuals, with the time each spent per direct child stage"""
+    manuals = sorted((s for s in spans if s['name'] == 'manual'), key=lambda s: -s['seconds'])
+    by_parent = {}
+    for s in spans:
+        by_parent.setdefault(s['parent_id'], []).append(s)
+
+    print(f"{len(manuals)} manuals, {len(spans)} spans\n")
+    for manual in manuals[:top]:
+        label = manual['attributes'].get('manual', manual['attributes'].get('manual_id', manual['trace_id']))
+        stages = {}
+        for child in by_parent.get(manual['span_id'], []):
+            stages[child['name']] = stages.get(child['name'], 0) + child['seconds']
+        breakdown = ', '.join(f"{name} {seconds:.1f}s" for name, seconds in sorted(stages.items(), key=lambda i: -i[1]))
+        print(f"  {manual['seconds']:>8.1f}s  {label}")
+        print(f"            {breakdown}")
+
+    # Where the time goes across all manuals
+    totals = {}
+    for s in spans:
+        if s['name'] != 'manual':
+            count, seconds = totals.get(s['name'], (0, 0.0))
+            totals[s['name']] = (count + 1, seconds + s['seconds'])
+    print(f"\n  {'Span':<34} {'Count':>6} {'Total':>10} {'Mean':>8}")
+    for name, (count, seconds) in sorted(totals.items(), key=lambda i: -i[1][1]):
+        print(f"  {name:<34} {count:>6} {seconds:>9.1f}s {seconds / count:>7.2f}s")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarize extraction trace spans')
+    parser.add_argument('trace_file', nargs='?', default=trace_file(),
+                        help=f'OTLP/JSON lines file (default: ${TRACE_FILE_ENV})')
+    parser.add_argument('--manual', metavar='ID', help='Print the span tree for one manual')
+    parser.add_argument('--top', type=int, default=10, help='Slowest manuals to list')
+    args = parser.parse_args()
+    if not args.trace_file:
+        parser.error(f'no trace file given and {TRACE_FILE_ENV} is not set')
+
+    spans = read_spans(args.trace_file)
+    if args.manual:
+        manual_id = args.manual
+        traces = sorted({s['trace_id'] for s in spans if s['attributes'].get('manual_id') == manual_id})
+        if not traces:
+            print(f"No spans for manual {manual_id}")
+        for trace_id in traces:
+            print(f"trace {trace_id}")
+            print_tree(spans, trace_id)
+        return
+    summarize(spans, top=args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,16 @@
  * Upload downloaded PDFs to Supabase Storage
  *
  * Reads PDFs from the manuals/ directory and uploads them to Supabase Storage,
- * updating the vehicle_manuals table with the storage path
+ * updating the vehicle_manuals table with the storage path.
+ *
+ * PDFs are stored once per content hash at pdf/{sha[:2]}/{sha}.pdf, so year
+ * rows that share a PDF point at the same object.
  */
 
 import { createClient } from '@supabase/supabase-js';
 import { readFile, readdir, stat } from 'fs/promises';
 import { join } from 'path';
+import { createHash } from 'crypto';
 
 const SUPABASE_URL = process.env.SUPABASE_URL || 'https://jxpbnnmefwtazfvoxvge.supabase.co';
 const SUPABASE_SERVICE_KEY = process.env.SUPABASE_SERVICE_KEY;
@@ -108,7 +112,6 @@ async function main() {
 
     const filePath = join(MANUALS_DIR, filename);
     const fileInfo = await stat(filePath);
-    const storagePath = `${parsed.year}/${parsed.make.toLowerCase().replace(/ /g, '-')}/${filename}`;
 
     console.log(`📤 Uploading ${filename} (${(fileInfo.size / 1024 / 1024).toFixed(1)}MB)...`);
 
@@ -116,18 +119,31 @@ async function main() {
       // Read file
       const fileBuffer = await readFile(filePath);
 
-      // Upload to storage
-      const { error: uploadError } = await supabase.storage
+      // Content-addressed path: identical PDFs are stored once
+      const sha256 = createHash('sha256').update(fileBuffer).digest('hex');
+      const storageDir = `pdf/${sha256.slice(0, 2)}`;
+      const storagePath = `${storageDir}/${sha256}.pdf`;
+
+      const { data: existing } = await supabase.storage
         .from(BUCKET_NAME)
-        .upload(storagePath, fileBuffer, {
-          contentType: 'application/pdf',
-          upsert: true
-        });
-
-      if (uploadError) {
-        console.error(`   ❌ Upload failed:`, uploadError.message);
-        errors++;
-        continue;
+        .list(storageDir, { search: `${sha256}.pdf` });
+
+      if (existing?.some(f => f.name === `${sha256}.pdf`)) {
+        console.log(`   ♻️  Already stored as ${storagePath}`);
+      } else {
+        // Upload to storage
+        const { error: uploadError } = await supabase.storage
+          .from(BUCKET_NAME)
+          .upload(storagePath, fileBuffer, {
+            contentType: 'application/pdf',
+            upsert: true
+          });
+
+        if (uploadError) {
+          console.error(`   ❌ Upload failed:`, uploadError.message);
+          errors++;
+          continue;
+        }
       }
 
       // Update database record
@@ -135,6 +151,7 @@ async function main() {
         .from('vehicle_manuals')
         .update({
           pdf_storage_path: storagePath,
+          pdf_sha256: sha256,
           status: 'uploaded',
           pdf_size_bytes: fileInfo.size
         })
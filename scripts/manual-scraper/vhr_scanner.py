@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Discover owner's manual PDFs on the VHR (vehiclehistory.com) CDN.
+
+VHR has no index, so manuals are found by guessing URLs. Each brand family
+names files differently (see URL_STYLES), model names appear in several
+casings, and some files use a curly apostrophe in "Owner's". This scanner
+takes a coverage CSV (coverage_gaps_2000plus.csv, missing_manuals.csv),
+HEADs candidate URLs for --concurrency rows at a time and writes the hits
+as an import manifest:
+
+    python vhr_scanner.py coverage_gaps_2000plus.csv --out vhr_manifest.json
+    python vhr_scanner.py missing_manuals.csv --make Kia --make Lincoln
+    python import_vhr_kia.py --manifest vhr_manifest.json --run
+
+Candidates are tried in order of likelihood: whatever style/casing/
+apostrophe has already hit for the same make in this run, then the
+brand's known style(s) (only those, unless --all-styles), then the rest.
+A row stops at its first hit.
+
+HEAD results are cached in a JSON file (--cache). Hits are kept forever;
+misses are reused for --negative-ttl-days so re-scans only re-check stale
+misses. Network errors are never cached.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+import httpx
+
+from importer import TokenBucket
+
+VHR_BASE = "https://vhr.nyc3.cdn.digitaloceanspaces.com/owners-manual"
+
+# URL encoding constants
+STRAIGHT_APOS = "%27"      # Straight apostrophe '
+CURLY_APOS = "%E2%80%99"   # Curly/smart apostrophe '
+
+# Filename templates under VHR_BASE. Fields: year, make, make_lower, model,
+# model_upper, apos. Several brand names share a template.
+URL_STYLES = {
+    # {year}_{Make}_{Model}_Owner's Manual.pdf (Title case, straight apostrophe)
+    'stellantis': ("{make_lower}/{year}_{make}_{model}_Owner{apos}s%20Manual.pdf", STRAIGHT_APOS),
+    # {year}_kia_{MODEL}_Owner's Manual.pdf (lowercase make, UPPERCASE model)
+    'kia': ("{make_lower}/{year}_{make_lower}_{model}_Owner{apos}s%20Manual.pdf", STRAIGHT_APOS),
+    # {year}_maserati_{Model}_Owner's Manual.pdf (lowercase make, Title model)
+    'maserati': ("{make_lower}/{year}_{make_lower}_{model}_Owner{apos}s%20Manual.pdf", STRAIGHT_APOS),
+    # {year}_infiniti_{Model}_Owner's Manual.pdf
+    'infiniti': ("{make_lower}/{year}_{make_lower}_{model}_Owner{apos}s%20Manual.pdf", STRAIGHT_APOS),
+    # {year}_ford_{model}_Owner's Manual Printing 1 PDF.pdf (curly apostrophe)
+    'ford': ("{make_lower}/{year}_{make_lower}_{model}_Owner{apos}s%20Manual%20Printing%201%20PDF.pdf", CURLY_APOS),
+    # {year}_lincoln_{model}_Owner's Manual Printing 1 PDF.pdf (curly apostrophe)
+    'lincoln': ("{make_lower}/{year}_{make_lower}_{model}_Owner{apos}s%20Manual%20Printing%201%20PDF.pdf", CURLY_APOS),
+    # {year}_acura_{model}_{year} {MODEL} Owner's Manual.pdf
+    'acura': ("{make_lower}/{year}_{make_lower}_{model}_{year}%20{model_upper}%20Owner{apos}s%20Manual.pdf", STRAIGHT_APOS),
+    # {year}_{make}_{Model}_{year} {Make} {Model} Owner Manual.pdf
+    'gm': ("{make_lower}/{year}_{make_lower}_{model}_{year}%20{make}%20{model}%20Owner%20Manual.pdf", None),
+}
+
+# Styles known to be used by each make (tried first)
+BRAND_STYLES = {
+    'Chrysler': ['stellantis'], 'Dodge': ['stellantis'], 'Jeep': ['stellantis'], 'Ram': ['stellantis'],
+    'Kia': ['kia'],
+    'Maserati': ['maserati'],
+    'Infiniti': ['infiniti'],
+    'Ford': ['ford'],
+    'Lincoln': ['lincoln'],
+    'Acura': ['acura'],
+    'Chevrolet': ['gm'], 'GMC': ['gm'], 'Buick': ['gm'], 'Cadillac': ['gm'],
+}
+
+DEFAULT_CACHE = Path(__file__).parent / 'vhr_scan_cache.json'
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RATE = 20.0
+DEFAULT_NEGATIVE_TTL_DAYS = 30
+TIMEOUT = httpx.Timeout(15.0)
+
+
+def get_vhr_url(year: int, make: str, vhr_model: str, url_style: str = "stellantis",
+                apostrophe: Optional[str] = None) -> str:
+    """Build VHR URL based on url_style parameter (unknown styles use the GM pattern)."""
+    template, default_apos = URL_STYLES.get(url_style, URL_STYLES['gm'])
+    path = template.format(
+        year=year,
+        make=make,
+        make_lower=make.lower(),
+        model=vhr_model,
+        model_upper=vhr_model.upper(),
+        apos=apostrophe or default_apos or '',
+    )
+    return f"{VHR_BASE}/{path}"
+
+
+def model_variants(model: str) -> list:
+    """Casings VHR uses for model names, URL-encoded (as given, UPPER, lower, Title)"""
+    variants = []
+    for variant in (model, model.upper(), model.lower(), model.title()):
+        encoded = quote(variant)
+        if encoded not in variants:
+            variants.append(encoded)
+    return variants
+
+
+def candidate_urls(year: int, make: str, model: str, learned: Optional[Counter] = None,
+                   all_styles: bool = False) -> list:
+    """
+    Every (url, pattern) to try for a vehicle, most likely first.
+
+    Makes listed in BRAND_STYLES only try their own styles unless
+    all_styles; other makes try every style. pattern is (style, model
+    casing index, apostrophe), used to learn which combination works for a
+    make.
+    """
+    known = BRAND_STYLES.get(make, [])
+    styles = known if known and not all_styles else known + [s for s in URL_STYLES if s not in known]
+
+    patterns = []
+    for style in styles:
+        _, default_apos = URL_STYLES[style]
+        apostrophes = [default_apos] if default_apos is None else \
+            [default_apos] + [a for a in (STRAIGHT_APOS, CURLY_APOS) if a != default_apos]
+        for casing in range(4):
+            for apos in apostrophes:
+                patterns.append((style, casing, apos))
+
+    rank = {pattern: i for i, pattern in enumerate(patterns)}
+    if learned:
+        # Patterns that already hit for this make go first, most hits first
+        patterns.sort(key=lambda p: (-learned[p], rank[p]))
+
+    variants = model_variants(model)
+    candidates, seen = [], set()
+    for style, casing, apos in patterns:
+        if casing >= len(variants):
+            continue
+        url = get_vhr_url(year, make, variants[casing], style, apos)
+        if url not in seen:
+            seen.add(url)
+            candidates.append((url, (style, casing, apos)))
+    return candidates
+
+
+class ScanCache:
+    """JSON cache of HEAD results keyed by URL"""
+
+    def __init__(self, path: Path = DEFAULT_CACHE, negative_ttl_days: float = DEFAULT_NEGATIVE_TTL_DAYS):
+        self.path = Path(path)
+        self.negative_ttl = negative_ttl_days * 86400
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+        self.dirty = 0
+
+    def get(self, url: str) -> Optional[dict]:
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        if not entry['exists'] and time.time() - entry['checked'] > self.negative_ttl:
+            return None  # Stale miss; check again
+        return entry
+
+    def put(self, url: str, exists: bool, size: int = 0, status: Optional[int] = None):
+        self.entries[url] = {'exists': exists, 'size': size, 'status': status, 'checked': time.time()}
+        self.dirty += 1
+
+    def save(self):
+        if not self.dirty:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.part')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = 0
+
+
+class VhrScanner:
+    """Concurrently HEAD candidate URLs for coverage rows; see module docstring"""
+
+    def __init__(self, cache: ScanCache, concurrency: int = DEFAULT_CONCURRENCY, rate: float = DEFAULT_RATE,
+                 all_styles: bool = False):
+        self.cache = cache
+        self.all_styles = all_styles
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, concurrency)
+        self.learned = {}   # make -> Counter of patterns that hit
+        self.requests = 0
+        self.cache_hits = 0
+        self.client = None
+
+    async def head(self, url: str) -> Optional[dict]:
+        """Cached HEAD. Returns None on network errors (not cached)."""
+        cached = self.cache.get(url)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        async with self.semaphore:
+            await self.bucket.acquire()
+            self.requests += 1
+            try:
+                resp = await self.client.head(url)
+            except httpx.HTTPError:
+                return None
+
+        if resp.status_code == 200:
+            self.cache.put(url, True, int(resp.headers.get('content-length', 0)), 200)
+        elif resp.status_code in (403, 404):
+            # Spaces answers 403 for missing keys
+            self.cache.put(url, False, status=resp.status_code)
+        else:
+            return None  # 5xx/429: don't remember
+        if self.cache.dirty >= 500:
+            self.cache.save()
+        return self.cache.entries[url]
+
+    async def scan_row(self, row: dict) -> Optional[dict]:
+        """First candidate URL that exists for a coverage row, as an import job"""
+        year, make, model = int(row['year']), row['make'], row['model']
+        learned = self.learned.setdefault(make, Counter())
+
+        # The next candidate is picked after every HEAD, so a pattern another
+        # row learned while this one was waiting is tried next
+        remaining = candidate_urls(year, make, model, all_styles=self.all_styles)
+        while remaining:
+            # Most hits for this make first; min() keeps candidate_urls order on ties
+            url, pattern = min(remaining, key=lambda candidate: -learned[candidate[1]])
+            remaining.remove((url, pattern))
+            result = await self.head(url)
+            if result and result['exists']:
+                learned[pattern] += 1
+                return {
+                    'year': year,
+                    'make': make,
+                    'model': model,
+                    'source_url': url,
+                    'action': 'fix' if row.get('status') == 'mismatched' else 'add',
+                    'size': result['size'],
+                    'url_style': pattern[0],
+                }
+        return None
+
+    async def scan(self, rows: list, progress_every: int = 250) -> list:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        found = []
+        done = 0
+        queue = asyncio.Queue()
+        for row in rows:
+            queue.put_nowait(row)
+
+        async with httpx.AsyncClient(timeout=TIMEOUT, limits=limits) as self.client:
+            async def worker():
+                nonlocal done
+                while not queue.empty():
+                    job = await self.scan_row(queue.get_nowait())
+                    done += 1
+                    if job:
+                        found.append(job)
+                        print(f"  ✓ {job['year']} {job['make']} {job['model']} ({job['url_style']})")
+                    if done % progress_every == 0:
+                        print(f"  ... {done}/{len(rows)} rows, {len(found)} found, "
+                              f"{self.requests} HEADs, {self.cache_hits} cached")
+
+            # One row per worker at a time: rows started later see the
+            # patterns learned by the ones before them
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(rows)))))
+        self.cache.save()
+        return sorted(found, key=lambda j: (j['make'], j['model'], j['year']))
+
+
+def read_coverage_csv(path: Path, makes: Optional[list] = None, statuses: Optional[list] = None) -> list:
+    """Rows (year, make, model, status[, pdf_year]) from a coverage CSV, optionally filtered"""
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    if makes:
+        wanted = {m.lower() for m in makes}
+        rows = [r for r in rows if r['make'].lower() in wanted]
+    if statuses:
+        rows = [r for r in rows if r.get('status') in statuses]
+    return rows
+
+
+def write_manifest(path: Path, jobs: list, source: str):
+    """Import manifest consumed by importer.run_cli(--manifest)"""
+    Path(path).write_text(json.dumps({
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'source': source,
+        'jobs': jobs,
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scan the VHR CDN for manuals listed in a coverage CSV')
+    parser.add_argument('csv', type=Path, help='coverage_gaps_2000plus.csv or missing_manuals.csv')
+    parser.add_argument('--out', type=Path, default=Path('vhr_manifest.json'), help='Manifest to write')
+    parser.add_argument('--make', action='append', help='Only scan this make (repeatable)')
+    parser.add_argument('--status', action='append', choices=['missing', 'mismatched'],
+                        help='Only scan rows with this status (repeatable)')
+    parser.add_argument('--limit', type=int, help='Scan at most this many rows')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Max in-flight HEAD requests (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'Max HEAD requests per second (default: {DEFAULT_RATE})')
+    parser.add_argument('--all-styles', action='store_true',
+                        help='Try every URL style, not just the known style for makes in BRAND_STYLES')
+    parser.add_argument('--cache', type=Path, default=DEFAULT_CACHE, help='HEAD result cache file')
+    parser.add_argument('--negative-ttl-days', type=float, default=DEFAULT_NEGATIVE_TTL_DAYS,
+                        help='Re-check cached misses older than this')
+    args = parser.parse_args()
+
+    rows = read_coverage_csv(args.csv, args.make, args.status)
+    if args.limit:
+        rows = rows[:args.limit]
+
+    print("=" * 70)
+    print(f"VHR Scanner: {len(rows)} rows from {args.csv.name}")
+    print("=" * 70)
+
+    start = time.time()
+    scanner = VhrScanner(ScanCache(args.cache, args.negative_ttl_days), args.concurrency, args.rate,
+                         all_styles=args.all_styles)
+    jobs = asyncio.run(scanner.scan(rows))
+    write_manifest(args.out, jobs, str(args.csv))
+
+    print("\n" + "=" * 70)
+    print("SUMMARY")
+    print("=" * 70)
+    print(f"Rows scanned: {len(rows)}")
+    print(f"Found on VHR: {len(jobs)}")
+    print(f"HEAD requests: {scanner.requests} ({scanner.cache_hits} answered from cache)")
+    print(f"Time: {time.time() - start:.1f}s")
+    for make, count in sorted(Counter(j['make'] for j in jobs).items()):
+        print(f"  {make}: {count}")
+    print(f"\nManifest written to {args.out}")
+    print(f"Import with: python importer.py --manifest {args.out} --run")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Shared work queue for manual extraction workers.
+
+Manuals are claimed through the claim_pending_manuals RPC, which locks
+candidate rows with FOR UPDATE SKIP LOCKED and flips them to 'extracting'
+in the same statement. Concurrent workers therefore never receive the same
+manual, and a claim costs one round-trip regardless of batch size.
+
+Each claim carries a lease token and expiry (see migration
+20251213000000_add_manual_work_queue.sql). Leases are short; workers keep
+them alive with LeaseHeartbeat while marker/Docling runs, and
+reclaim_expired() requeues only manuals whose worker stopped heartbeating.
+
+Pending manuals are handed out by extraction_priority (worst quality score
+times vehicle popularity, see migration 20251213000008), manuals routed to
+the claiming worker's extractor first. requeue_manuals() sends manuals back
+with a reason, as quality-test.py --fix does; monitor_extraction.py calls
+refresh_priorities() hourly so popularity and routing stay current.
+
+Claims hand out one manual per distinct PDF. Once it is extracted,
+claim_duplicates() records the PDF's SHA-256 and claims the other rows that
+share the file so the same result can be saved to them.
+"""
+
+import os
+import socket
+import threading
+
+from tracing import span
+
+# How long a claim is held without a heartbeat before it may be requeued
+DEFAULT_LEASE_SECONDS = 300
+
+# How often LeaseHeartbeat renews (well inside the lease)
+HEARTBEAT_INTERVAL_SECONDS = 60
+
+
+def worker_id() -> str:
+    """Identify this worker as host:pid (override with EXTRACTION_WORKER_ID)"""
+    return os.getenv('EXTRACTION_WORKER_ID') or f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_manuals(
+    supabase,
+    limit: int = 1,
+    worker: str = None,
+    lease_seconds: int = DEFAULT_LEASE_SECONDS,
+    statuses: tuple = ('pending',),
+    exclude_ids: list = None,
+    extractors: tuple = None,
+) -> list:
+    """
+    Atomically claim up to `limit` manuals for extraction, highest priority first.
+
+    Returns the claimed rows (id, year, make, model, variant, pdf_url,
+    pdf_storage_path, pdf_sha256, preferred_extractor, requeue_reason,
+    lease_token, lease_expires_at). Claimed rows are already marked
+    'extracting'. Pass `exclude_ids` to skip manuals this worker already
+    attempted (e.g. when retrying 'failed' rows), and `extractors` (e.g.
+    ('marker',)) to be handed manuals routed to this worker's extractor
+    before any others.
+    """
+    with span('claim', limit=limit) as claim:
+        result = supabase.rpc('claim_pending_manuals', {
+            'p_limit': limit,
+            'p_worker': worker or worker_id(),
+            'p_lease_seconds': lease_seconds,
+            'p_statuses': list(statuses),
+            'p_exclude_ids': list(exclude_ids or []),
+            'p_extractors': list(extractors) if extractors else None,
+        }).execute()
+        claim.set(claimed=len(result.data or []))
+    return result.data or []
+
+
+def claim_duplicates(supabase, manual_id: str, pdf_sha256: str, worker: str = None,
+                     lease_seconds: int = DEFAULT_LEASE_SECONDS) -> list:
+    """
+    Record a manual's PDF hash and claim unextracted manuals sharing the PDF.
+
+    Siblings match on pdf_url or pdf_sha256. Returns the claimed rows
+    (id, year, make, model, lease_token), already marked 'extracting'.
+    """
+    with span('db.claim_duplicates', manual_id=manual_id):
+        result = supabase.rpc('claim_manual_duplicates', {
+            'p_manual_id': manual_id,
+            'p_pdf_sha256': pdf_sha256,
+            'p_worker': worker or worker_id(),
+            'p_lease_seconds': lease_seconds,
+        }).execute()
+    return result.data or []
+
+
+def renew_leases(supabase, lease_token: str, manual_ids: list = None,
+                 lease_seconds: int = DEFAULT_LEASE_SECONDS) -> int:
+    """Extend the lease on manuals held by `lease_token`. Returns the number renewed."""
+    result = supabase.rpc('renew_manual_leases', {
+        'p_lease_token': lease_token,
+        'p_lease_seconds': lease_seconds,
+        'p_manual_ids': manual_ids,
+    }).execute()
+    return result.data or 0
+
+
+def requeue_manuals(supabase, requeues: list) -> int:
+    """
+    Send manuals back for re-extraction, recording why.
+
+    requeues: [{'manual_id', 'reason'}]. Their priority and preferred
+    extractor are recomputed from manual_quality. Returns the number requeued.
+    """
+    result = supabase.rpc('requeue_manuals', {'p_requeues': requeues}).execute()
+    return result.data or 0
+
+
+def refresh_priorities(supabase, days: int = 90) -> int:
+    """Recompute priority and routing for every queued manual. Returns the number updated."""
+    result = supabase.rpc('refresh_extraction_priorities', {'p_days': days}).execute()
+    return result.data or 0
+
+
+def reclaim_expired(supabase, unleased_seconds: int = 3600) -> list:
+    """
+    Requeue extracting manuals whose lease has expired.
+
+    Rows claimed before leases existed have no expiry and are requeued once
+    they have been idle for `unleased_seconds`. Returns the reclaimed rows.
+    """
+    result = supabase.rpc('reclaim_expired_manuals', {
+        'p_unleased_seconds': unleased_seconds,
+    }).execute()
+    return result.data or []
+
+
+class LeaseHeartbeat:
+    """
+    Keep the leases of claimed manuals alive from a background thread.
+
+    Usage:
+        with LeaseHeartbeat(supabase, manuals):
+            run_marker(...)
+
+    Manuals without a lease_token (e.g. --reprocess rows) are ignored.
+    Renewal errors are logged and retried on the next beat; the work itself
+    is never interrupted.
+
+    Long-running pipelines that claim as they go can start with no manuals
+    and track()/release() them as they enter and leave the pipeline.
+    """
+
+    def __init__(self, supabase, manuals: list, lease_seconds: int = DEFAULT_LEASE_SECONDS,
+                 interval: float = HEARTBEAT_INTERVAL_SECONDS):
+        self.supabase = supabase
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self._ids_by_token = {}
+        self._lock = threading.Lock()
+        self.track(manuals)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track(self, manuals: list):
+        """Start renewing the leases of more claimed manuals"""
+        with self._lock:
+            for manual in manuals:
+                if manual.get('lease_token'):
+                    self._ids_by_token.setdefault(manual['lease_token'], []).append(manual['id'])
+
+    def release(self, manual_ids: list):
+        """Stop renewing leases for manuals that are finished"""
+        released = set(manual_ids)
+        with self._lock:
+            for token in list(self._ids_by_token):
+                remaining = [i for i in self._ids_by_token[token] if i not in released]
+                if remaining:
+                    self._ids_by_token[token] = remaining
+                else:
+                    del self._ids_by_token[token]
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.beat()
+
+    def beat(self):
+        """Renew all held leases once"""
+        with self._lock:
+            held = [(token, list(ids)) for token, ids in self._ids_by_token.items()]
+        for token, manual_ids in held:
+            # Finished manuals have left 'extracting' and are simply not renewed
+            try:
+                renew_leases(self.supabase, token, manual_ids, self.lease_seconds)
+            except Exception as e:
+                print(f"  Warning: lease heartbeat failed: {str(e)[:100]}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='lease-heartbeat', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
@@ -0,0 +1,176 @@
+/// <reference types="https://esm.sh/@supabase/functions-js/src/edge-runtime.d.ts" />
+
+import { createClient, SupabaseClient } from 'https://esm.sh/@supabase/supabase-js@2';
+import { handleCors } from '../_shared/cors.ts';
+import { authenticateRequest, checkRateLimit, logUsage, redis } from '../_shared/auth.ts';
+import {
+  successResponse,
+  errorResponse,
+  notFoundResponse,
+  unauthorizedResponse,
+  rateLimitResponse,
+  internalErrorResponse,
+} from '../_shared/response.ts';
+
+// Module-level Supabase client singleton (reused across requests)
+let supabaseClient: SupabaseClient | null = null;
+
+function getSupabase(): SupabaseClient {
+  if (!supabaseClient) {
+    supabaseClient = createClient(
+      Deno.env.get('SUPABASE_URL') ?? '',
+      Deno.env.get('SUPABASE_SERVICE_ROLE_KEY') ?? ''
+    );
+  }
+  return supabaseClient;
+}
+
+// Query embeddings use the Edge Runtime's built-in gte-small, the same
+// model embed_sections.py uses for manual_sections.embedding (384 dims),
+// so semantic search runs without an external embeddings API. Search
+// itself is search_manual_hybrid (full-text + semantic, RRF-fused).
+const embeddingSession = new Supabase.ai.Session('gte-small');
+
+async function embedQuery(query: string): Promise<number[]> {
+  return await embeddingSession.run(query, { mean_pool: true, normalize: true }) as number[];
+}
+
+// Cache TTL constants
+const CACHE_TTL_SEARCH = 3600; // 1 hour
+
+Deno.serve(async (req) => {
+  // Handle CORS preflight
+  const corsResponse = handleCors(req);
+  if (corsResponse) return corsResponse;
+
+  const startTime = Date.now();
+  const url = new URL(req.url);
+  const pathParts = url.pathname.split('/').filter(Boolean);
+  // Path: /manuals/... -> pathParts = ['manuals', ...]
+  const source = req.headers.get('X-Client-Source') || 'api';
+
+  // Authenticate
+  const auth = await authenticateRequest(req);
+  if (!auth.isValid) {
+    return unauthorizedResponse(auth.error || 'Unauthorized');
+  }
+
+  // Rate limit check (async with Redis)
+  const rateLimitCheck = await checkRateLimit(auth.organizationId!, auth.rateLimit!);
+  if (!rateLimitCheck.allowed) {
+    return rateLimitResponse(rateLimitCheck.retryAfter!);
+  }
+
+  let response: Response;
+  let endpoint = url.pathname;
+
+  try {
+    // Route handling
+    // GET /manuals/:id/search?q=X&limit=X
+
+    if (req.method !== 'GET') {
+      response = errorResponse('method_not_allowed', 'Only GET requests are supported', 405);
+    } else if (pathParts[0] === 'manuals' && pathParts[1] && pathParts[2] === 'search') {
+      response = await handleManualSearch(pathParts[1], url);
+      endpoint = '/manuals/:id/search';
+    } else {
+      response = notFoundResponse('Unknown endpoint');
+    }
+  } catch (error) {
+    console.error('Request error:', error);
+    response = internalErrorResponse();
+  }
+
+  // Log usage (fire-and-forget - don't await to avoid blocking response)
+  const latencyMs = Date.now() - startTime;
+  logUsage(getSupabase(), {
+    apiKeyId: auth.apiKeyId!,
+    organizationId: auth.organizationId!,
+    endpoint,
+    method: req.method,
+    source,
+    requestParams: Object.fromEntries(url.searchParams),
+    responseStatus: response.status,
+    latencyMs,
+    ipAddress: req.headers.get('CF-Connecting-IP') || req.headers.get('X-Forwarded-For')?.split(',')[0],
+    userAgent: req.headers.get('User-Agent') || undefined,
+  }).catch(err => console.error('Usage logging error:', err));
+
+  return response;
+});
+
+// ============================================
+// MANUAL SEARCH
+// ============================================
+
+async function handleManualSearch(manualId: string, url: URL): Promise<Response> {
+  const query = (url.searchParams.get('q') || url.searchParams.get('query') || '').trim();
+  // Non-numeric limits fall back to the default instead of reaching the RPC as NaN (null: no limit)
+  const requestedLimit = parseInt(url.searchParams.get('limit') || '', 10);
+  const limit = Number.isFinite(requestedLimit) ? Math.min(Math.max(requestedLimit, 1), 20) : 5;
+
+  if (!/^[0-9a-f-]{36}$/i.test(manualId)) {
+    return errorResponse('invalid_params', 'Invalid manual id');
+  }
+  if (query.length < 2) {
+    return errorResponse('invalid_params', 'Search query must be at least 2 characters');
+  }
+
+  const cacheKey = `manuals:search:${manualId}:${query.toLowerCase()}:${limit}`;
+
+  try {
+    // Try cache first
+    const cached = await redis.get(cacheKey);
+    if (cached) {
+      return successResponse(typeof cached === 'string' ? JSON.parse(cached) : cached);
+    }
+  } catch (e) {
+    console.error('Cache read error:', e);
+  }
+
+  // Without an embedding the search is still answered, full-text only
+  let embedding: number[] | null = null;
+  try {
+    embedding = await embedQuery(query);
+  } catch (e) {
+    console.error('Query embedding error:', e);
+  }
+
+  const { data, error } = await getSupabase().rpc('search_manual_hybrid', {
+    p_manual_id: manualId,
+    p_query: query,
+    p_query_embedding: embedding,
+    p_limit: limit,
+  });
+
+  if (error) {
+    console.error('Manual search error:', error);
+    return internalErrorResponse();
+  }
+
+  const result = {
+    manual_id: manualId,
+    query,
+    method: embedding ? 'hybrid' : 'fulltext',
+    results: (data || []).map((s: any) => ({
+      path: s.section_path,
+      title: s.section_title,
+      tokens: s.token_count,
+      score: Math.round(s.score * 10000) / 10000,
+      matched: [s.fts_rank && 'fulltext', s.vector_rank && 'semantic'].filter(Boolean),
+      snippet: s.snippet,
+      content: s.content_markdown,
+    })),
+  };
+
+  // Don't cache misses or full-text-only answers (embedding failed)
+  if (result.results.length > 0 && embedding) {
+    try {
+      await redis.set(cacheKey, JSON.stringify(result), { ex: CACHE_TTL_SEARCH });
+    } catch (e) {
+      console.error('Cache write error:', e);
+    }
+  }
+
+  return successResponse(result);
+}
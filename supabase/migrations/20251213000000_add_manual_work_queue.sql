@@ -0,0 +1,105 @@
+-- =============================================
+-- MANUAL EXTRACTION WORK QUEUE
+-- Atomic claiming of pending manuals for extraction workers
+-- Replaces count + random offset polling, which let two workers pick the same manual
+-- =============================================
+
+-- 1. Lease columns on vehicle_manuals
+ALTER TABLE vehicle_manuals
+ADD COLUMN IF NOT EXISTS lease_token UUID,
+ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ,
+ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+
+-- Index for picking the next pending manuals in queue order
+CREATE INDEX IF NOT EXISTS idx_vehicle_manuals_content_queue
+ON vehicle_manuals (content_status, year DESC);
+
+-- Index for finding rows held by a lease
+CREATE INDEX IF NOT EXISTS idx_vehicle_manuals_lease_token
+ON vehicle_manuals (lease_token) WHERE lease_token IS NOT NULL;
+
+COMMENT ON COLUMN vehicle_manuals.lease_token IS 'Token of the claim currently holding this manual for extraction';
+COMMENT ON COLUMN vehicle_manuals.lease_expires_at IS 'When the extraction claim expires and the manual may be requeued';
+COMMENT ON COLUMN vehicle_manuals.claimed_by IS 'Worker that holds the extraction claim (host:pid)';
+
+-- 2. Clear the lease whenever a manual leaves the extracting state
+CREATE OR REPLACE FUNCTION clear_vehicle_manual_lease()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.content_status IS DISTINCT FROM 'extracting' THEN
+        NEW.lease_token = NULL;
+        NEW.lease_expires_at = NULL;
+        NEW.claimed_by = NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS vehicle_manuals_clear_lease ON vehicle_manuals;
+CREATE TRIGGER vehicle_manuals_clear_lease
+    BEFORE UPDATE OF content_status ON vehicle_manuals
+    FOR EACH ROW
+    EXECUTE FUNCTION clear_vehicle_manual_lease();
+
+-- 3. Claim up to p_limit manuals in one statement
+-- FOR UPDATE SKIP LOCKED lets concurrent workers claim disjoint rows without waiting
+CREATE OR REPLACE FUNCTION claim_pending_manuals(
+    p_limit INTEGER DEFAULT 1,
+    p_worker TEXT DEFAULT NULL,
+    p_lease_seconds INTEGER DEFAULT 3600,
+    p_statuses TEXT[] DEFAULT ARRAY['pending'],
+    p_exclude_ids UUID[] DEFAULT ARRAY[]::UUID[]
+)
+RETURNS TABLE (
+    id UUID,
+    year INTEGER,
+    make TEXT,
+    model TEXT,
+    variant TEXT,
+    pdf_url TEXT,
+    pdf_storage_path TEXT,
+    lease_token UUID,
+    lease_expires_at TIMESTAMPTZ
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_token UUID := gen_random_uuid();
+BEGIN
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT vm.id
+        FROM vehicle_manuals vm
+        WHERE vm.content_status = ANY(p_statuses)
+          AND NOT (vm.id = ANY(p_exclude_ids))
+        ORDER BY vm.year DESC, vm.id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE vehicle_manuals vm
+    SET content_status = 'extracting',
+        lease_token = v_token,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        claimed_by = p_worker,
+        error_message = NULL
+    FROM candidates c
+    WHERE vm.id = c.id
+    RETURNING
+        vm.id,
+        vm.year,
+        vm.make,
+        vm.model,
+        vm.variant,
+        vm.pdf_url,
+        vm.pdf_storage_path,
+        vm.lease_token,
+        vm.lease_expires_at;
+END;
+$$;
+
+COMMENT ON FUNCTION claim_pending_manuals IS 'Atomically claim manuals for extraction with a lease token (FOR UPDATE SKIP LOCKED).';
+
+-- 4. Only extraction workers (service role) may claim
+REVOKE EXECUTE ON FUNCTION claim_pending_manuals FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_pending_manuals TO service_role;
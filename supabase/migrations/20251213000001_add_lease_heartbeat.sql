@@ -0,0 +1,138 @@
+-- =============================================
+-- EXTRACTION LEASE HEARTBEATS
+-- Workers renew leases while marker/Docling runs; only expired leases are requeued
+-- Replaces the monitor's "updated_at older than 30 minutes" reset
+-- =============================================
+
+-- 1. Claims now default to a short lease that workers keep alive
+CREATE OR REPLACE FUNCTION claim_pending_manuals(
+    p_limit INTEGER DEFAULT 1,
+    p_worker TEXT DEFAULT NULL,
+    p_lease_seconds INTEGER DEFAULT 300,
+    p_statuses TEXT[] DEFAULT ARRAY['pending'],
+    p_exclude_ids UUID[] DEFAULT ARRAY[]::UUID[]
+)
+RETURNS TABLE (
+    id UUID,
+    year INTEGER,
+    make TEXT,
+    model TEXT,
+    variant TEXT,
+    pdf_url TEXT,
+    pdf_storage_path TEXT,
+    lease_token UUID,
+    lease_expires_at TIMESTAMPTZ
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_token UUID := gen_random_uuid();
+BEGIN
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT vm.id
+        FROM vehicle_manuals vm
+        WHERE vm.content_status = ANY(p_statuses)
+          AND NOT (vm.id = ANY(p_exclude_ids))
+        ORDER BY vm.year DESC, vm.id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE vehicle_manuals vm
+    SET content_status = 'extracting',
+        lease_token = v_token,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        claimed_by = p_worker,
+        error_message = NULL
+    FROM candidates c
+    WHERE vm.id = c.id
+    RETURNING
+        vm.id,
+        vm.year,
+        vm.make,
+        vm.model,
+        vm.variant,
+        vm.pdf_url,
+        vm.pdf_storage_path,
+        vm.lease_token,
+        vm.lease_expires_at;
+END;
+$$;
+
+-- 2. Heartbeat: extend the lease on manuals still held by this token
+-- Returns the number of leases renewed (fewer than expected means a lease was lost)
+CREATE OR REPLACE FUNCTION renew_manual_leases(
+    p_lease_token UUID,
+    p_lease_seconds INTEGER DEFAULT 300,
+    p_manual_ids UUID[] DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_renewed INTEGER;
+BEGIN
+    UPDATE vehicle_manuals vm
+    SET lease_expires_at = NOW() + make_interval(secs => p_lease_seconds)
+    WHERE vm.lease_token = p_lease_token
+      AND vm.content_status = 'extracting'
+      AND (p_manual_ids IS NULL OR vm.id = ANY(p_manual_ids));
+
+    GET DIAGNOSTICS v_renewed = ROW_COUNT;
+    RETURN v_renewed;
+END;
+$$;
+
+COMMENT ON FUNCTION renew_manual_leases IS 'Extend extraction leases held by a worker (heartbeat).';
+
+-- 3. Reclaimer: requeue manuals whose lease has actually expired
+-- Rows claimed before leases existed have no expiry; fall back to updated_at for those
+CREATE OR REPLACE FUNCTION reclaim_expired_manuals(
+    p_unleased_seconds INTEGER DEFAULT 3600
+)
+RETURNS TABLE (
+    id UUID,
+    year INTEGER,
+    make TEXT,
+    model TEXT,
+    claimed_by TEXT,
+    lease_expires_at TIMESTAMPTZ
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+BEGIN
+    RETURN QUERY
+    WITH expired AS (
+        SELECT vm.id, vm.claimed_by, vm.lease_expires_at
+        FROM vehicle_manuals vm
+        WHERE vm.content_status = 'extracting'
+          AND (
+              vm.lease_expires_at < NOW()
+              OR (vm.lease_expires_at IS NULL
+                  AND vm.updated_at < NOW() - make_interval(secs => p_unleased_seconds))
+          )
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE vehicle_manuals vm
+    SET content_status = 'pending'
+    FROM expired e
+    WHERE vm.id = e.id
+    RETURNING
+        vm.id,
+        vm.year,
+        vm.make,
+        vm.model,
+        e.claimed_by,
+        e.lease_expires_at;
+END;
+$$;
+
+COMMENT ON FUNCTION reclaim_expired_manuals IS 'Requeue extracting manuals whose worker stopped heartbeating.';
+
+-- 4. Service role only
+REVOKE EXECUTE ON FUNCTION renew_manual_leases FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION reclaim_expired_manuals FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION renew_manual_leases TO service_role;
+GRANT EXECUTE ON FUNCTION reclaim_expired_manuals TO service_role;
@@ -0,0 +1,151 @@
+-- =============================================
+-- TRANSACTIONAL EXTRACTION FINALIZE
+-- Sections are bulk-upserted in batches into manual_sections_staging under a
+-- per-save stage id; this function then checks the lease, moves the staged
+-- sections into manual_sections, writes the full content and flips the
+-- status in one transaction. A half-written manual is never marked
+-- 'extracted', and a worker that lost its lease never touches the live
+-- sections of a manual (e.g. one that is still 'extracted' on reprocess).
+-- =============================================
+
+CREATE TABLE IF NOT EXISTS manual_sections_staging (
+    stage_id UUID NOT NULL,
+    manual_id UUID NOT NULL REFERENCES vehicle_manuals(id) ON DELETE CASCADE,
+    section_path TEXT NOT NULL,
+    section_title TEXT NOT NULL,
+    depth INTEGER NOT NULL DEFAULT 0,
+    sort_order INTEGER NOT NULL DEFAULT 0,
+    content_markdown TEXT NOT NULL,
+    keywords TEXT[],
+    staged_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (stage_id, section_path)
+);
+
+CREATE INDEX IF NOT EXISTS idx_manual_sections_staging_manual
+ON manual_sections_staging (manual_id);
+
+ALTER TABLE manual_sections_staging ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE manual_sections_staging IS 'Sections written by an extraction worker, applied to manual_sections by finalize_manual_extraction';
+
+CREATE OR REPLACE FUNCTION finalize_manual_extraction(
+    p_manual_id UUID,
+    p_content JSONB,
+    p_stage_id UUID,
+    p_section_count INTEGER,
+    p_lease_token UUID DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_lease UUID;
+    v_sections INTEGER;
+BEGIN
+    -- Lock the manual and make sure this worker still holds it
+    SELECT vm.lease_token INTO v_lease
+    FROM vehicle_manuals vm
+    WHERE vm.id = p_manual_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Manual % not found', p_manual_id;
+    END IF;
+
+    IF p_lease_token IS NOT NULL AND v_lease IS DISTINCT FROM p_lease_token THEN
+        RAISE EXCEPTION 'Lease lost for manual % (reclaimed by another worker)', p_manual_id;
+    END IF;
+
+    -- Every batch must have landed before the manual counts as extracted
+    SELECT COUNT(*) INTO v_sections
+    FROM manual_sections_staging s
+    WHERE s.stage_id = p_stage_id
+      AND s.manual_id = p_manual_id;
+
+    IF v_sections <> p_section_count THEN
+        RAISE EXCEPTION 'Manual % has % of % sections written', p_manual_id, v_sections, p_section_count;
+    END IF;
+
+    -- Apply the staged sections
+    INSERT INTO manual_sections (
+        manual_id, section_path, section_title, depth, sort_order, content_markdown, keywords
+    )
+    SELECT s.manual_id, s.section_path, s.section_title, s.depth, s.sort_order, s.content_markdown, s.keywords
+    FROM manual_sections_staging s
+    WHERE s.stage_id = p_stage_id
+      AND s.manual_id = p_manual_id
+    ORDER BY s.section_path
+    ON CONFLICT (manual_id, section_path) DO UPDATE SET
+        section_title = EXCLUDED.section_title,
+        depth = EXCLUDED.depth,
+        sort_order = EXCLUDED.sort_order,
+        content_markdown = EXCLUDED.content_markdown,
+        keywords = EXCLUDED.keywords;
+
+    -- Drop sections left over from a previous extraction
+    DELETE FROM manual_sections ms
+    WHERE ms.manual_id = p_manual_id
+      AND NOT EXISTS (
+          SELECT 1
+          FROM manual_sections_staging s
+          WHERE s.stage_id = p_stage_id
+            AND s.section_path = ms.section_path
+      );
+
+    -- Applied, plus any stages left by workers that lost this manual's lease
+    DELETE FROM manual_sections_staging s
+    WHERE s.manual_id = p_manual_id;
+
+    -- Upsert full content
+    INSERT INTO manual_content (
+        manual_id,
+        content_markdown,
+        table_of_contents,
+        total_word_count,
+        total_char_count,
+        total_token_count,
+        total_pages,
+        extraction_method,
+        extraction_quality,
+        extracted_at
+    )
+    VALUES (
+        p_manual_id,
+        p_content->>'content_markdown',
+        p_content->'table_of_contents',
+        (p_content->>'total_word_count')::INTEGER,
+        (p_content->>'total_char_count')::INTEGER,
+        (p_content->>'total_token_count')::INTEGER,
+        (p_content->>'total_pages')::INTEGER,
+        p_content->>'extraction_method',
+        (p_content->>'extraction_quality')::FLOAT,
+        NOW()
+    )
+    ON CONFLICT (manual_id) DO UPDATE SET
+        content_markdown = EXCLUDED.content_markdown,
+        table_of_contents = EXCLUDED.table_of_contents,
+        total_word_count = EXCLUDED.total_word_count,
+        total_char_count = EXCLUDED.total_char_count,
+        total_token_count = EXCLUDED.total_token_count,
+        total_pages = EXCLUDED.total_pages,
+        extraction_method = EXCLUDED.extraction_method,
+        extraction_quality = EXCLUDED.extraction_quality,
+        extracted_at = EXCLUDED.extracted_at;
+
+    -- Mark as extracted (clears the lease via vehicle_manuals_clear_lease)
+    UPDATE vehicle_manuals
+    SET content_status = 'extracted',
+        content_extracted_at = NOW(),
+        error_message = NULL
+    WHERE id = p_manual_id;
+
+    RETURN v_sections;
+END;
+$$;
+
+COMMENT ON FUNCTION finalize_manual_extraction IS 'Atomically apply staged sections, save manual content, prune stale sections and mark the manual extracted.';
+
+REVOKE ALL ON manual_sections_staging FROM PUBLIC, anon, authenticated;
+GRANT ALL ON manual_sections_staging TO service_role;
+REVOKE EXECUTE ON FUNCTION finalize_manual_extraction FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION finalize_manual_extraction TO service_role;
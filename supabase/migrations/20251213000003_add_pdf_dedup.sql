@@ -0,0 +1,160 @@
+-- =============================================
+-- PDF CONTENT DEDUPLICATION
+-- Manuals that share a PDF (same URL or same SHA-256) are extracted once;
+-- the result is fanned out to every row that references the file
+-- =============================================
+
+-- 1. Content hash of the PDF bytes, filled in by workers after download
+ALTER TABLE vehicle_manuals ADD COLUMN IF NOT EXISTS pdf_sha256 TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_vehicle_manuals_pdf_sha256
+ON vehicle_manuals(pdf_sha256)
+WHERE pdf_sha256 IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_vehicle_manuals_pdf_url
+ON vehicle_manuals(pdf_url)
+WHERE pdf_url IS NOT NULL;
+
+-- 2. Claims hand out one manual per PDF and skip PDFs already being extracted;
+-- the remaining rows are filled in by claim_manual_duplicates after extraction
+DROP FUNCTION IF EXISTS claim_pending_manuals(INTEGER, TEXT, INTEGER, TEXT[], UUID[]);
+
+CREATE OR REPLACE FUNCTION claim_pending_manuals(
+    p_limit INTEGER DEFAULT 1,
+    p_worker TEXT DEFAULT NULL,
+    p_lease_seconds INTEGER DEFAULT 300,
+    p_statuses TEXT[] DEFAULT ARRAY['pending'],
+    p_exclude_ids UUID[] DEFAULT ARRAY[]::UUID[]
+)
+RETURNS TABLE (
+    id UUID,
+    year INTEGER,
+    make TEXT,
+    model TEXT,
+    variant TEXT,
+    pdf_url TEXT,
+    pdf_storage_path TEXT,
+    pdf_sha256 TEXT,
+    lease_token UUID,
+    lease_expires_at TIMESTAMPTZ
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_token UUID := gen_random_uuid();
+BEGIN
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT vm.id
+        FROM vehicle_manuals vm
+        WHERE vm.id IN (
+                -- One representative per distinct PDF
+                SELECT DISTINCT ON (COALESCE(d.pdf_sha256, d.pdf_url, d.id::TEXT)) d.id
+                FROM vehicle_manuals d
+                WHERE d.content_status = ANY(p_statuses)
+                  AND NOT (d.id = ANY(p_exclude_ids))
+                ORDER BY COALESCE(d.pdf_sha256, d.pdf_url, d.id::TEXT), d.year DESC, d.id
+            )
+          AND vm.content_status = ANY(p_statuses)
+          AND NOT EXISTS (
+              SELECT 1
+              FROM vehicle_manuals s
+              WHERE s.content_status = 'extracting'
+                AND s.id <> vm.id
+                AND (s.pdf_url = vm.pdf_url OR s.pdf_sha256 = vm.pdf_sha256)
+          )
+        ORDER BY vm.year DESC, vm.id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE vehicle_manuals vm
+    SET content_status = 'extracting',
+        lease_token = v_token,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        claimed_by = p_worker,
+        error_message = NULL
+    FROM candidates c
+    WHERE vm.id = c.id
+    RETURNING
+        vm.id,
+        vm.year,
+        vm.make,
+        vm.model,
+        vm.variant,
+        vm.pdf_url,
+        vm.pdf_storage_path,
+        vm.pdf_sha256,
+        vm.lease_token,
+        vm.lease_expires_at;
+END;
+$$;
+
+COMMENT ON FUNCTION claim_pending_manuals IS 'Atomically claim manuals for extraction (one per distinct PDF) under a lease.';
+
+-- 3. Record a manual's PDF hash and claim every other unextracted row sharing the PDF
+-- Siblings are matched by URL or by hash; they inherit the hash and get their own lease
+CREATE OR REPLACE FUNCTION claim_manual_duplicates(
+    p_manual_id UUID,
+    p_pdf_sha256 TEXT,
+    p_worker TEXT DEFAULT NULL,
+    p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS TABLE (
+    id UUID,
+    year INTEGER,
+    make TEXT,
+    model TEXT,
+    lease_token UUID
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_token UUID := gen_random_uuid();
+    v_pdf_url TEXT;
+BEGIN
+    UPDATE vehicle_manuals vm
+    SET pdf_sha256 = p_pdf_sha256
+    WHERE vm.id = p_manual_id
+    RETURNING vm.pdf_url INTO v_pdf_url;
+
+    -- Rows at the same URL have the same bytes, whatever their status
+    UPDATE vehicle_manuals vm
+    SET pdf_sha256 = p_pdf_sha256
+    WHERE vm.pdf_url = v_pdf_url
+      AND vm.pdf_sha256 IS DISTINCT FROM p_pdf_sha256;
+
+    RETURN QUERY
+    WITH siblings AS (
+        SELECT vm.id
+        FROM vehicle_manuals vm
+        WHERE vm.id <> p_manual_id
+          AND vm.pdf_sha256 = p_pdf_sha256
+          AND vm.content_status IN ('pending', 'failed')
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE vehicle_manuals vm
+    SET content_status = 'extracting',
+        lease_token = v_token,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        claimed_by = p_worker,
+        error_message = NULL
+    FROM siblings s
+    WHERE vm.id = s.id
+    RETURNING
+        vm.id,
+        vm.year,
+        vm.make,
+        vm.model,
+        vm.lease_token;
+END;
+$$;
+
+COMMENT ON FUNCTION claim_manual_duplicates IS 'Record a PDF hash and claim unextracted manuals that share the same PDF.';
+
+-- 4. Service role only
+REVOKE EXECUTE ON FUNCTION claim_pending_manuals FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION claim_manual_duplicates FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_pending_manuals TO service_role;
+GRANT EXECUTE ON FUNCTION claim_manual_duplicates TO service_role;
@@ -0,0 +1,25 @@
+-- =============================================
+-- HASH-KEYED PDF STORAGE
+-- Importers store each unique PDF once at pdf/{sha[:2]}/{sha}.pdf and point
+-- every vehicle_manuals row that uses it at the shared object
+-- =============================================
+
+-- Importers look up an already-stored copy by source URL before downloading
+CREATE INDEX IF NOT EXISTS idx_vehicle_manuals_source_url
+ON vehicle_manuals(source_url);
+
+-- Storage objects referenced by more than one manual
+CREATE OR REPLACE VIEW shared_pdf_objects AS
+SELECT
+    pdf_sha256,
+    MIN(pdf_storage_path) AS pdf_storage_path,
+    COUNT(*) AS manuals,
+    MAX(pdf_size_bytes) AS pdf_size_bytes,
+    (COUNT(*) - 1) * MAX(pdf_size_bytes) AS bytes_saved
+FROM vehicle_manuals
+WHERE pdf_sha256 IS NOT NULL
+GROUP BY pdf_sha256
+HAVING COUNT(*) > 1;
+
+REVOKE ALL ON shared_pdf_objects FROM PUBLIC, anon, authenticated;
+GRANT SELECT ON shared_pdf_objects TO service_role;
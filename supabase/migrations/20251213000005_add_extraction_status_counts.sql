@@ -0,0 +1,190 @@
+-- =============================================
+-- EXTRACTION STATUS COUNTERS
+-- status.py, extract-marker.py and monitor_extraction.py used to run one
+-- count='exact' query per content_status (plus one per extraction method)
+-- on every refresh. Counts are now kept in a small table maintained by
+-- statement-level triggers and read with a single RPC.
+-- =============================================
+
+-- 1. Counter table: kind = 'content_status' | 'extraction_method'
+CREATE TABLE IF NOT EXISTS extraction_status_counts (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, key)
+);
+
+ALTER TABLE extraction_status_counts ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE extraction_status_counts IS 'Row counts per vehicle_manuals.content_status and manual_content.extraction_method, maintained by triggers';
+
+-- 2. Trigger functions. Transition tables aggregate a whole statement (e.g. a
+-- batch claim) into one upsert per key; updates that don't change the
+-- counted column net to zero and write nothing. Keys are upserted in
+-- (kind, key) order so concurrent statements lock counter rows in the same
+-- order and can't deadlock.
+CREATE OR REPLACE FUNCTION track_content_status_counts()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO extraction_status_counts (kind, key, count)
+        SELECT 'content_status' AS kind, COALESCE(content_status, 'none') AS key, COUNT(*)
+        FROM new_rows
+        GROUP BY 2
+        ORDER BY kind, key
+        ON CONFLICT (kind, key) DO UPDATE SET count = extraction_status_counts.count + EXCLUDED.count;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO extraction_status_counts (kind, key, count)
+        SELECT 'content_status' AS kind, COALESCE(content_status, 'none') AS key, -COUNT(*)
+        FROM old_rows
+        GROUP BY 2
+        ORDER BY kind, key
+        ON CONFLICT (kind, key) DO UPDATE SET count = extraction_status_counts.count + EXCLUDED.count;
+    ELSE
+        INSERT INTO extraction_status_counts (kind, key, count)
+        SELECT 'content_status' AS kind, d.key, SUM(d.delta)
+        FROM (
+            SELECT COALESCE(content_status, 'none') AS key, 1 AS delta FROM new_rows
+            UNION ALL
+            SELECT COALESCE(content_status, 'none'), -1 FROM old_rows
+        ) d
+        GROUP BY d.key
+        HAVING SUM(d.delta) <> 0
+        ORDER BY kind, d.key
+        ON CONFLICT (kind, key) DO UPDATE SET count = extraction_status_counts.count + EXCLUDED.count;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION track_extraction_method_counts()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO extraction_status_counts (kind, key, count)
+        SELECT 'extraction_method' AS kind, COALESCE(extraction_method, 'unknown') AS key, COUNT(*)
+        FROM new_rows
+        GROUP BY 2
+        ORDER BY kind, key
+        ON CONFLICT (kind, key) DO UPDATE SET count = extraction_status_counts.count + EXCLUDED.count;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO extraction_status_counts (kind, key, count)
+        SELECT 'extraction_method' AS kind, COALESCE(extraction_method, 'unknown') AS key, -COUNT(*)
+        FROM old_rows
+        GROUP BY 2
+        ORDER BY kind, key
+        ON CONFLICT (kind, key) DO UPDATE SET count = extraction_status_counts.count + EXCLUDED.count;
+    ELSE
+        INSERT INTO extraction_status_counts (kind, key, count)
+        SELECT 'extraction_method' AS kind, d.key, SUM(d.delta)
+        FROM (
+            SELECT COALESCE(extraction_method, 'unknown') AS key, 1 AS delta FROM new_rows
+            UNION ALL
+            SELECT COALESCE(extraction_method, 'unknown'), -1 FROM old_rows
+        ) d
+        GROUP BY d.key
+        HAVING SUM(d.delta) <> 0
+        ORDER BY kind, d.key
+        ON CONFLICT (kind, key) DO UPDATE SET count = extraction_status_counts.count + EXCLUDED.count;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Transition tables can't be combined with multiple events or column lists,
+-- so each event gets its own trigger
+DROP TRIGGER IF EXISTS vehicle_manuals_status_counts_insert ON vehicle_manuals;
+CREATE TRIGGER vehicle_manuals_status_counts_insert
+    AFTER INSERT ON vehicle_manuals
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_content_status_counts();
+
+DROP TRIGGER IF EXISTS vehicle_manuals_status_counts_update ON vehicle_manuals;
+CREATE TRIGGER vehicle_manuals_status_counts_update
+    AFTER UPDATE ON vehicle_manuals
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_content_status_counts();
+
+DROP TRIGGER IF EXISTS vehicle_manuals_status_counts_delete ON vehicle_manuals;
+CREATE TRIGGER vehicle_manuals_status_counts_delete
+    AFTER DELETE ON vehicle_manuals
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_content_status_counts();
+
+DROP TRIGGER IF EXISTS manual_content_method_counts_insert ON manual_content;
+CREATE TRIGGER manual_content_method_counts_insert
+    AFTER INSERT ON manual_content
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_extraction_method_counts();
+
+DROP TRIGGER IF EXISTS manual_content_method_counts_update ON manual_content;
+CREATE TRIGGER manual_content_method_counts_update
+    AFTER UPDATE ON manual_content
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_extraction_method_counts();
+
+DROP TRIGGER IF EXISTS manual_content_method_counts_delete ON manual_content;
+CREATE TRIGGER manual_content_method_counts_delete
+    AFTER DELETE ON manual_content
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION track_extraction_method_counts();
+
+-- 3. Full recount (initial seed, and repair if counts are ever in doubt)
+CREATE OR REPLACE FUNCTION refresh_extraction_status_counts()
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    -- Block writers while recounting so no trigger delta is lost or doubled
+    LOCK TABLE vehicle_manuals, manual_content IN SHARE ROW EXCLUSIVE MODE;
+    LOCK TABLE extraction_status_counts IN EXCLUSIVE MODE;
+
+    DELETE FROM extraction_status_counts;
+
+    INSERT INTO extraction_status_counts (kind, key, count)
+    SELECT 'content_status', COALESCE(content_status, 'none'), COUNT(*)
+    FROM vehicle_manuals
+    GROUP BY 2;
+
+    INSERT INTO extraction_status_counts (kind, key, count)
+    SELECT 'extraction_method', COALESCE(extraction_method, 'unknown'), COUNT(*)
+    FROM manual_content
+    GROUP BY 2;
+END;
+$$;
+
+SELECT refresh_extraction_status_counts();
+
+-- 4. Every status and method count in one call:
+-- {"content_status": {"pending": n, ...}, "extraction_method": {...}, "total": n}
+CREATE OR REPLACE FUNCTION get_extraction_status()
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    SELECT jsonb_build_object(
+        'content_status', COALESCE(
+            jsonb_object_agg(key, count) FILTER (WHERE kind = 'content_status' AND count <> 0), '{}'::jsonb),
+        'extraction_method', COALESCE(
+            jsonb_object_agg(key, count) FILTER (WHERE kind = 'extraction_method' AND count <> 0), '{}'::jsonb),
+        'total', COALESCE(SUM(count) FILTER (WHERE kind = 'content_status'), 0)
+    )
+    FROM extraction_status_counts;
+$$;
+
+REVOKE EXECUTE ON FUNCTION get_extraction_status() FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION refresh_extraction_status_counts() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_extraction_status() TO service_role;
+GRANT EXECUTE ON FUNCTION refresh_extraction_status_counts() TO service_role;
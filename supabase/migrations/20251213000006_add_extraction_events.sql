@@ -0,0 +1,108 @@
+-- =============================================
+-- EXTRACTION EVENTS
+-- status.py used to estimate speed by differencing status counts polled
+-- every 30 seconds, so it showed nothing for the first minutes and swung
+-- with every batch. Workers now append one event per manual per stage
+-- (telemetry.py) and get_extraction_throughput() derives real throughput
+-- and latency percentiles per stage and per worker from them.
+-- =============================================
+
+-- 1. Append-only event log
+CREATE TABLE IF NOT EXISTS extraction_events (
+    id BIGSERIAL PRIMARY KEY,
+    occurred_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    worker TEXT NOT NULL,
+    manual_id UUID,
+    event TEXT NOT NULL CHECK (event IN ('claim', 'download', 'extract', 'upload', 'failed')),
+    stage TEXT,                 -- 'failed' events: the stage that failed
+    seconds DOUBLE PRECISION,   -- time spent in the stage
+    bytes BIGINT,               -- download: bytes fetched
+    pages INTEGER,              -- extract: pages converted
+    extraction_method TEXT,
+    error TEXT
+);
+
+-- No FK to vehicle_manuals: inserts stay cheap and events outlive deleted manuals
+CREATE INDEX IF NOT EXISTS idx_extraction_events_occurred_at ON extraction_events (occurred_at);
+CREATE INDEX IF NOT EXISTS idx_extraction_events_manual ON extraction_events (manual_id);
+
+ALTER TABLE extraction_events ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE extraction_events IS 'Per-manual, per-stage extraction events emitted by workers (telemetry.py)';
+
+-- 2. Throughput and latency over the last p_window_minutes.
+-- One row per event type (worker NULL) plus one per event type and worker.
+-- Rates are measured from the first event in the window, so a fleet that
+-- just started reports real numbers immediately instead of diluting them
+-- over the whole window.
+CREATE OR REPLACE FUNCTION get_extraction_throughput(p_window_minutes INTEGER DEFAULT 15)
+RETURNS TABLE (
+    event TEXT,
+    worker TEXT,
+    events BIGINT,
+    per_hour DOUBLE PRECISION,
+    p50_seconds DOUBLE PRECISION,
+    p95_seconds DOUBLE PRECISION,
+    bytes_per_sec DOUBLE PRECISION,
+    pages_per_sec DOUBLE PRECISION,
+    last_at TIMESTAMPTZ
+)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    SELECT
+        e.event,
+        e.worker,
+        COUNT(*),
+        COUNT(*) * 3600.0 / GREATEST(EXTRACT(EPOCH FROM NOW() - MIN(e.occurred_at)), 60),
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY e.seconds),
+        percentile_cont(0.95) WITHIN GROUP (ORDER BY e.seconds),
+        SUM(e.bytes) / NULLIF(SUM(e.seconds) FILTER (WHERE e.bytes IS NOT NULL), 0),
+        SUM(e.pages) / NULLIF(SUM(e.seconds) FILTER (WHERE e.pages IS NOT NULL), 0),
+        MAX(e.occurred_at)
+    FROM extraction_events e
+    WHERE e.occurred_at > NOW() - make_interval(mins => p_window_minutes)
+    GROUP BY GROUPING SETS ((e.event), (e.event, e.worker))
+    ORDER BY e.event, e.worker NULLS FIRST;
+$$;
+
+-- 3. Recent failure reasons, most frequent first
+CREATE OR REPLACE FUNCTION get_extraction_failures(p_window_minutes INTEGER DEFAULT 60, p_limit INTEGER DEFAULT 5)
+RETURNS TABLE (stage TEXT, error TEXT, failures BIGINT, last_at TIMESTAMPTZ)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    SELECT e.stage, LEFT(e.error, 200), COUNT(*), MAX(e.occurred_at)
+    FROM extraction_events e
+    WHERE e.event = 'failed'
+      AND e.occurred_at > NOW() - make_interval(mins => p_window_minutes)
+    GROUP BY 1, 2
+    ORDER BY 3 DESC, 4 DESC
+    LIMIT p_limit;
+$$;
+
+-- 4. Retention (monitor_extraction.py runs this hourly)
+CREATE OR REPLACE FUNCTION prune_extraction_events(p_keep_days INTEGER DEFAULT 30)
+RETURNS BIGINT
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    WITH deleted AS (
+        DELETE FROM extraction_events
+        WHERE occurred_at < NOW() - make_interval(days => p_keep_days)
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM deleted;
+$$;
+
+REVOKE EXECUTE ON FUNCTION get_extraction_throughput(INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION get_extraction_failures(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION prune_extraction_events(INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_extraction_throughput(INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION get_extraction_failures(INTEGER, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION prune_extraction_events(INTEGER) TO service_role;
@@ -0,0 +1,135 @@
+-- =============================================
+-- MANUAL QUALITY AUDIT
+-- quality-test.py used to list extracted manuals with one capped select,
+-- then fetch manual_content and every manual_sections row (only to count
+-- them) per manual, in series, and print results that were thrown away.
+-- The audit now pages through manual_content by manual_id, gets section
+-- counts from an aggregate, and stores one score per manual and extraction
+-- method in manual_quality. Content is only sent for manuals whose
+-- content hash differs from the one last scored.
+-- =============================================
+
+-- 1. Content hash, maintained by Postgres (rewrites manual_content once)
+ALTER TABLE manual_content
+    ADD COLUMN IF NOT EXISTS content_hash TEXT GENERATED ALWAYS AS (md5(content_markdown)) STORED;
+
+COMMENT ON COLUMN manual_content.content_hash IS 'md5 of content_markdown; quality audits skip manuals whose hash is unchanged';
+
+-- 2. Latest quality score per manual and extraction method
+CREATE TABLE IF NOT EXISTS manual_quality (
+    manual_id UUID NOT NULL REFERENCES vehicle_manuals(id) ON DELETE CASCADE,
+    extraction_method TEXT NOT NULL,
+    content_hash TEXT NOT NULL,         -- manual_content.content_hash that was scored
+    score INTEGER NOT NULL,
+    passed BOOLEAN NOT NULL,
+    issues JSONB NOT NULL DEFAULT '[]'::jsonb,
+    metrics JSONB NOT NULL DEFAULT '{}'::jsonb,     -- content_length, counts and ratios
+    problem_sections JSONB NOT NULL DEFAULT '[]'::jsonb,  -- worst section_scores
+    problem_pages INTEGER[] NOT NULL DEFAULT '{}',
+    scored_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (manual_id, extraction_method)
+);
+
+CREATE INDEX IF NOT EXISTS idx_manual_quality_failed ON manual_quality (score) WHERE NOT passed;
+
+ALTER TABLE manual_quality ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE manual_quality IS 'Extraction quality scores from quality-test.py --audit (quality.evaluate_quality)';
+
+-- 3. One page of the audit, keyset-paginated on manual_id.
+-- Every extracted manual in the page is returned so the caller can advance
+-- the cursor, but content_markdown (and section_count) only for manuals
+-- that have changed since they were last scored, or all with p_force.
+CREATE OR REPLACE FUNCTION get_quality_audit_page(
+    p_after UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 25,
+    p_method TEXT DEFAULT NULL,
+    p_force BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE (
+    manual_id UUID,
+    year INTEGER,
+    make TEXT,
+    model TEXT,
+    extraction_method TEXT,
+    content_hash TEXT,
+    changed BOOLEAN,
+    section_count BIGINT,
+    content_markdown TEXT
+)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    SELECT
+        page.manual_id,
+        page.year,
+        page.make,
+        page.model,
+        page.extraction_method,
+        page.content_hash,
+        page.changed,
+        CASE WHEN page.changed OR p_force THEN
+            (SELECT COUNT(*) FROM manual_sections s WHERE s.manual_id = page.manual_id)
+        END,
+        CASE WHEN page.changed OR p_force THEN
+            (SELECT c.content_markdown FROM manual_content c WHERE c.manual_id = page.manual_id)
+        END
+    FROM (
+        SELECT
+            c.manual_id,
+            m.year,
+            m.make,
+            m.model,
+            COALESCE(c.extraction_method, 'unknown') AS extraction_method,
+            c.content_hash,
+            q.content_hash IS DISTINCT FROM c.content_hash AS changed
+        FROM manual_content c
+        JOIN vehicle_manuals m ON m.id = c.manual_id
+        LEFT JOIN manual_quality q
+            ON q.manual_id = c.manual_id
+           AND q.extraction_method = COALESCE(c.extraction_method, 'unknown')
+        WHERE (p_after IS NULL OR c.manual_id > p_after)
+          AND m.content_status = 'extracted'
+          AND (p_method IS NULL OR c.extraction_method = p_method)
+        ORDER BY c.manual_id
+        LIMIT p_limit
+    ) page
+    ORDER BY page.manual_id;
+$$;
+
+-- 4. Pass rates per extraction method, for the scores that are current
+-- (the method and hash still match manual_content)
+CREATE OR REPLACE FUNCTION get_quality_summary()
+RETURNS TABLE (
+    extraction_method TEXT,
+    manuals BIGINT,
+    passed BIGINT,
+    avg_score DOUBLE PRECISION,
+    last_scored_at TIMESTAMPTZ
+)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    SELECT
+        q.extraction_method,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE q.passed),
+        AVG(q.score)::DOUBLE PRECISION,
+        MAX(q.scored_at)
+    FROM manual_quality q
+    JOIN manual_content c
+        ON c.manual_id = q.manual_id
+       AND COALESCE(c.extraction_method, 'unknown') = q.extraction_method
+       AND c.content_hash = q.content_hash
+    GROUP BY q.extraction_method
+    ORDER BY q.extraction_method;
+$$;
+
+REVOKE EXECUTE ON FUNCTION get_quality_audit_page(UUID, INTEGER, TEXT, BOOLEAN) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION get_quality_summary() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_quality_audit_page(UUID, INTEGER, TEXT, BOOLEAN) TO service_role;
+GRANT EXECUTE ON FUNCTION get_quality_summary() TO service_role;
@@ -0,0 +1,276 @@
+-- =============================================
+-- QUALITY-DRIVEN EXTRACTION PRIORITY
+-- quality-test.py --fix used to flip failed manuals back to 'pending' with
+-- no record of why, and workers claimed pending manuals newest-year first.
+-- Requeued manuals now keep the reason, and the queue is ordered by a
+-- priority that puts the worst-scored, most-requested vehicles first.
+-- Each manual also carries the extractor that has scored best for its make
+-- (manual_quality history), and workers claim manuals routed to them first.
+-- =============================================
+
+-- 1. Queue columns
+ALTER TABLE vehicle_manuals
+ADD COLUMN IF NOT EXISTS extraction_priority DOUBLE PRECISION,
+ADD COLUMN IF NOT EXISTS preferred_extractor TEXT,
+ADD COLUMN IF NOT EXISTS requeue_reason TEXT,
+ADD COLUMN IF NOT EXISTS requeued_at TIMESTAMPTZ;
+
+COMMENT ON COLUMN vehicle_manuals.extraction_priority IS 'Claim order for pending manuals, highest first (see extraction_priority())';
+COMMENT ON COLUMN vehicle_manuals.preferred_extractor IS 'Extractor family (marker, tiered, docling) with the best historic quality for this make';
+COMMENT ON COLUMN vehicle_manuals.requeue_reason IS 'Why the manual was sent back for re-extraction (quality score and issues)';
+
+-- 2. Extractor family of an extraction_method ('marker-pdf-local' -> 'marker')
+CREATE OR REPLACE FUNCTION extractor_family(p_method TEXT)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE
+        WHEN p_method LIKE 'tiered%' THEN 'tiered'
+        WHEN p_method LIKE 'marker%' THEN 'marker'
+        WHEN p_method LIKE 'docling%' THEN 'docling'
+        ELSE p_method
+    END;
+$$;
+
+-- 3. Priority: the quality there is to gain (100 - score; never scored
+-- counts as 0) weighted by how often the vehicle is looked up. A manual
+-- nobody requests still beats a popular one that already scores well.
+CREATE OR REPLACE FUNCTION extraction_priority(p_score INTEGER, p_requests BIGINT)
+RETURNS DOUBLE PRECISION
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT (100 - LEAST(GREATEST(COALESCE(p_score, 0), 0), 100))::DOUBLE PRECISION
+        * (1 + ln(1 + GREATEST(COALESCE(p_requests, 0), 0)));
+$$;
+
+-- New manuals start as never scored and never requested; the monitor's
+-- periodic refresh_extraction_priorities() adds their popularity
+ALTER TABLE vehicle_manuals
+ALTER COLUMN extraction_priority SET DEFAULT extraction_priority(NULL, 0);
+
+-- 4. Current quality per manual: the score of the content it has now
+CREATE OR REPLACE VIEW manual_quality_current AS
+SELECT
+    q.manual_id,
+    q.extraction_method,
+    extractor_family(q.extraction_method) AS extractor,
+    q.score,
+    q.passed,
+    q.issues,
+    q.metrics,
+    q.scored_at
+FROM manual_quality q
+JOIN manual_content c
+    ON c.manual_id = q.manual_id
+   AND COALESCE(c.extraction_method, 'unknown') = q.extraction_method
+   AND c.content_hash = q.content_hash;
+
+-- Historic quality per make and extractor (every method ever scored, not only current content)
+CREATE OR REPLACE VIEW extractor_quality_by_make AS
+SELECT
+    vm.make,
+    extractor_family(q.extraction_method) AS extractor,
+    COUNT(*) AS manuals,
+    AVG(q.score)::DOUBLE PRECISION AS avg_score,
+    AVG(q.passed::INTEGER)::DOUBLE PRECISION AS pass_rate
+FROM manual_quality q
+JOIN vehicle_manuals vm ON vm.id = q.manual_id
+GROUP BY vm.make, extractor_family(q.extraction_method);
+
+REVOKE ALL ON manual_quality_current, extractor_quality_by_make FROM PUBLIC, anon, authenticated;
+GRANT SELECT ON manual_quality_current, extractor_quality_by_make TO service_role;
+
+-- 5. Recompute priority and routing for queued manuals.
+-- Popularity is API lookups of the make/model over the last p_days
+-- (usage_logs.request_params); an extractor is preferred for a make once
+-- it has at least p_min_samples scores there. monitor_extraction.py runs
+-- this hourly so popularity and routing follow new lookups and scores.
+CREATE OR REPLACE FUNCTION refresh_extraction_priorities(
+    p_manual_ids UUID[] DEFAULT NULL,
+    p_days INTEGER DEFAULT 90,
+    p_min_samples INTEGER DEFAULT 5
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    WITH popularity AS (
+        SELECT lower(request_params->>'make') AS make,
+               lower(request_params->>'model') AS model,
+               COUNT(*) AS requests
+        FROM usage_logs
+        WHERE created_at > NOW() - make_interval(days => p_days)
+          AND request_params ? 'make'
+          AND request_params ? 'model'
+        GROUP BY 1, 2
+    ),
+    best_extractor AS (
+        SELECT DISTINCT ON (make) make, extractor
+        FROM extractor_quality_by_make
+        WHERE manuals >= p_min_samples
+        ORDER BY make, avg_score DESC, manuals DESC
+    ),
+    scores AS (
+        SELECT manual_id, MIN(score) AS score
+        FROM manual_quality_current
+        GROUP BY manual_id
+    )
+    UPDATE vehicle_manuals vm
+    SET extraction_priority = extraction_priority(s.score, p.requests),
+        preferred_extractor = b.extractor
+    FROM vehicle_manuals v
+    LEFT JOIN scores s ON s.manual_id = v.id
+    LEFT JOIN popularity p ON p.make = lower(v.make) AND p.model = lower(v.model)
+    LEFT JOIN best_extractor b ON b.make = v.make
+    WHERE vm.id = v.id
+      AND v.content_status IN ('pending', 'failed')
+      AND (p_manual_ids IS NULL OR v.id = ANY(p_manual_ids));
+
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$;
+
+-- 6. Send manuals back for re-extraction with a reason, then prioritize them.
+-- p_requeues: [{"manual_id": "...", "reason": "..."}]. Manuals being
+-- extracted right now are left alone.
+CREATE OR REPLACE FUNCTION requeue_manuals(p_requeues JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_ids UUID[];
+BEGIN
+    WITH requeued AS (
+        UPDATE vehicle_manuals vm
+        SET content_status = 'pending',
+            requeue_reason = r.reason,
+            requeued_at = NOW()
+        FROM jsonb_to_recordset(p_requeues) AS r(manual_id UUID, reason TEXT)
+        WHERE vm.id = r.manual_id
+          AND vm.content_status IS DISTINCT FROM 'extracting'
+        RETURNING vm.id
+    )
+    SELECT array_agg(id) INTO v_ids FROM requeued;
+
+    IF v_ids IS NULL THEN
+        RETURN 0;
+    END IF;
+    PERFORM refresh_extraction_priorities(v_ids);
+    RETURN cardinality(v_ids);
+END;
+$$;
+
+-- 7. Claim in priority order. p_extractors names the extractor families this
+-- worker runs; manuals routed to them come first, and manuals routed
+-- elsewhere are only handed out when nothing else is queued, so a missing
+-- worker type never starves the queue. Picking one row per PDF reads every
+-- queued row anyway (over the content_status index), so no priority index:
+-- the leading per-worker routing flag couldn't use one.
+DROP FUNCTION IF EXISTS claim_pending_manuals(INTEGER, TEXT, INTEGER, TEXT[], UUID[]);
+
+CREATE OR REPLACE FUNCTION claim_pending_manuals(
+    p_limit INTEGER DEFAULT 1,
+    p_worker TEXT DEFAULT NULL,
+    p_lease_seconds INTEGER DEFAULT 300,
+    p_statuses TEXT[] DEFAULT ARRAY['pending'],
+    p_exclude_ids UUID[] DEFAULT ARRAY[]::UUID[],
+    p_extractors TEXT[] DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    year INTEGER,
+    make TEXT,
+    model TEXT,
+    variant TEXT,
+    pdf_url TEXT,
+    pdf_storage_path TEXT,
+    pdf_sha256 TEXT,
+    preferred_extractor TEXT,
+    requeue_reason TEXT,
+    lease_token UUID,
+    lease_expires_at TIMESTAMPTZ
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_token UUID := gen_random_uuid();
+BEGIN
+    RETURN QUERY
+    WITH candidates AS (
+        SELECT vm.id
+        FROM vehicle_manuals vm
+        WHERE vm.id IN (
+                -- One representative per distinct PDF, its highest-priority row
+                SELECT DISTINCT ON (COALESCE(d.pdf_sha256, d.pdf_url, d.id::TEXT)) d.id
+                FROM vehicle_manuals d
+                WHERE d.content_status = ANY(p_statuses)
+                  AND NOT (d.id = ANY(p_exclude_ids))
+                ORDER BY COALESCE(d.pdf_sha256, d.pdf_url, d.id::TEXT),
+                         (p_extractors IS NULL OR d.preferred_extractor IS NULL
+                             OR d.preferred_extractor = ANY(p_extractors)) DESC,
+                         COALESCE(d.extraction_priority, extraction_priority(NULL, 0)) DESC,
+                         d.year DESC,
+                         d.id
+            )
+          AND vm.content_status = ANY(p_statuses)
+          AND NOT EXISTS (
+              SELECT 1
+              FROM vehicle_manuals s
+              WHERE s.content_status = 'extracting'
+                AND s.id <> vm.id
+                AND (s.pdf_url = vm.pdf_url OR s.pdf_sha256 = vm.pdf_sha256)
+          )
+        ORDER BY
+            (p_extractors IS NULL OR vm.preferred_extractor IS NULL
+                OR vm.preferred_extractor = ANY(p_extractors)) DESC,
+            COALESCE(vm.extraction_priority, extraction_priority(NULL, 0)) DESC,
+            vm.year DESC,
+            vm.id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE vehicle_manuals vm
+    SET content_status = 'extracting',
+        lease_token = v_token,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        claimed_by = p_worker,
+        error_message = NULL
+    FROM candidates c
+    WHERE vm.id = c.id
+    RETURNING
+        vm.id,
+        vm.year,
+        vm.make,
+        vm.model,
+        vm.variant,
+        vm.pdf_url,
+        vm.pdf_storage_path,
+        vm.pdf_sha256,
+        vm.preferred_extractor,
+        vm.requeue_reason,
+        vm.lease_token,
+        vm.lease_expires_at;
+END;
+$$;
+
+COMMENT ON FUNCTION claim_pending_manuals IS 'Atomically claim manuals for extraction (one per distinct PDF, highest priority first) under a lease.';
+COMMENT ON FUNCTION requeue_manuals IS 'Requeue manuals for re-extraction with a reason and recompute their priority.';
+
+SELECT refresh_extraction_priorities();
+
+REVOKE EXECUTE ON FUNCTION claim_pending_manuals FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION refresh_extraction_priorities FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION requeue_manuals FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_pending_manuals TO service_role;
+GRANT EXECUTE ON FUNCTION refresh_extraction_priorities TO service_role;
+GRANT EXECUTE ON FUNCTION requeue_manuals TO service_role;
@@ -0,0 +1,131 @@
+-- =============================================
+-- SEMANTIC SECTION SEARCH
+-- manual_sections.embedding was sized for OpenAI embeddings (1536) and
+-- never filled, so search_manual could only match literal substrings.
+-- Sections are now embedded with gte-small (384 dims), which runs on CPU
+-- in embed_sections.py and in the Edge Runtime (Supabase.ai) for queries,
+-- so neither side calls a paid API. Embeddings are cleared when a
+-- section's text changes and embed_sections.py picks up every NULL, so
+-- newly extracted and re-extracted manuals are embedded incrementally.
+-- =============================================
+
+-- 1. 384-dim embeddings (the column has never been written, so nothing is lost)
+DROP INDEX IF EXISTS idx_manual_sections_embedding;
+
+ALTER TABLE manual_sections
+    ALTER COLUMN embedding TYPE vector(384) USING NULL;
+
+COMMENT ON COLUMN manual_sections.embedding IS 'gte-small embedding of section_title + content_plain (normalized, cosine); NULL until embed_sections.py runs';
+
+-- 2. ANN index for corpus-wide search. HNSW needs no training data, so
+-- unlike ivfflat it stays accurate as sections are embedded over time.
+CREATE INDEX IF NOT EXISTS idx_manual_sections_embedding_hnsw
+    ON manual_sections USING hnsw (embedding vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+-- Work queue for embed_sections.py (keyset-paginated on id)
+CREATE INDEX IF NOT EXISTS idx_manual_sections_unembedded
+    ON manual_sections (id) WHERE embedding IS NULL;
+
+-- 3. Re-embed sections whose text changes (re-extraction upserts by section_path)
+CREATE OR REPLACE FUNCTION reset_section_embedding()
+RETURNS trigger AS $$
+BEGIN
+    IF NEW.section_title IS DISTINCT FROM OLD.section_title
+       OR NEW.content_markdown IS DISTINCT FROM OLD.content_markdown THEN
+        NEW.embedding := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS manual_sections_embedding_reset ON manual_sections;
+CREATE TRIGGER manual_sections_embedding_reset
+    BEFORE UPDATE OF section_title, content_markdown ON manual_sections
+    FOR EACH ROW EXECUTE FUNCTION reset_section_embedding();
+
+-- Embedding writes don't touch the text, so skip rebuilding search_vector for them
+DROP TRIGGER IF EXISTS manual_sections_search_update ON manual_sections;
+CREATE TRIGGER manual_sections_search_update
+    BEFORE INSERT OR UPDATE OF section_title, content_markdown, content_plain ON manual_sections
+    FOR EACH ROW EXECUTE FUNCTION update_manual_search_vector();
+
+-- 4. Bulk write from embed_sections.py.
+-- p_embeddings: [{"id": "...", "embedding": "[0.01, ...]"}]
+CREATE OR REPLACE FUNCTION set_section_embeddings(p_embeddings JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    UPDATE manual_sections ms
+    SET embedding = r.embedding::vector(384)
+    FROM jsonb_to_recordset(p_embeddings) AS r(id UUID, embedding TEXT)
+    WHERE ms.id = r.id;
+
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$;
+
+-- 5. Sections closest in meaning to a query embedding.
+-- Within one manual (a few hundred sections) an exact scan over the
+-- manual_id index is both faster and more accurate than filtering HNSW
+-- results; across all manuals (p_manual_id NULL) the HNSW index is used.
+CREATE OR REPLACE FUNCTION search_manual_semantic(
+    p_manual_id UUID,
+    p_query_embedding vector(384),
+    p_limit INTEGER DEFAULT 10,
+    p_min_similarity DOUBLE PRECISION DEFAULT 0
+)
+RETURNS TABLE (
+    id UUID,
+    manual_id UUID,
+    section_path TEXT,
+    section_title TEXT,
+    content_markdown TEXT,
+    token_count INTEGER,
+    similarity DOUBLE PRECISION
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+BEGIN
+    IF p_manual_id IS NOT NULL THEN
+        RETURN QUERY
+        WITH candidates AS MATERIALIZED (
+            SELECT ms.id, ms.manual_id, ms.section_path, ms.section_title,
+                   ms.content_markdown, ms.token_count, ms.embedding
+            FROM manual_sections ms
+            WHERE ms.manual_id = p_manual_id
+              AND ms.embedding IS NOT NULL
+        )
+        SELECT c.id, c.manual_id, c.section_path, c.section_title, c.content_markdown, c.token_count,
+               1 - (c.embedding <=> p_query_embedding) AS similarity
+        FROM candidates c
+        WHERE 1 - (c.embedding <=> p_query_embedding) >= p_min_similarity
+        ORDER BY c.embedding <=> p_query_embedding
+        LIMIT p_limit;
+    ELSE
+        RETURN QUERY
+        SELECT nearest.*
+        FROM (
+            SELECT ms.id, ms.manual_id, ms.section_path, ms.section_title, ms.content_markdown, ms.token_count,
+                   1 - (ms.embedding <=> p_query_embedding) AS similarity
+            FROM manual_sections ms
+            ORDER BY ms.embedding <=> p_query_embedding
+            LIMIT p_limit
+        ) nearest
+        WHERE nearest.similarity >= p_min_similarity;
+    END IF;
+END;
+$$;
+
+COMMENT ON FUNCTION search_manual_semantic IS 'Nearest manual sections to a gte-small query embedding (cosine), within one manual or across all.';
+
+REVOKE EXECUTE ON FUNCTION set_section_embeddings FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION set_section_embeddings TO service_role;
+GRANT EXECUTE ON FUNCTION search_manual_semantic TO anon, authenticated, service_role;
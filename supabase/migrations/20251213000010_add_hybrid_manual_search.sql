@@ -0,0 +1,85 @@
+-- =============================================
+-- HYBRID MANUAL SEARCH
+-- search_manual matched sections with ILIKE '%query%', which can't use the
+-- search_vector GIN index and scans every section of the manual, and
+-- search_manual_fulltext / search_manual_semantic each only see one kind
+-- of match. search_manual_hybrid runs both retrievals in the database and
+-- fuses them with reciprocal rank fusion (RRF): a section scores
+-- 1 / (k + rank) in each list it appears in, so sections both methods
+-- agree on rise to the top without having to calibrate ts_rank against
+-- cosine similarity. Results carry a ts_headline snippet with the query
+-- terms highlighted.
+-- =============================================
+
+CREATE OR REPLACE FUNCTION search_manual_hybrid(
+    p_manual_id UUID,
+    p_query TEXT,
+    p_query_embedding vector(384) DEFAULT NULL,  -- NULL: full-text only
+    p_limit INTEGER DEFAULT 5,
+    p_candidates INTEGER DEFAULT 40,             -- taken from each method before fusing
+    p_rrf_k INTEGER DEFAULT 60
+)
+RETURNS TABLE (
+    id UUID,
+    manual_id UUID,
+    section_path TEXT,
+    section_title TEXT,
+    content_markdown TEXT,
+    token_count INTEGER,
+    snippet TEXT,
+    fts_rank INTEGER,       -- position in the full-text list (NULL: not matched)
+    vector_rank INTEGER,    -- position in the semantic list (NULL: not matched)
+    score DOUBLE PRECISION
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH query AS (
+        SELECT websearch_to_tsquery('english', p_query) AS tsq
+    ),
+    fts AS (
+        SELECT ms.id,
+               row_number() OVER (ORDER BY ts_rank_cd(ms.search_vector, q.tsq) DESC, ms.id)::INTEGER AS rank
+        FROM manual_sections ms, query q
+        WHERE ms.search_vector @@ q.tsq
+          AND (p_manual_id IS NULL OR ms.manual_id = p_manual_id)
+        ORDER BY rank
+        LIMIT p_candidates
+    ),
+    semantic AS (
+        SELECT s.id,
+               row_number() OVER (ORDER BY s.similarity DESC, s.id)::INTEGER AS rank
+        FROM search_manual_semantic(p_manual_id, p_query_embedding, p_candidates) s
+        WHERE p_query_embedding IS NOT NULL
+    ),
+    fused AS (
+        SELECT COALESCE(f.id, v.id) AS id,
+               f.rank AS fts_rank,
+               v.rank AS vector_rank,
+               COALESCE(1.0 / (p_rrf_k + f.rank), 0) + COALESCE(1.0 / (p_rrf_k + v.rank), 0) AS score
+        FROM fts f
+        FULL OUTER JOIN semantic v ON v.id = f.id
+        ORDER BY score DESC, fts_rank NULLS LAST, vector_rank NULLS LAST
+        LIMIT p_limit
+    )
+    -- Headlines are the expensive part, so only for the rows returned
+    SELECT ms.id,
+           ms.manual_id,
+           ms.section_path,
+           ms.section_title,
+           ms.content_markdown,
+           ms.token_count,
+           ts_headline('english', COALESCE(ms.content_plain, ''), q.tsq,
+                       'StartSel=**, StopSel=**, MaxWords=35, MinWords=15, MaxFragments=2'),
+           fu.fts_rank,
+           fu.vector_rank,
+           fu.score::DOUBLE PRECISION
+    FROM fused fu
+    JOIN manual_sections ms ON ms.id = fu.id
+    CROSS JOIN query q
+    ORDER BY fu.score DESC, fu.fts_rank NULLS LAST, fu.vector_rank NULLS LAST;
+$$;
+
+COMMENT ON FUNCTION search_manual_hybrid IS 'Full-text + semantic section search fused with reciprocal rank fusion, with highlighted snippets.';
+
+GRANT EXECUTE ON FUNCTION search_manual_hybrid TO anon, authenticated, service_role;